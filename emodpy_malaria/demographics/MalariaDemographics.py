@@ -3,10 +3,39 @@ This module contains the classes and functions for creating demographics files
 for malaria simulations. For more information on |EMOD_s| demographics files,
 see :doc:`emod-malaria:software-demographics`. 
 """
+import copy
+import json
 import os
+import numpy as np
+import pandas as pd
 import emod_api.demographics.Demographics as Demog
 from emod_api.demographics import DemographicsTemplates as DT
 import emod_api.config.default_from_schema_no_validation as dfs
+from emodpy_malaria.demographics.spatial import NodeSpatialIndex
+from emodpy_malaria.demographics.streaming import write_demographics
+
+
+class _NodeList(list):
+    """
+    List of nodes that counts its changes, so that the node id index of
+    :py:class:`MalariaDemographics` is rebuilt only after nodes were added or removed.
+    """
+    version = 0
+
+
+def _counting(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.version += 1
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = name
+    return wrapper
+
+
+for _name in ["append", "extend", "insert", "remove", "pop", "clear", "__setitem__", "__delitem__", "__iadd__",
+              "__imul__"]:
+    setattr(_NodeList, _name, _counting(_name))
 
 
 class MalariaDemographics(Demog.Demographics):
@@ -42,6 +71,108 @@ class MalariaDemographics(Demog.Demographics):
         if include_biting_heterogeneity:
             self.set_risk_lowmedium()  # lognormal, default=1.6
 
+    @property
+    def nodes(self):
+        return self._node_list
+
+    @nodes.setter
+    def nodes(self, nodes):
+        self._node_list = _NodeList(nodes)
+        self._nodes_by_id = None
+        self._indexed_version = None
+        self._spatial_index = None
+        self._spatial_version = None
+
+    def _node_index(self, rebuild=False):
+        """
+            Dictionary node id -> node of the nodes and the default node, if any, rebuilt when nodes were added
+            to or removed from nodes.
+        """
+        if rebuild or self._nodes_by_id is None or self._indexed_version != self._node_list.version:
+            self._nodes_by_id = {node.id: node for node in self._all_nodes}
+            self._indexed_version = self._node_list.version
+        return self._nodes_by_id
+
+    def get_node_by_id(self, node_id):
+        """
+            Return the node with the given node id, using the node id index.
+
+            Args:
+                node_id: Id of the node.
+
+            Returns:
+                The Node object.
+        """
+        return self.get_nodes_by_id([node_id])[node_id]
+
+    def get_nodes_by_id(self, node_ids):
+        """
+            Return the nodes with the given node ids, using the node id index.
+
+            Args:
+                node_ids: List of node ids. None or 0 for the default node.
+
+            Returns:
+                Dictionary node id -> Node object, empty for an empty list.
+        """
+        if node_ids is None:
+            node_ids = [None]
+        node_ids = [0 if node_id is None else node_id for node_id in node_ids]
+        index = self._node_index()
+        # a node's id can change with its forced_id or coordinates, a stale entry rebuilds the index once
+        if any(node_id not in index or index[node_id].id != node_id for node_id in node_ids):
+            index = self._node_index(rebuild=True)
+        missing = [node_id for node_id in node_ids if node_id not in index]
+        if missing:
+            raise self.UnknownNodeException(f"The following node id(s) were requested but do not exist in this "
+                                            f"demographics object:\n{', '.join(str(node_id) for node_id in missing)}")
+        return {node_id: index[node_id] for node_id in node_ids}
+
+    def spatial_index(self, rebuild=False):
+        """
+            Return the spatial index over the nodes' latitudes and longitudes, see
+            :py:class:`emodpy_malaria.demographics.spatial.NodeSpatialIndex`. The index is built once and rebuilt
+            when nodes were added or removed.
+
+            Args:
+                rebuild: Rebuild the index, e.g. after node coordinates were changed.
+
+            Returns:
+                NodeSpatialIndex object.
+        """
+        if rebuild or self._spatial_index is None or self._spatial_version != self._node_list.version:
+            self._spatial_index = NodeSpatialIndex.from_nodes(self._node_list)
+            self._spatial_version = self._node_list.version
+        return self._spatial_index
+
+    def nodes_within(self, node_id, km, include_self=False):
+        """
+            Return the ids of the nodes within a great-circle distance of a node, e.g. to check which nodes an
+            fMDA with fmda_radius reaches.
+
+            Args:
+                node_id: Id of the center node.
+                km: Radius in kilometers.
+                include_self: Include node_id in the result.
+
+            Returns:
+                List of node ids sorted by distance.
+        """
+        return self.spatial_index().nodes_within(node_id, km, include_self).tolist()
+
+    def nearest_nodes(self, node_id, k):
+        """
+            Return the ids of the k nodes nearest to a node, not counting the node itself.
+
+            Args:
+                node_id: Id of the node.
+                k: Number of nodes.
+
+            Returns:
+                List of node ids sorted by distance.
+        """
+        return self.spatial_index().nearest(node_id, k)[0].tolist()
+
     def set_risk_lowmedium(self):
         """
             Set initial risk for low-medium transmission settings per: 
@@ -87,12 +218,73 @@ class MalariaDemographics(Demog.Demographics):
             lhm_dict.append(lhm.parameters)
             self.SetNodeDefaultFromTemplate({"LarvalHabitatMultiplier": lhm_dict}, setter_fn=None)
         else:
-            if self.get_node(node_id).node_attributes.larval_habitat_multiplier:
-                lhm_dict = self.get_node(node_id).node_attributes.larval_habitat_multiplier
+            node = self.get_node_by_id(node_id)
+            if node.node_attributes.larval_habitat_multiplier:
+                lhm_dict = node.node_attributes.larval_habitat_multiplier
             else:
                 lhm_dict = []
             lhm_dict.append(lhm.parameters)
-            self.get_node(node_id).node_attributes.larval_habitat_multiplier = lhm_dict
+            node.node_attributes.larval_habitat_multiplier = lhm_dict
+
+    def add_larval_habitat_multipliers(self, schema, multipliers):
+        """
+            Set the LarvalHabitatMultiplier of many nodes at once from a table with one row per node, habitat
+            and species. The list of multipliers of a node replaces the node's previous list.
+
+            When every node of the demographics gets a list, the most common list is written to Defaults and only
+            the nodes with a different list get their own LarvalHabitatMultiplier (a node's list replaces the
+            Defaults list in EMOD, it isn't merged with it).
+
+            Args:
+                schema: Path to schema.json.
+                multipliers: pandas DataFrame with the columns node_id, habitat, factor and, optionally, species
+                    (defaults to ALL_SPECIES).
+
+            Returns:
+                Nothing.
+
+        """
+        missing = {"node_id", "habitat", "factor"}.difference(multipliers.columns)
+        if missing:
+            raise ValueError(f"multipliers is missing the column(s) {sorted(missing)}.")
+        df = pd.DataFrame({"node_id": multipliers["node_id"].astype(int),
+                           "habitat": multipliers["habitat"].astype(str),
+                           "species": multipliers["species"].astype(str) if "species" in multipliers.columns
+                           else "ALL_SPECIES",
+                           "factor": multipliers["factor"].astype(float)}).reset_index(drop=True)
+
+        # one schema walk for the spec, the values are checked against its schema
+        lhm = dfs.schema_to_config_subnode(schema, ["idmTypes", "idmType:LarvalHabitatMultiplierSpec"])
+        spec_schema = lhm.parameters.schema
+        unknown = set(df["habitat"]).difference(spec_schema["Habitat"]["enum"])
+        if unknown:
+            raise ValueError(f"{sorted(unknown)} not in list of possible habitats {spec_schema['Habitat']['enum']}.")
+        if not df["factor"].between(spec_schema["Factor"]["min"], spec_schema["Factor"]["max"]).all():
+            raise ValueError(f"Factors must be between {spec_schema['Factor']['min']} and "
+                             f"{spec_schema['Factor']['max']}.")
+        lhm.parameters.finalize()
+        template = dict(lhm.parameters)
+
+        nodes_by_id = self.get_nodes_by_id(df["node_id"].unique().tolist())
+
+        # number the distinct specs and describe every node's list by the numbers of its specs
+        columns = ["habitat", "species", "factor"]
+        df["spec"] = df.groupby(columns, sort=False).ngroup()
+        specs = [dict(template, Habitat=habitat, Species=species, Factor=factor)
+                 for habitat, species, factor in df.drop_duplicates(columns)[columns].itertuples(index=False)]
+        node_lists = df.groupby("node_id", sort=False)["spec"].agg(tuple)
+
+        default_list = None
+        if len(node_lists) == len(self._node_index()):
+            default_list = node_lists.value_counts(sort=True).index[0]
+            self.SetNodeDefaultFromTemplate({"LarvalHabitatMultiplier": [dict(specs[spec]) for spec in default_list]},
+                                            setter_fn=None)
+        for node_id, spec_list in node_lists.items():
+            node = nodes_by_id[node_id]
+            if spec_list == default_list:
+                node.node_attributes.larval_habitat_multiplier = None
+            else:
+                node.node_attributes.larval_habitat_multiplier = [dict(specs[spec]) for spec in spec_list]
 
     def add_initial_vectors_per_species(self, init_vector_species, node_ids=None):
         """
@@ -112,8 +304,8 @@ class MalariaDemographics(Demog.Demographics):
             ivs_dict["InitialVectorsPerSpecies"] = init_vector_species
             self.SetNodeDefaultFromTemplate(ivs_dict, setter_fn=None)
         else:
-            for node_id in node_ids:
-                self.get_node(node_id).node_attributes.add_parameter("InitialVectorsPerSpecies", init_vector_species)
+            for node_id, node in self.get_nodes_by_id(list(node_ids)).items():
+                node.node_attributes.add_parameter("InitialVectorsPerSpecies", init_vector_species)
 
         # no implicits
 
@@ -121,33 +313,289 @@ class MalariaDemographics(Demog.Demographics):
         """
             Add initial vector species population to 'demographics' nodes from a csv file.
 
+            Nodes with identical species populations share one group. When the file covers all nodes and more
+            than half of them share their populations, these go to Defaults and only the other nodes get their
+            own InitialVectorsPerSpecies.
+
         Args:
-            csv_path: Path to CSV file with the initial vector species populations for each node.
+            csv_path: Path to CSV file with a node_id column and one column per species with the initial vector
+                species populations for each node.
 
         Returns:
             N/A.
 
         """
-        import csv
         if not os.path.exists(csv_path):
             raise ValueError(f"File not found at {csv_path}.")
 
-        with open(csv_path) as csv_file:
-            reader = csv.DictReader(csv_file)
-            for line in reader:
-                # collect all the initial vector species values for a given node.
-                node = int(line["node_id"])
-                ivps = dict()
-                for species in line:
-                    if species != "node_id":
-                        ivps[species] = int(line[species])
-                self.add_initial_vectors_per_species(ivps, [node])
+        columns = pd.read_csv(csv_path, nrows=0).columns.str.strip().tolist()
+        species = [name for name in columns if name != "node_id"]
+        if "node_id" not in columns or not species:
+            raise ValueError(f"{csv_path} needs a node_id column and at least one species column.")
+        df = pd.read_csv(csv_path, engine="c", skipinitialspace=True, names=columns, header=0,
+                         dtype={name: np.int64 for name in columns})
+        df = df.drop_duplicates("node_id", keep="last")
+        nodes = self.get_nodes_by_id(df["node_id"].tolist())
+
+        groups = df.groupby(species, sort=False).ngroup().to_numpy()
+        group_sizes = np.bincount(groups)
+        vectors = [{name: int(value) for name, value in zip(species, row)}
+                   for row in df.drop_duplicates(species)[species].itertuples(index=False)]
+
+        default_group = -1
+        most_common = int(np.argmax(group_sizes))
+        if len(nodes) == len(self._node_index()) and 2 * group_sizes[most_common] > len(nodes):
+            default_group = most_common
+            self.add_initial_vectors_per_species(dict(vectors[default_group]))
+        for node, group in zip(nodes.values(), groups):
+            if group == default_group:
+                node.node_attributes.parameter_dict.pop("InitialVectorsPerSpecies", None)
+                node.node_attributes.initial_vectors_per_species = None
+            else:
+                node.node_attributes.add_parameter("InitialVectorsPerSpecies", dict(vectors[group]))
+
+    def compact(self):
+        """
+            Return the demographics as a dictionary with the most common node attribute values moved to Defaults,
+            see :py:func:`compact_demographics`. The demographics object itself is not changed.
+
+        Returns:
+            The compacted demographics dictionary.
+        """
+        return compact_demographics(self.to_dict())
+
+    def generate_file(self, name="demographics.json", compact=False):
+        """
+            Write the contents of the instance to an EMOD-compatible (JSON) file.
+
+        Args:
+            name: Path of the file.
+            compact: If True, the most common node attribute values are written to Defaults only, see
+                :py:func:`compact_demographics`.
+
+        Returns:
+            The path of the file.
+        """
+        demographics = self.compact() if compact else self.to_dict()
+        with open(name, "w") as output:
+            json.dump(demographics, output, indent=3, sort_keys=True)
+        return name
+
+    def stream_to_file(self, name="demographics.json", nodes=None, compact_separators=True):
+        """
+            Write the demographics to an EMOD-compatible (JSON) file one node at a time, without building the
+            dictionary of all nodes, see :py:func:`emodpy_malaria.demographics.streaming.write_demographics`.
+
+        Args:
+            name: Path of the file.
+            nodes: Iterable, e.g. a generator, of the nodes to write. Defaults to the nodes of the demographics.
+            compact_separators: If True, the file is written without whitespace.
+
+        Returns:
+            The path of the file.
+        """
+        write_demographics(name, self.raw["Metadata"], self.raw["Defaults"], self.nodes if nodes is None else nodes,
+                           compact_separators=compact_separators)
+        return name
+
+
+_MISSING = object()
+
+
+def _merged(default, value):
+    # nested objects of a node are merged into the Defaults key by key, everything else replaces the default
+    if isinstance(default, dict) and isinstance(value, dict):
+        merged = dict(default)
+        for key, item in value.items():
+            merged[key] = _merged(default.get(key, _MISSING), item)
+        return merged
+    return value
+
+
+def compact_demographics(demographics, sections=("NodeAttributes", "IndividualAttributes")):
+    """
+    Move the most common value of every node attribute to Defaults and remove the node copies of it.
+
+    For every attribute of the sections, each node's effective value (its own value merged into the Defaults
+    value) is compared. The value that saves the most node copies becomes the Defaults value, nodes with that
+    value lose their copy and nodes with another value keep or get an explicit copy, so every node has the same
+    effective attributes as before. Attributes that some nodes neither have nor inherit from Defaults are left
+    as they are.
+
+    Args:
+        demographics: Demographics dictionary with Defaults and Nodes, e.g. from MalariaDemographics.to_dict().
+        sections: The node sections to compact.
+
+    Returns:
+        A new, compacted demographics dictionary, the input is not changed.
+    """
+    compacted = dict(demographics)
+    compacted["Defaults"] = copy.deepcopy(demographics.get("Defaults", {}))
+    nodes = [dict(node) for node in demographics.get("Nodes", [])]
+    compacted["Nodes"] = nodes
+    for section in sections:
+        defaults = compacted["Defaults"].setdefault(section, {})
+        node_sections = [copy.deepcopy(node.get(section, {})) for node in nodes]
+        keys = sorted({key for node_section in node_sections for key in node_section})
+        for key in keys:
+            default = defaults.get(key, _MISSING)
+            effective = [_merged(default, node_section[key]) if key in node_section else default
+                         for node_section in node_sections]
+            if any(value is _MISSING for value in effective):
+                continue
+            encoded = [json.dumps(value, sort_keys=True) for value in effective]
+            own = [key in node_section for node_section in node_sections]
+            counts = pd.Series([code for code, has_own in zip(encoded, own) if has_own]).value_counts()
+            inheriting = own.count(False)
+            default_code = json.dumps(default, sort_keys=True) if default is not _MISSING else None
+            # copies removed minus copies that inheriting nodes need when the default changes and the new default
+            candidates = {counts.index[0]: counts.iloc[0] - inheriting - (default is _MISSING)}
+            if default_code in counts.index:
+                candidates[default_code] = counts[default_code]
+            best, saved = max(candidates.items(), key=lambda item: item[1])
+            if saved <= 0:
+                continue
+            value = effective[encoded.index(best)]
+            defaults[key] = value
+            for node_section, node_value, code in zip(node_sections, effective, encoded):
+                if code == best:
+                    node_section.pop(key, None)
+                else:
+                    node_section[key] = node_value
+        for node, node_section in zip(nodes, node_sections):
+            if node_section:
+                node[section] = node_section
+            else:
+                node.pop(section, None)
+    return compacted
+
+
+def _draw(random, value, size, log=False):
+    """
+    Per-node values: None, a constant, or drawn uniformly (log-uniformly if log) from a (low, high) range.
+    """
+    if value is None:
+        return None
+    if np.ndim(value) == 0:
+        return np.full(size, float(value))
+    low, high = value
+    if low > high:
+        raise ValueError(f"The range {value} has low > high.")
+    if log:
+        if low <= 0:
+            raise ValueError(f"The range {value} of a log-uniform draw must be positive.")
+        return np.exp(random.uniform(np.log(low), np.log(high), size))
+    return random.uniform(low, high, size)
+
+
+def synthetic_node_columns(num_nodes=100, tot_pop=1e6, frac_rural=0.3, seed=None, origin=(0, 0), spacing=1.0,
+                           init_prev=None, risk_sigma=None, habitat_multiplier=None):
+    """
+    Generates the columns of a synthetic population, one row per node, the same population as
+    :py:func:`emod_api.demographics.Demographics.from_params`. The first node is the urban node with
+    tot_pop * (1 - frac_rural) people, the rest of the population is split between the rural nodes
+    with log-uniform (reciprocal) distributed sizes, each at most 100 / tot_pop of the population
+    before the sizes are normalized to frac_rural.
+
+    Args:
+        num_nodes: The number of nodes, laid out along the latitude, or a tuple (n, m) of a grid of
+            nodes where node i * m + j + 1 is at latitude i and longitude j, like emod_api.
+        tot_pop: The total human population.
+        frac_rural: The fraction of the population in nodes 2 and higher.
+        seed: The seed of a random number generator of the populations and attributes, None to draw
+            them from the global NumPy random state like emod_api, e.g. after np.random.seed().
+        origin: The latitude and longitude of node 1.
+        spacing: The distance in degrees between neighbouring nodes of the grid.
+        init_prev: The initial malaria prevalence of each node, a number or a (low, high) range
+            to draw from uniformly.
+        risk_sigma: The sigma of the lognormal biting risk of each node, a number or a (low, high)
+            range to draw from uniformly.
+        habitat_multiplier: The larval habitat multiplier of all habitats and species of each
+            node, a number or a (low, high) range to draw from log-uniformly.
+
+    Returns:
+        A pandas DataFrame with the columns node_id, lat, lon and pop and the columns init_prev,
+        risk_sigma and habitat_multiplier that were asked for, see :py:func:`nodes_from_columns`.
+    """
+    if not 0 <= frac_rural <= 1:
+        raise ValueError(f"frac_rural must be between 0 and 1, got {frac_rural}.")
+    if frac_rural == 0:
+        frac_rural = 1e-09     # as emod_api, rural sizes of 0 can't be normalized
+    lat_count, lon_count = (int(num_nodes), 1) if np.ndim(num_nodes) == 0 else (int(num_nodes[0]), int(num_nodes[1]))
+    count = lat_count * lon_count
+    if count < 1:
+        raise ValueError(f"num_nodes must be at least 1, got {num_nodes}.")
+    random = np.random if seed is None else np.random.default_rng(seed)
+
+    # the steps of emod_api's get_node_pops_from_params, which give the same populations for the same draws
+    sizes = np.empty(count)
+    sizes[0] = 1 - frac_rural
+    if count > 1:
+        rural = np.exp(-np.log(random.random(count - 1)))
+        rural = frac_rural * rural / np.sum(rural)
+        rural = np.minimum(rural, 100 / tot_pop)
+        sizes[1:] = frac_rural * rural / np.sum(rural)
+    lat_index, lon_index = np.divmod(np.arange(count), lon_count)
+    df = pd.DataFrame({"node_id": np.arange(1, count + 1, dtype=np.int64),
+                       "lat": origin[0] + spacing * lat_index,
+                       "lon": origin[1] + spacing * lon_index,
+                       "pop": np.round(tot_pop * sizes, 0).astype(np.int64)})
+    for name, value, log in [("init_prev", init_prev, False), ("risk_sigma", risk_sigma, False),
+                             ("habitat_multiplier", habitat_multiplier, True)]:
+        values = _draw(random, value, count, log)
+        if values is not None:
+            df[name] = values
+    if "init_prev" in df and not df["init_prev"].between(0, 1).all():
+        raise ValueError("init_prev must be between 0 and 1.")
+    return df
+
+
+def nodes_from_columns(columns):
+    """
+    Creates the nodes of a population in one batch from columns of per-node values.
+
+    Args:
+        columns: A pandas DataFrame or dictionary of arrays with the columns node_id, lat, lon and
+            pop and optionally name, init_prev (constant initial prevalence), risk_sigma (sigma of
+            a lognormal biting risk with mean 0) and habitat_multiplier (LarvalHabitatMultiplier
+            Factor of ALL_HABITATS and ALL_SPECIES), e.g. from :py:func:`synthetic_node_columns`.
+
+    Returns:
+        A list of :py:class:`emod_api.demographics.Node.Node` objects.
+    """
+    columns = pd.DataFrame(columns)
+    missing = [name for name in ["node_id", "lat", "lon", "pop"] if name not in columns]
+    if missing:
+        raise ValueError(f"The columns {missing} are missing.")
+    count = len(columns)
+    names = columns["name"].tolist() if "name" in columns else [None] * count
+    nodes = [Demog.Node(lat=lat, lon=lon, pop=pop, name=name, forced_id=node_id)
+             for node_id, lat, lon, pop, name in zip(columns["node_id"].tolist(), columns["lat"].tolist(),
+                                                    columns["lon"].tolist(), columns["pop"].tolist(), names)]
+    if "init_prev" in columns:
+        for node, prevalence in zip(nodes, columns["init_prev"].tolist()):
+            attributes = node.individual_attributes
+            attributes.prevalence_distribution_flag = 1
+            attributes.prevalence_distribution1 = prevalence
+            attributes.prevalence_distribution2 = prevalence
+    if "risk_sigma" in columns:
+        for node, sigma in zip(nodes, columns["risk_sigma"].tolist()):
+            attributes = node.individual_attributes
+            attributes.risk_distribution_flag = 5
+            attributes.risk_distribution1 = 0
+            attributes.risk_distribution2 = sigma
+    if "habitat_multiplier" in columns:
+        for node, factor in zip(nodes, columns["habitat_multiplier"].tolist()):
+            node.node_attributes.larval_habitat_multiplier = [{"Habitat": "ALL_HABITATS", "Species": "ALL_SPECIES",
+                                                               "Factor": factor}]
+    return nodes
 
 
 def from_template_node(lat=0, lon=0, pop=1e6, name=1, forced_id=1, init_prev=0.2, include_biting_heterogeneity=True):
     """
     Create a single-node :py:class:`~emodpy_malaria.demographics.MalariaDemographics`
-    instance from the parameters you supply.
+    instance from the parameters you supply. Pass arrays of lat, lon and pop to create many
+    nodes from the same template in one batch.
 
     Args:
         lat: Latitude of the centroid of the node to create.
@@ -155,13 +603,19 @@ def from_template_node(lat=0, lon=0, pop=1e6, name=1, forced_id=1, init_prev=0.2
         pop: Human population of the node. 
         name: The name of the node. This may be a characteristic of the 
             node, such as "rural" or "urban", or an identifying integer.
-        forced_id: The node ID for the single node.
+        forced_id: The node ID for the single node, or the ID of the first node and
+            forced_id + 1, forced_id + 2, ... for the others. An array sets each node's ID.
         init_prev: The initial malaria prevalence of the node.
 
     Returns:
         A :py:class:`~emodpy_malaria.demographics.MalariaDemographics` instance.
     """
-    new_nodes = [Demog.Node(lat=lat, lon=lon, pop=pop, name=name, forced_id=forced_id)]
+    if all(np.ndim(value) == 0 for value in [lat, lon, pop, name, forced_id]):
+        new_nodes = [Demog.Node(lat=lat, lon=lon, pop=pop, name=name, forced_id=forced_id)]
+    else:
+        lat, lon, pop, name = np.broadcast_arrays(lat, lon, pop, np.asarray(name, dtype=object))
+        node_ids = forced_id + np.arange(len(lat)) if np.ndim(forced_id) == 0 else forced_id
+        new_nodes = nodes_from_columns({"node_id": node_ids, "lat": lat, "lon": lon, "pop": pop, "name": name})
     return MalariaDemographics(nodes=new_nodes, init_prev=init_prev,
                                include_biting_heterogeneity=include_biting_heterogeneity)
 
@@ -211,18 +665,21 @@ def from_csv(input_file, res=30 / 3600, id_ref="from_csv", init_prev=0.0, includ
                                include_biting_heterogeneity=include_biting_heterogeneity)
 
 
-def from_params(tot_pop=1e6, num_nodes=100, frac_rural=0.3, id_ref="from_params"):
+def from_params(tot_pop=1e6, num_nodes=100, frac_rural=0.3, id_ref="from_params", seed=None, init_prev=None,
+                risk_sigma=None, habitat_multiplier=None):
     """
     Creates nodes with following logic: First node is the urban node, which contains
     tot_pop * (1-frac_rural) of the population, the rest of the nodes splip the left-over
     population with less and less people in each node.
 
     Create a multi-node :py:class:`~emodpy_malaria.demographics.MalariaDemographics`
-    instance as a synthetic population based on a few parameters.
+    instance as a synthetic population based on a few parameters. The nodes are generated
+    as arrays by :py:func:`synthetic_node_columns` and created in one batch.
 
     Args:
         tot_pop: The total human population in the node.
-        num_nodes: The number of nodes to create.
+        num_nodes: The number of nodes to create, or a tuple (n, m) of a grid of nodes, see
+            :py:func:`synthetic_node_columns`.
         frac_rural: The fraction of the population that will be distributed between
             nodes 2 and higher
         id_ref: Method describing how the latitude and longitude values are created
@@ -230,10 +687,16 @@ def from_params(tot_pop=1e6, num_nodes=100, frac_rural=0.3, id_ref="from_params"
             overlaid across the globe at some arcsec resolution. You may also generate 
             the grid using another tool or coordinate system. For more information,
             see :ref:`emod-malaria:demo-metadata`.
+        seed: The seed of the random number generator of the populations and attributes, None draws
+            them from the global NumPy random state like emod_api.
+        init_prev: The initial malaria prevalence of each node, a number or a (low, high) range.
+        risk_sigma: The sigma of the lognormal biting risk of each node, a number or a (low, high) range.
+        habitat_multiplier: The larval habitat multiplier of each node, a number or a (low, high) range.
 
     Returns:
         A :py:class:`~emodpy_malaria.demographics.MalariaDemographics` instance.
     """
-    generic_demog = Demog.from_params(tot_pop, num_nodes, frac_rural, id_ref)
-    nodes = generic_demog.nodes
+    columns = synthetic_node_columns(num_nodes, tot_pop, frac_rural, seed=seed, init_prev=init_prev,
+                                     risk_sigma=risk_sigma, habitat_multiplier=habitat_multiplier)
+    nodes = nodes_from_columns(columns)
     return MalariaDemographics(nodes=nodes, idref=id_ref)
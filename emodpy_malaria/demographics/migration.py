@@ -0,0 +1,250 @@
+"""
+Sparse, vectorized migration builder for :py:class:`MalariaDemographics`.
+
+Migration rates are computed with NumPy for a sparse set of neighbours of every node, the k nearest nodes
+and/or the nodes within a radius found with the demographics' spatial index, instead of for all pairs of
+nodes. The rates are truncated to the number of destinations per node EMOD reads and written straight to the
+binary migration file and its JSON metadata, the same format as :py:meth:`emod_api.migration.Migration.to_file`::
+
+    from emod_api.migration import Migration
+    from emodpy_malaria.demographics.migration import build_migration
+
+    local = build_migration(demographics, model="gravity", params=[7.5e-06, 0.97, 0.97, -1.1], k=8,
+                            migration_type=Migration.LOCAL)
+    local.to_file("local_migration.bin")
+    regional = build_migration(demographics, model="radiation", params=[0.01], km=100, k=30,
+                               migration_type=Migration.REGIONAL)
+    regional.to_file("regional_migration.bin")
+"""
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from emod_api.migration import Migration
+
+#: Most destinations per node EMOD reads from a migration file (DatavalueCount)
+DESTINATION_LIMIT = 100
+
+#: Destinations per node of the fixed-size migration files of earlier EMOD versions, used by default
+DEFAULT_DESTINATIONS = {Migration.LOCAL: 8, Migration.AIR: 60, Migration.REGIONAL: 30, Migration.SEA: 5,
+                        Migration.FAMILY: 8}
+
+_MIGRATION_TYPES = {Migration.LOCAL: "LOCAL_MIGRATION", Migration.AIR: "AIR_MIGRATION",
+                    Migration.REGIONAL: "REGIONAL_MIGRATION", Migration.SEA: "SEA_MIGRATION",
+                    Migration.FAMILY: "FAMILY_MIGRATION", Migration.INTERVENTION: "INTERVENTION_MIGRATION"}
+
+
+def gravity_rates(source_populations, destination_populations, km, params) -> np.ndarray:
+    """
+    Daily migration rates of the gravity model, the same as
+    :py:func:`emod_api.migration.from_demog_and_param_gravity`:
+    min(1, g0 * source_population^g1 * destination_population^g2 * km^g3 / source_population).
+
+    Args:
+        source_populations: populations of the source nodes
+        destination_populations: populations of the destination nodes
+        km: distances between the nodes in km
+        params: the gravity parameters [g0, g1, g2, g3]
+
+    Returns:
+        Array of rates, 0 where a population is 0
+    """
+    if len(params) != 4:
+        raise ValueError(f"The gravity model takes 4 parameters, got {len(params)}.")
+    source = np.asarray(source_populations, dtype=np.float64)
+    destination = np.asarray(destination_populations, dtype=np.float64)
+    km = np.asarray(km, dtype=np.float64)
+    populated = (source > 0) & (destination > 0)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        trips = params[0] * source ** params[1] * destination ** params[2] * km ** params[3]
+        rates = np.minimum(1.0, trips / source)
+    return np.where(populated, rates, 0.0)
+
+
+def radiation_rates(source_populations, destination_populations, intervening_populations, params) -> np.ndarray:
+    """
+    Daily migration rates of the radiation model, the fraction params[0] of the population that travels times the
+    probability source_population * destination_population /
+    ((source_population + s) * (source_population + destination_population + s)) of going to a destination, where
+    s is the population living closer to the source than the destination.
+
+    Args:
+        source_populations: populations of the source nodes
+        destination_populations: populations of the destination nodes
+        intervening_populations: populations closer to the source than the destination, without either
+        params: [fraction of the population that travels per day]
+
+    Returns:
+        Array of rates, 0 where a population is 0
+    """
+    if len(params) != 1:
+        raise ValueError(f"The radiation model takes 1 parameter, got {len(params)}.")
+    source = np.asarray(source_populations, dtype=np.float64)
+    destination = np.asarray(destination_populations, dtype=np.float64)
+    between = np.asarray(intervening_populations, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = params[0] * source * destination / ((source + between) * (source + destination + between))
+    return np.where((source > 0) & (destination > 0), rates, 0.0)
+
+
+class SparseMigration:
+    """
+    Migration rates from source to destination nodes as arrays, one entry per pair of nodes.
+
+    Args:
+        sources: ids of the source nodes
+        destinations: ids of the destination nodes
+        rates: daily migration rates
+        migration_type: the type of migration, e.g. Migration.LOCAL or Migration.REGIONAL
+        id_ref: the IdReference of the demographics
+    """
+    def __init__(self, sources, destinations, rates, migration_type=Migration.LOCAL, id_ref=Migration.IDREF_LEGACY):
+        self.sources = np.asarray(sources, dtype=np.uint32)
+        self.destinations = np.asarray(destinations, dtype=np.uint32)
+        self.rates = np.asarray(rates, dtype=np.float64)
+        if not len(self.sources) == len(self.destinations) == len(self.rates):
+            raise ValueError("sources, destinations and rates must have the same length.")
+        if migration_type not in _MIGRATION_TYPES:
+            raise ValueError(f"Unknown migration_type {migration_type}, use one of the Migration types, e.g. "
+                             f"Migration.LOCAL.")
+        self.migration_type = migration_type
+        self.id_ref = id_ref
+
+    def __len__(self) -> int:
+        return len(self.rates)
+
+    def truncate(self, max_destinations: int) -> "SparseMigration":
+        """
+        Keeps the max_destinations destinations with the highest rates of every source node, ties go to the
+        lower node id like in :py:meth:`emod_api.migration.Migration.to_file`.
+
+        Returns:
+            New SparseMigration sorted by source and by rate in descending order
+        """
+        order = np.lexsort((self.destinations, -self.rates, self.sources))
+        sources = self.sources[order]
+        starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]]) if len(sources) else np.empty(0, int)
+        ranks = np.arange(len(sources)) - np.repeat(starts, np.diff(np.r_[starts, len(sources)]))
+        keep = order[ranks < max_destinations]
+        return SparseMigration(self.sources[keep], self.destinations[keep], self.rates[keep], self.migration_type,
+                               self.id_ref)
+
+    def to_file(self, binary_file, metafile=None, max_destinations: int = None) -> Path:
+        """
+        Writes the binary migration file and its JSON metadata.
+
+        Args:
+            binary_file: path of the binary file
+            metafile: path of the metadata file, defaults to the binary file's path with ".json" appended
+            max_destinations: destinations per node, defaults to the number of destinations of the source node
+                with the most, up to DESTINATION_LIMIT. Source nodes with more destinations keep the highest rates.
+
+        Returns:
+            Path of the binary file
+        """
+        binary_file = Path(binary_file).absolute()
+        metafile = Path(metafile) if metafile else binary_file.parent / (binary_file.name + ".json")
+        node_ids, counts = np.unique(self.sources, return_counts=True)
+        count = int(counts.max()) if len(counts) else 0
+        count = min(count, max_destinations or DESTINATION_LIMIT)
+        if count > DESTINATION_LIMIT:
+            raise ValueError(f"EMOD reads at most {DESTINATION_LIMIT} destinations per node, got {count}.")
+        migration = self.truncate(count)
+
+        # one record of destinations and rates per source node, rates ascending so small rates aren't lost in
+        # the cumulative sum, unused slots are 0
+        records = np.zeros(len(node_ids), dtype=[("destinations", "<u4", (count,)), ("rates", "<f8", (count,))])
+        rows = np.searchsorted(node_ids, migration.sources)
+        kept = np.bincount(rows, minlength=len(node_ids))
+        starts = np.r_[0, np.cumsum(kept)[:-1]]
+        slots = kept[rows] - 1 - (np.arange(len(rows)) - starts[rows])
+        records["destinations"][rows, slots] = migration.destinations
+        records["rates"][rows, slots] = migration.rates
+
+        offsets = 12 * count * np.arange(len(node_ids))
+        metadata = {
+            "Metadata": {
+                "Author": os.environ.get("USERNAME", os.environ.get("USER", "Unknown")),
+                "DateCreated": f"{datetime.now():%a %b %d %Y %H:%M:%S}",
+                "Tool": "emodpy-malaria",
+                "IdReference": self.id_ref,
+                "MigrationType": _MIGRATION_TYPES[self.migration_type],
+                "NodeCount": len(node_ids),
+                "DatavalueCount": count,
+                "GenderDataType": "SAME_FOR_BOTH_GENDERS",
+                "InterpolationType": "PIECEWISE_CONSTANT"
+            },
+            "NodeOffsets": "".join(f"{node_id:08x}{offset:08x}" for node_id, offset in zip(node_ids.tolist(),
+                                                                                         offsets.tolist()))
+        }
+        with metafile.open("w") as handle:
+            json.dump(metadata, handle, indent=4, separators=(",", ": "))
+        records.tofile(str(binary_file))
+        return binary_file
+
+    def to_migration(self) -> Migration:
+        """Converts to an :py:class:`emod_api.migration.Migration` object, e.g. to inspect or edit the rates."""
+        migration = Migration()
+        migration.IdReference = self.id_ref
+        migration.MigrationType = self.migration_type
+        for source, destination, rate in zip(self.sources.tolist(), self.destinations.tolist(), self.rates.tolist()):
+            migration[source][destination] = rate
+        return migration
+
+
+def build_migration(demographics, model="gravity", params=None, k=None, km=None,
+                    migration_type=Migration.LOCAL, max_destinations=None, exclude_nodes=None) -> SparseMigration:
+    """
+    Builds migration rates between every node of a demographics and its neighbours.
+
+    Args:
+        demographics: the :py:class:`MalariaDemographics` object
+        model: "gravity", see :py:func:`gravity_rates`, or "radiation", see :py:func:`radiation_rates`
+        params: the parameters of the model
+        k: the number of nearest neighbours of every node that are destinations
+        km: the radius in km within which nodes are destinations, with k the k nearest nodes within km
+        migration_type: the type of migration, e.g. Migration.LOCAL or Migration.REGIONAL
+        max_destinations: destinations kept per node, the highest rates, defaults to DEFAULT_DESTINATIONS of the
+            migration type
+        exclude_nodes: ids of nodes that are neither sources nor destinations
+
+    Returns:
+        SparseMigration object, write it with to_file()
+    """
+    if model not in ["gravity", "radiation"]:
+        raise ValueError(f"Unknown migration model '{model}', use 'gravity' or 'radiation'.")
+    if params is None:
+        raise ValueError(f"The {model} model needs params.")
+    if k is None and km is None:
+        raise ValueError("Pass k, km or both to select the destinations of every node.")
+    if max_destinations is None:
+        max_destinations = DEFAULT_DESTINATIONS.get(migration_type, DESTINATION_LIMIT)
+    if not 0 < max_destinations <= DESTINATION_LIMIT:
+        raise ValueError(f"max_destinations must be between 1 and {DESTINATION_LIMIT}, got {max_destinations}.")
+
+    index = demographics.spatial_index()
+    populations = np.array([node.node_attributes.initial_population or 0 for node in demographics.nodes],
+                           dtype=np.float64)
+    sources, destinations, distances = index.neighbours(k=k, km=km)
+    source_populations = populations[sources]
+    destination_populations = populations[destinations]
+    if model == "gravity":
+        rates = gravity_rates(source_populations, destination_populations, distances, params)
+    else:
+        # neighbours are sorted by distance, the population in between is the sum over the closer neighbours
+        cumulative = np.cumsum(destination_populations)
+        starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]]) if len(sources) else np.empty(0, int)
+        group_starts = np.repeat(starts, np.diff(np.r_[starts, len(sources)]))
+        between = cumulative - destination_populations - (cumulative[group_starts] - destination_populations[
+            group_starts])
+        rates = radiation_rates(source_populations, destination_populations, between, params)
+
+    keep = rates > 0
+    if exclude_nodes:
+        excluded = np.isin(index.node_ids, list(exclude_nodes))
+        keep &= ~excluded[sources] & ~excluded[destinations]
+    migration = SparseMigration(index.node_ids[sources[keep]], index.node_ids[destinations[keep]], rates[keep],
+                                migration_type, demographics.idref)
+    return migration.truncate(max_destinations)
@@ -0,0 +1,165 @@
+"""
+Spatial index over the nodes of a demographics for radius and neighbour queries.
+
+Node coordinates are mapped to points on the unit sphere and stored in a KD-tree, where the straight-line
+(chord) distance orders pairs of nodes the same way as their great-circle distance. Queries take and return
+distances in kilometers, the same great-circle distances EMOD uses for, e.g., the fmda_radius of
+:py:func:`emodpy_malaria.interventions.drug_campaign.add_drug_campaign`::
+
+    index = demographics.spatial_index()
+    reached = index.nodes_within(node_id=12, km=5)
+    neighbours, km = index.nearest(node_id=12, k=8)
+    distances = index.distances(node_ids[:1000], node_ids)      # 1000 x N block in km
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _unit_vectors(lats, lons) -> np.ndarray:
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lats = np.cos(lats)
+    return np.column_stack([cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)])
+
+
+def _km_to_chord(km):
+    return 2 * np.sin(np.minimum(np.asarray(km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1))
+
+
+def great_circle_km(lats1, lons1, lats2, lons2) -> np.ndarray:
+    """
+    Great-circle (haversine) distances in km between points, with NumPy broadcasting.
+    """
+    lats1, lons1, lats2, lons2 = (np.radians(np.asarray(value, dtype=np.float64))
+                                  for value in (lats1, lons1, lats2, lons2))
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class NodeSpatialIndex:
+    """
+    KD-tree over node coordinates with queries in kilometers.
+
+    Args:
+        node_ids: ids of the nodes
+        lats: latitudes of the nodes in degrees
+        lons: longitudes of the nodes in degrees
+    """
+    def __init__(self, node_ids, lats, lons):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        if not len(self.node_ids) == len(self.lats) == len(self.lons):
+            raise ValueError("node_ids, lats and lons must have the same length.")
+        self._positions = {node_id: position for position, node_id in enumerate(self.node_ids.tolist())}
+        if len(self._positions) != len(self.node_ids):
+            raise ValueError("Node ids must be unique.")
+        self._points = _unit_vectors(self.lats, self.lons)
+        self._tree = cKDTree(self._points)
+
+    @classmethod
+    def from_nodes(cls, nodes) -> "NodeSpatialIndex":
+        """Builds the index from emod_api Nodes."""
+        return cls([node.id for node in nodes], [node.node_attributes.latitude for node in nodes],
+                   [node.node_attributes.longitude for node in nodes])
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def positions(self, node_ids) -> np.ndarray:
+        """Positions of node ids in node_ids."""
+        try:
+            return np.array([self._positions[int(node_id)] for node_id in np.atleast_1d(node_ids)], dtype=np.int64)
+        except KeyError as error:
+            raise ValueError(f"Node id {error.args[0]} is not in the spatial index.") from None
+
+    def nodes_within(self, node_id: int, km: float, include_self: bool = False) -> np.ndarray:
+        """
+        Ids of the nodes within km of a node, sorted by distance.
+
+        Args:
+            node_id: id of the center node
+            km: radius in km
+            include_self: if True the center node is part of the result
+
+        Returns:
+            Array of node ids
+        """
+        position = self.positions(node_id)[0]
+        found = np.array(self._tree.query_ball_point(self._points[position], _km_to_chord(km)), dtype=np.int64)
+        if not include_self:
+            found = found[found != position]
+        order = np.argsort(np.linalg.norm(self._points[found] - self._points[position], axis=1), kind="stable")
+        return self.node_ids[found[order]]
+
+    def nearest(self, node_id: int, k: int) -> tuple:
+        """
+        The k nodes nearest to a node, not counting the node itself.
+
+        Returns:
+            Tuple of the array of node ids and the array of their distances in km, both sorted by distance
+        """
+        k = min(int(k), len(self) - 1)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        position = self.positions(node_id)[0]
+        chords, found = self._tree.query(self._points[position], k=k + 1)
+        keep = found != position
+        found, chords = found[keep][:k], chords[keep][:k]
+        return self.node_ids[found], _chord_to_km(chords)
+
+    def neighbours(self, k: int = None, km: float = None) -> tuple:
+        """
+        Neighbour pairs of all nodes at once, the k nearest nodes and/or the nodes within km.
+
+        Args:
+            k: number of nearest neighbours of every node
+            km: radius in km, with k the k nearest neighbours within the radius
+
+        Returns:
+            Tuple of the arrays of the positions of the node and of its neighbour in node_ids and of their distances
+            in km, ordered by node and distance
+        """
+        if k is None and km is None:
+            raise ValueError("Pass k, km or both.")
+        if k is not None:
+            k = min(int(k), len(self) - 1)
+            if k <= 0:
+                empty = np.empty(0, dtype=np.int64)
+                return empty, empty, np.empty(0, dtype=np.float64)
+            upper_bound = _km_to_chord(km) if km is not None else np.inf
+            chords, found = self._tree.query(self._points, k=k + 1, distance_upper_bound=upper_bound)
+            sources = np.repeat(np.arange(len(self)), k + 1).reshape(len(self), k + 1)
+            keep = (found != sources) & (found < len(self))
+            # a node that isn't its own first match (duplicate coordinates) keeps k + 1 neighbours, drop the last
+            keep[keep.sum(axis=1) > k, -1] = False
+            return sources[keep], found[keep], _chord_to_km(chords[keep])
+
+        pairs = self._tree.query_pairs(_km_to_chord(km), output_type="ndarray")
+        sources = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        targets = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        km_values = _chord_to_km(np.linalg.norm(self._points[sources] - self._points[targets], axis=1))
+        order = np.lexsort((km_values, sources))
+        return sources[order], targets[order], km_values[order]
+
+    def distances(self, from_node_ids=None, to_node_ids=None) -> np.ndarray:
+        """
+        Block of great-circle distances in km.
+
+        Args:
+            from_node_ids: ids of the rows, None for all nodes
+            to_node_ids: ids of the columns, None for all nodes
+
+        Returns:
+            Array len(from_node_ids) x len(to_node_ids)
+        """
+        rows = np.arange(len(self)) if from_node_ids is None else self.positions(from_node_ids)
+        columns = np.arange(len(self)) if to_node_ids is None else self.positions(to_node_ids)
+        return great_circle_km(self.lats[rows, None], self.lons[rows, None], self.lats[None, columns],
+                               self.lons[None, columns])
@@ -0,0 +1,155 @@
+"""
+Streaming writer and validator for demographics files with very many nodes.
+
+The writer emits Metadata, Defaults and then one node at a time, so nodes can come from a generator and are never
+held in memory together; NodeCount is patched into the Metadata when the last node has been written. The
+validator reads the file back one node at a time and checks what EMOD needs without loading the whole file::
+
+    from emodpy_malaria.demographics.streaming import write_demographics, validate_demographics
+
+    def grid():
+        for node_id, (lat, lon, pop) in enumerate(cells, start=1):
+            yield Node(lat, lon, pop, forced_id=node_id)
+
+    write_demographics("demographics.json", demographics.raw["Metadata"], demographics.raw["Defaults"], grid())
+    problems = validate_demographics("demographics.json")
+"""
+import json
+from array import array
+
+import numpy as np
+
+from emodpy_malaria.reporters.streaming import _Scanner, DEFAULT_CHUNK_SIZE
+
+REQUIRED_NODE_ATTRIBUTES = ["Latitude", "Longitude", "InitialPopulation"]
+_NODE_COUNT_WIDTH = 20
+
+
+def node_to_dict(node) -> dict:
+    """Dictionary of a node as written to the demographics file, node is an emod_api Node or a dictionary."""
+    if isinstance(node, dict):
+        return node
+    node_dict = node.to_dict()
+    node_dict.update(node.meta)
+    return node_dict
+
+
+def write_demographics(path: str, metadata: dict, defaults: dict, nodes, compact_separators: bool = True) -> int:
+    """
+    Writes a demographics file node by node.
+
+    Args:
+        path: path of the file, a seekable file is needed to write NodeCount at the end
+        metadata: the Metadata, NodeCount is set to the number of nodes written
+        defaults: the Defaults
+        nodes: iterable, e.g. a list or generator, of emod_api Nodes or node dictionaries
+        compact_separators: if True the file is written without whitespace, else with one node per line
+
+    Returns:
+        The number of nodes written
+    """
+    separators = (",", ":") if compact_separators else (", ", ": ")
+    node_separator = "," if compact_separators else ",\n"
+    metadata = {key: value for key, value in metadata.items() if key != "NodeCount"}
+
+    def dumps(value):
+        return json.dumps(value, separators=separators)
+
+    count = 0
+    with open(path, "w") as output:
+        output.write("{" + dumps("Metadata") + separators[1] + dumps(metadata)[:-1])
+        output.write((separators[0] if metadata else "") + dumps("NodeCount") + separators[1])
+        # the count is written over the padding when it's known
+        count_offset = output.tell()
+        output.write(" " * _NODE_COUNT_WIDTH + "}")
+        output.write(separators[0] + dumps("Defaults") + separators[1] + dumps(defaults))
+        output.write(separators[0] + dumps("Nodes") + separators[1] + "[")
+        if not compact_separators:
+            output.write("\n")
+        for node in nodes:
+            if count:
+                output.write(node_separator)
+            output.write(dumps(node_to_dict(node)))
+            count += 1
+        output.write("]}")
+        output.seek(count_offset)
+        output.write(str(count))
+    return count
+
+
+def _check_node(node, index: int, defaults: dict, problems: list):
+    if not isinstance(node, dict):
+        problems.append(f"Node {index} is not an object.")
+        return None
+    node_id = node.get("NodeID")
+    if not isinstance(node_id, int) or isinstance(node_id, bool) or node_id <= 0:
+        problems.append(f"Node {index} has no positive integer NodeID, found {node_id!r}.")
+        node_id = None
+    attributes = node.get("NodeAttributes", {})
+    default_attributes = defaults.get("NodeAttributes", {})
+    missing = [name for name in REQUIRED_NODE_ATTRIBUTES if name not in attributes and name not in default_attributes]
+    if missing:
+        problems.append(f"Node {node_id if node_id is not None else index} has no {', '.join(missing)} and "
+                        f"Defaults don't set them.")
+    return node_id
+
+
+def validate_demographics(path: str, max_problems: int = 100, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Checks a demographics file one node at a time: Metadata with IdReference and NodeCount, unique positive
+    NodeIDs and the node attributes EMOD requires (Latitude, Longitude, InitialPopulation) in the node or Defaults.
+
+    Args:
+        path: path to the demographics file
+        max_problems: the check stops after this many problems
+        chunk_size: number of characters read at a time
+
+    Returns:
+        List of the problems found, empty for a valid file
+    """
+    problems = []
+    metadata = None
+    defaults = {}
+    node_ids = array("q")
+    num_nodes = 0
+    with open(path, "r") as handle:
+        scanner = _Scanner(handle, chunk_size)
+        scanner.expect("{")
+        while scanner.peek() != "}" and len(problems) < max_problems:
+            key = scanner.read_string()
+            scanner.expect(":")
+            if key == "Metadata":
+                metadata = json.loads(scanner.scan_value(record=True))
+            elif key == "Defaults":
+                defaults = json.loads(scanner.scan_value(record=True))
+            elif key == "Nodes":
+                scanner.expect("[")
+                while scanner.peek() != "]" and len(problems) < max_problems:
+                    node = json.loads(scanner.scan_value(record=True))
+                    # nodes are checked against the Defaults read so far, EMOD files list Defaults first
+                    node_id = _check_node(node, num_nodes, defaults, problems)
+                    if node_id is not None:
+                        node_ids.append(node_id)
+                    num_nodes += 1
+                    if scanner.peek() == ",":
+                        scanner.pos += 1
+                scanner.pos += 1
+            else:
+                scanner.scan_value(record=False)
+            if scanner.peek() == ",":
+                scanner.pos += 1
+
+    if len(problems) >= max_problems:
+        return problems[:max_problems]
+    if metadata is None:
+        problems.append("The file has no Metadata.")
+    else:
+        if "IdReference" not in metadata:
+            problems.append("Metadata has no IdReference.")
+        if metadata.get("NodeCount") != num_nodes:
+            problems.append(f"Metadata NodeCount is {metadata.get('NodeCount')} but the file has {num_nodes} nodes.")
+    ids, counts = np.unique(np.frombuffer(node_ids, dtype=np.int64), return_counts=True)
+    duplicates = ids[counts > 1]
+    if len(duplicates):
+        problems.append(f"{len(duplicates)} NodeID(s) are used more than once: {duplicates[:10].tolist()}.")
+    return problems[:max_problems]
@@ -0,0 +1,319 @@
+"""
+Aggregation of reporter output over many simulations.
+
+The output directories are read in a process pool with the ``read()`` method of a built-in reporter class, see
+:py:mod:`emodpy_malaria.reporters.readers`, and the selected channels are reduced incrementally as the results
+arrive: element-wise count, mean and variance and a fixed-size reservoir sample for quantiles. The outputs of the
+individual simulations are never concatenated, memory is bounded by the number of groups times the size of the
+channels times the reservoir size::
+
+    from emodpy_malaria.reporters.builtin import MalariaSummaryReport
+    from emodpy_malaria.reporters.aggregate import aggregate_reports
+
+    result = aggregate_reports(output_dirs, MalariaSummaryReport, ["PfPR by Age Bin"],
+                               tags=[{"habitat_scale": 1.0}, {"habitat_scale": 2.0}, ...])
+    result.save("calibration_summary.npz")
+"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.readers import CsvReportReader, InsetChartReportReader, SummaryReportReader, \
+    SpatialReportReader
+
+DEFAULT_QUANTILES = (0.025, 0.25, 0.5, 0.75, 0.975)
+# readers whose read(output_dir, channels, parameters=...) returns channels that can be aggregated
+CHANNEL_READERS = (CsvReportReader, InsetChartReportReader, SummaryReportReader, SpatialReportReader)
+
+
+def reservoir_slot(count: int, sample_size: int, rng) -> int:
+    """
+    Reservoir sampling (algorithm R): the slot of the count-th item added to a reservoir of sample_size items,
+    None if the item isn't sampled.
+    """
+    if count <= sample_size:
+        return count - 1
+    index = int(rng.integers(count))
+    return index if index < sample_size else None
+
+
+class ChannelStatistics:
+    """
+    Element-wise running statistics of one channel over simulations.
+
+    Mean and variance are updated with Welford's algorithm. Quantiles are estimated from a reservoir sample of at
+    most sample_size simulations, they are exact as long as no more than sample_size simulations were added.
+
+    Args:
+        sample_size: size of the reservoir used for quantiles
+        seed: seed of the reservoir sampling
+    """
+    def __init__(self, sample_size: int = 200, seed: int = 0):
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+        self._sample = None
+
+    def check_shape(self, values: np.ndarray):
+        """Raises a ValueError if the shape of values doesn't match the channels added before."""
+        if self.mean is not None and np.shape(values) != self.mean.shape:
+            raise ValueError(f"Channel shape {np.shape(values)} doesn't match shape {self.mean.shape} of "
+                             f"previous simulations.")
+
+    def add(self, values: np.ndarray, slot: int = -1):
+        """
+        Adds the channel of one simulation.
+
+        Args:
+            values: the channel
+            slot: the slot of the simulation in the reservoir, see :py:func:`reservoir_slot`, None if it isn't
+                sampled. The default -1 draws the slot with the statistics' own generator.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        self.check_shape(values)
+        if self.mean is None:
+            self.mean = np.zeros_like(values)
+            self._m2 = np.zeros_like(values)
+            self._sample = np.empty((self.sample_size,) + values.shape)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+        if slot == -1:
+            slot = reservoir_slot(self.count, self.sample_size, self.rng)
+        if slot is not None:
+            self._sample[slot] = values
+
+    @property
+    def variance(self) -> np.ndarray:
+        """Sample variance (ddof=1), NaN for fewer than two simulations."""
+        if self.count < 2:
+            return np.full_like(self.mean, np.nan)
+        return self._m2 / (self.count - 1)
+
+    def quantiles(self, quantiles=DEFAULT_QUANTILES) -> np.ndarray:
+        """Returns an array indexed [quantile, ...channel shape]."""
+        return np.quantile(self._sample[:min(self.count, self.sample_size)], quantiles, axis=0)
+
+
+def channel_arrays(report, channels: list) -> dict:
+    """
+    Extracts channels from the result of a reporter's read() as NumPy arrays.
+
+    Args:
+        report: DataFrame (CSV and InsetChart-style reports, columns are channels), dictionary of groups of
+            channels (MalariaSummaryReport, channels are looked up in every "DataBy..." group) or dictionary
+            channel -> DataFrame (spatial reports)
+        channels: channels to extract
+
+    Returns:
+        Dictionary channel -> array
+    """
+    arrays = {}
+    for channel in channels:
+        if isinstance(report, pd.DataFrame):
+            value = report[channel]
+        elif channel in report:
+            value = report[channel]
+        else:
+            groups = [group for group in report.values() if isinstance(group, dict) and channel in group]
+            if not groups:
+                raise KeyError(f"Channel {channel} not found in report.")
+            value = groups[0][channel]
+        arrays[channel] = value.to_numpy(dtype=np.float64) if isinstance(value, (pd.Series, pd.DataFrame)) \
+            else np.asarray(value, dtype=np.float64)
+    return arrays
+
+
+def _read_channels(reporter_class, output_dir: str, channels: list, parameters: dict) -> dict:
+    report = reporter_class.read(output_dir, channels, parameters=parameters)
+    return channel_arrays(report, channels)
+
+
+def _group_key(tag: dict) -> str:
+    return json.dumps(tag or {}, sort_keys=True)
+
+
+class AggregationResult:
+    """
+    Statistics per group of simulations with the same tags and per channel. The reservoir sample of a group holds
+    the same simulations for all channels, so quantiles of different channels come from the same simulations.
+
+    Attributes:
+        groups: dictionary group key (the tags as JSON) -> dictionary channel -> :py:class:`ChannelStatistics`
+        tags: dictionary group key -> tags
+        failures: dictionary output directory -> error message of the directories that couldn't be read
+    """
+    def __init__(self, channels: list, quantiles=DEFAULT_QUANTILES, sample_size: int = 200, seed: int = 0):
+        self.channels = list(channels)
+        self.quantile_levels = tuple(quantiles)
+        self.sample_size = sample_size
+        self.seed = seed
+        self.groups = {}
+        self.tags = {}
+        self.failures = {}
+        self._seeds = np.random.SeedSequence(seed)
+        self._reservoirs = {}   # group key -> [number of simulations, generator of the reservoir slots]
+
+    def add(self, tag: dict, arrays: dict):
+        """
+        Adds the channels of one simulation to the statistics of its group.
+
+        Raises:
+            ValueError: the shape of a channel doesn't match the simulations added before, nothing is added
+        """
+        key = _group_key(tag)
+        if key not in self.groups:
+            self.tags[key] = dict(tag or {})
+            self.groups[key] = {channel: ChannelStatistics(self.sample_size) for channel in self.channels}
+            self._reservoirs[key] = [0, np.random.default_rng(self._seeds.spawn(1)[0])]
+        statistics = self.groups[key]
+        arrays = {channel: np.asarray(values, dtype=np.float64) for channel, values in arrays.items()}
+        for channel, values in arrays.items():
+            statistics[channel].check_shape(values)
+
+        reservoir = self._reservoirs[key]
+        reservoir[0] += 1
+        slot = reservoir_slot(reservoir[0], self.sample_size, reservoir[1])
+        for channel, values in arrays.items():
+            statistics[channel].add(values, slot)
+
+    def summary(self, tag: dict = None) -> dict:
+        """
+        Returns the statistics of one group as dictionary channel -> {"count", "mean", "variance", "quantiles"}.
+        """
+        key = _group_key(tag)
+        return {channel: {"count": statistics.count, "mean": statistics.mean, "variance": statistics.variance,
+                          "quantiles": statistics.quantiles(self.quantile_levels)}
+                for channel, statistics in self.groups[key].items()}
+
+    def save(self, filename: str):
+        """
+        Writes all groups to one compressed .npz file, see :py:func:`load_aggregation`.
+        """
+        arrays = {}
+        metadata = {"channels": self.channels, "quantiles": list(self.quantile_levels), "groups": [],
+                    "failures": self.failures}
+        for index, (key, statistics) in enumerate(self.groups.items()):
+            metadata["groups"].append({"tags": self.tags[key],
+                                       "count": {channel: s.count for channel, s in statistics.items()}})
+            for channel, channel_summary in self.summary(self.tags[key]).items():
+                for name in ["mean", "variance", "quantiles"]:
+                    arrays[f"{index}/{channel}/{name}"] = channel_summary[name]
+        arrays["metadata"] = np.array(json.dumps(metadata))
+        with open(filename, "wb") as npz_file:
+            np.savez_compressed(npz_file, **arrays)
+
+
+def load_aggregation(filename: str) -> dict:
+    """
+    Reads a file written by :py:meth:`AggregationResult.save`.
+
+    Returns:
+        Dictionary with "channels", "quantiles", "failures" and "groups", a list of dictionaries with the "tags",
+        and for every channel a dictionary with "count", "mean", "variance" and "quantiles"
+    """
+    with np.load(filename) as npz_file:
+        metadata = json.loads(str(npz_file["metadata"]))
+        for index, group in enumerate(metadata["groups"]):
+            for channel in metadata["channels"]:
+                group[channel] = {name: npz_file[f"{index}/{channel}/{name}"]
+                                  for name in ["mean", "variance", "quantiles"]}
+                group[channel]["count"] = group["count"][channel]
+            del group["count"]
+    return metadata
+
+
+def _results(reporter_class, output_dirs: list, channels: list, parameters: dict,
+             processes: int) -> Iterator[tuple]:
+    if processes == 1:
+        for index, output_dir in enumerate(output_dirs):
+            try:
+                yield index, _read_channels(reporter_class, output_dir, channels, parameters), None
+            except Exception as error:
+                yield index, None, error
+        return
+
+    # keep a bounded number of results in flight so finished simulations are reduced before more are read, results
+    # are yielded in the order of output_dirs so the reservoir samples the same simulations for the same seed
+    max_in_flight = 2 * (processes or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        pending = {}
+        finished = {}
+        next_index = 0
+        next_result = 0
+        while next_result < len(output_dirs):
+            while next_index < len(output_dirs) and len(pending) + len(finished) < max_in_flight:
+                future = executor.submit(_read_channels, reporter_class, output_dirs[next_index], channels,
+                                         parameters)
+                pending[future] = next_index
+                next_index += 1
+            if next_result not in finished:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    finished[pending.pop(future)] = (None if error else future.result(), error)
+            while next_result in finished:
+                arrays, error = finished.pop(next_result)
+                yield next_result, arrays, error
+                next_result += 1
+
+
+def aggregate_reports(output_dirs: list, reporter_class, channels: list, tags: list = None,
+                      parameters: dict = None, quantiles=DEFAULT_QUANTILES, sample_size: int = 200,
+                      processes: int = None, seed: int = 0, output_file: str = None,
+                      raise_errors: bool = False) -> AggregationResult:
+    """
+    Reads channels of a report from many simulation output directories and reduces them per group of tags.
+
+    Args:
+        output_dirs: simulation output directories
+        reporter_class: built-in reporter class with a CSV, InsetChart-style, MalariaSummaryReport or spatial
+            report reader, see CHANNEL_READERS, e.g. :py:class:`emodpy_malaria.reporters.builtin.MalariaSummaryReport`
+        channels: channels (CSV columns, JSON channels or summary report channels) to aggregate
+        tags: list of dictionaries, the tags of each output directory, e.g. the calibration parameters.
+            Simulations with the same tags are aggregated together. Defaults to one group.
+        parameters: the reporter's parameters, used to find the report file, e.g. {"Filename_Suffix": "Annual"}
+        quantiles: quantile levels that are estimated
+        sample_size: reservoir size for quantile estimation per group and channel
+        processes: number of worker processes, None uses all CPUs, 1 reads in this process
+        seed: seed of the reservoir sampling
+        output_file: if set, the result is saved to this .npz file
+        raise_errors: if False, directories that can't be read are recorded in the result's failures
+
+    Returns:
+        :py:class:`AggregationResult`
+
+    Raises:
+        TypeError: reporter_class doesn't read channels, e.g. the SQL and FPG reports
+    """
+    if not (isinstance(reporter_class, type) and issubclass(reporter_class, CHANNEL_READERS)):
+        raise TypeError(f"{getattr(reporter_class, '__name__', reporter_class)} can't be aggregated, use a reporter "
+                        f"with one of the readers {[reader.__name__ for reader in CHANNEL_READERS]}.")
+    if tags is not None and len(tags) != len(output_dirs):
+        raise ValueError(f"Got {len(tags)} tags for {len(output_dirs)} output directories.")
+    output_dirs = [str(output_dir) for output_dir in output_dirs]
+    result = AggregationResult(channels, quantiles, sample_size, seed)
+    for index, arrays, error in _results(reporter_class, output_dirs, channels, parameters, processes):
+        if error is not None:
+            if raise_errors:
+                raise error
+            result.failures[output_dirs[index]] = f"{type(error).__name__}: {error}"
+            continue
+        try:
+            result.add(tags[index] if tags else None, arrays)
+        except ValueError as error:
+            if raise_errors:
+                raise
+            result.failures[output_dirs[index]] = f"{type(error).__name__}: {error}"
+
+    if output_file:
+        result.save(output_file)
+    return result
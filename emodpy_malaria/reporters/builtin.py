@@ -1,10 +1,16 @@
 from dataclasses import dataclass, field
 
 from emodpy.reporters.base import BuiltInReporter
+from emodpy_malaria.reporters.readers import CsvReportReader, InsetChartReportReader, SummaryReportReader, \
+    SpatialReportReader
+from emodpy_malaria.reporters.sql_reports import SqlReportReader
+from emodpy_malaria.reporters.fpg import FpgReportReader
 from emod_api import schema_to_class as s2c
 import os
 import sys
 import json
+import functools
+import inspect
 import urllib.request
 
 
@@ -50,25 +56,39 @@ def add_visualizations(task):
     """
         Adds pointer files that create visualization for reports relevant to malaria.
         Currently, "AllInsets", "BinnedReport", "MalariaInterventions", "MalariaSummaryReport"
-        
+        The sites are downloaded once per session and pointer files already in the task's assets are skipped.
+
     Args:
         task:  task to which to add the pointer files as assets
 
     Returns:
         Nothing
     """
+    existing_assets = {asset.filename for asset in task.common_assets}
+    for site, pointer in _visualization_pointers():
+        pointer_file_name = f"{site}.html"
+        if pointer_file_name in existing_assets:
+            continue
+        with open(pointer_file_name, "w") as pointer_file:
+            pointer_file.write(pointer)
+        task.common_assets.add_asset(pointer_file_name, fail_on_duplicate=False)
+
+
+@functools.lru_cache(maxsize=None)
+def _visualization_pointers():
+    """
+        Downloads the visualization sites relevant to malaria once per session.
+
+    Returns:
+        A tuple of (site, url) pairs
+    """
     relevant_diseases = ["generic", "malaria"]
     sites = []
     with urllib.request.urlopen(vis_url) as vis_file:
         vis = json.load(vis_file)
     for disease in relevant_diseases:
         sites.extend(vis["diseases"][disease])
-    for site in sites:
-        pointer = vis["sites"][site]["url"]
-        pointer_file_name = f"{site}.html"
-        with open(pointer_file_name, "w") as pointer_file:
-            pointer_file.write(pointer)
-        task.common_assets.add_asset(pointer_file_name, fail_on_duplicate=False)
+    return tuple((site, vis["sites"][site]["url"]) for site in sites)
 
 
 def add_report_vector_genetics(task, manifest,
@@ -1487,13 +1507,156 @@ def add_report_simulation_stats(task, manifest):
         return reporter
 
 
+_REPORT_FUNCTIONS = {
+    "ReportVectorGenetics": "add_report_vector_genetics",
+    "ReportVectorStats": "add_report_vector_stats",
+    "MalariaSummaryReport": "add_malaria_summary_report",
+    "MalariaPatientJSONReport": "add_malaria_patient_json_report",
+    "ReportSimpleMalariaTransmission": "add_malaria_cotransmission_report",
+    "ReportMalariaFiltered": "add_report_malaria_filtered",
+    "ReportMalariaFilteredIntraHost": "add_report_malaria_filtered_intrahost",
+    "SpatialReportMalariaFiltered": "add_spatial_report_malaria_filtered",
+    "ReportEventCounter": "add_report_event_counter",
+    "SqlReportMalaria": "add_sql_report_malaria",
+    "SqlReportMalariaGenetics": "add_sql_report_malaria_genetics",
+    "VectorHabitatReport": "add_vector_habitat_report",
+    "MalariaImmunityReport": "add_malaria_immunity_report",
+    "MalariaSurveyJSONAnalyzer": "add_malaria_survey_analyzer",
+    "ReportDrugStatus": "add_drug_status_report",
+    "ReportInfectionStatsMalaria": "add_report_infection_stats_malaria",
+    "ReportHumanMigrationTracking": "add_human_migration_tracking",
+    "ReportNodeDemographics": "add_report_node_demographics",
+    "ReportNodeDemographicsMalaria": "add_report_node_demographics_malaria",
+    "ReportNodeDemographicsMalariaGenetics": "add_report_node_demographics_malaria_genetics",
+    "ReportVectorMigration": "add_report_vector_migration",
+    "ReportVectorStatsMalariaGenetics": "add_report_vector_stats_malaria_genetics",
+    "ReportEventRecorder": "add_event_recorder",
+    "ReportInterventionPopAvg": "add_report_intervention_pop_avg",
+    "ReportMicrosporidia": "add_report_microsporidia",
+    "ReportFpgOutputForObservationalModel": "add_report_fpg_output",
+    "ReportSimulationStats": "add_report_simulation_stats",
+}
+
+
+def _load_report_spec(spec):
+    """
+        Returns the list of report entries of a spec given as list, dictionary, or JSON or YAML file name.
+    """
+    if isinstance(spec, (str, os.PathLike)):
+        with open(spec, "r") as spec_file:
+            if str(spec).lower().endswith(".json"):
+                spec = json.load(spec_file)
+            else:
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("Reading a YAML report spec requires PyYAML, please install it with "
+                                      "'pip install pyyaml' or pass the spec as a dictionary.")
+                spec = yaml.safe_load(spec_file)
+    if isinstance(spec, dict):
+        spec = spec.get("reports", spec)
+    if isinstance(spec, dict):  # {report: parameters or list of parameters}
+        entries = []
+        for report, parameters in spec.items():
+            for report_parameters in (parameters if isinstance(parameters, list) else [parameters]):
+                entries.append(dict(report_parameters or {}, report=report))
+        return entries
+    return [dict(entry) for entry in spec]
+
+
+def add_reports(task, manifest, spec):
+    """
+    Adds several reports to the simulation in one pass. Every reporter is first configured without the task by its
+    add function, so invalid parameter names and values (e.g. outside the schema's min and max or not one of its
+    enum values) are reported for all entries at once before any report is added. The add functions are then
+    called with the task, which also runs their checks on the task's config, e.g. of the vectors or Malaria_Model.
+
+    Args:
+        task: task to which to add the reporters, if left as None, the reporters are returned (used for unittests)
+        manifest: schema path file
+        spec: the reports and their parameters, either a list of dictionaries with the key "report" (the reporter's
+            class name, e.g. "ReportVectorStats", or the name of its add function, e.g. "add_report_vector_stats")
+            and the keyword arguments of the add function, a dictionary {"reports": list}, a dictionary
+            {report: parameters or list of parameters}, or the name of a JSON or YAML file with one of these.
+            For example::
+
+                reports:
+                  - report: ReportVectorStats
+                    stratify_by_species: true
+                  - report: MalariaSummaryReport
+                    age_bins: [5, 15, 125]
+                    reporting_interval: 365
+
+    Returns:
+        if task is not set, returns the list of configured reporters, otherwise returns nothing
+
+    Raises:
+        ValueError: Unknown reports or invalid parameters, the message lists all problems in the spec.
+    """
+    entries = _load_report_spec(spec)
+    module = sys.modules[__name__]
+    calls = []
+    errors = []
+    for index, entry in enumerate(entries):
+        report = entry.pop("report", None)
+        name = _REPORT_FUNCTIONS.get(report, report if str(report).startswith("add_") else f"add_{report}")
+        function = getattr(module, name, None) if report else None
+        if function is None or name not in _REPORT_FUNCTIONS.values():
+            errors.append(f"entry {index}: unknown report '{report}'")
+            continue
+        signature = inspect.signature(function)
+        if "manifest" in signature.parameters:
+            entry["manifest"] = manifest
+        try:
+            signature.bind(task, **entry)
+        except TypeError as error:
+            errors.append(f"entry {index} ({report}): {error}")
+            continue
+        if not task and name == "add_event_recorder":
+            errors.append(f"entry {index} ({report}): ReportEventRecorder is configured in the task's config and "
+                          f"needs a task")
+            continue
+        calls.append((index, report, name, function, entry))
+    if errors:
+        raise ValueError("Invalid report spec:\n    " + "\n    ".join(errors) + "\n")
+
+    # the reporters are configured without the task first, which checks the values against the schema
+    reporters = []
+    for index, report, name, function, entry in calls:
+        if name == "add_event_recorder":  # checked by the task's config as the values are set
+            continue
+        try:
+            reporters.append(function(None, **entry))
+        except (ValueError, KeyError) as error:
+            errors.append(f"entry {index} ({report}): {error}")
+    if errors:
+        raise ValueError("Invalid report spec:\n    " + "\n    ".join(errors) + "\n")
+    if not task:
+        return reporters
+
+    for index, report, name, function, entry in calls:
+        function(task, **entry)
+
+
 @dataclass
-class ReportVectorGenetics(BuiltInReporter):
+class ReportVectorGenetics(CsvReportReader, BuiltInReporter):
     """
         The vector genetics report is a CSV-formatted report (ReportVectorGenetics.csv) that collects
         information on how many vectors of each genome/allele combination exist at each time, node,
         and vector state. Information can only be collected on one species per report.
     """
+    report_name = "ReportVectorGenetics"
+    categorical_columns = ["Species", "State"]
+
+    @classmethod
+    def column_types(cls, parameters: dict = None) -> tuple:
+        categorical, integer = super().column_types(parameters)
+        stratify_by = parameters.get("Stratify_By") if parameters else None
+        if stratify_by in [None, "GENOME", "SPECIFIC_GENOME"]:
+            categorical.append("Genome")
+        if stratify_by in [None, "ALLELE", "ALLELE_FREQ"]:
+            categorical.append("Alleles")
+        return categorical, integer
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportVectorGenetics"  # OK to hardcode? config["class"]
@@ -1505,10 +1668,12 @@ class ReportVectorGenetics(BuiltInReporter):
 
 
 @dataclass
-class ReportInfectionStatsMalaria(BuiltInReporter):
+class ReportInfectionStatsMalaria(CsvReportReader, BuiltInReporter):
     """
         ReportInfectionStatsMalaria
     """
+    report_name = "ReportInfectionStatsMalaria"
+    integer_columns = ["NodeID", "IndividualID", "InfectionID"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportInfectionStatsMalaria"  # OK to hardcode? config["class"]
@@ -1520,12 +1685,14 @@ class ReportInfectionStatsMalaria(BuiltInReporter):
 
 
 @dataclass
-class ReportVectorStats(BuiltInReporter):
+class ReportVectorStats(CsvReportReader, BuiltInReporter):
     """
         The vector statistics report is a CSV-formatted report (ReportVectorStats.csv) that provides detailed
         life-cycle data on the vectors in the simulation. The report is stratified by time, node ID,
         and (optionally) species.
     """
+    report_name = "ReportVectorStats"
+    parameter_categorical_columns = {"Stratify_By_Species": ["Species"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportVectorStats"  # OK to hardcode? config["class"]
@@ -1537,7 +1704,7 @@ class ReportVectorStats(BuiltInReporter):
 
 
 @dataclass
-class MalariaSummaryReport(BuiltInReporter):
+class MalariaSummaryReport(SummaryReportReader, BuiltInReporter):
     """
         The population-level malaria summary report is a JSON-formatted report (MalariaSummaryReport.json) that provides
         a summary of malaria data across the population. The data are grouped into different bins such as age,
@@ -1572,13 +1739,16 @@ class MalariaPatientJSONReport(BuiltInReporter):
 
 
 @dataclass
-class ReportSimpleMalariaTransmission(BuiltInReporter):
+class ReportSimpleMalariaTransmission(CsvReportReader, BuiltInReporter):
     """
         The simple malaria transmission report (ReportSimpleMalariaTransmission.csv) is a csv report that
         provides data on malaria transmission, by tracking who transmitted malaria to whom.  The report can only be used
         when the simulation setup parameter **Malaria_Model** is set to MALARIA_MECHANISTIC_MODEL_WITH_CO_TRANSMISSION.
         This report is typically used as input to the GenEpi model.
     """
+    report_name = "ReportSimpleMalariaTransmission"
+    integer_columns = ["acquireIndividualId", "transmitIndividualId"]
+    text_columns = ["acquireInfectionIds", "transmitInfectionIds", "transmitGametocyteDensities"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportSimpleMalariaTransmission"
@@ -1590,12 +1760,13 @@ class ReportSimpleMalariaTransmission(BuiltInReporter):
 
 
 @dataclass
-class ReportMalariaFiltered(BuiltInReporter):
+class ReportMalariaFiltered(InsetChartReportReader, BuiltInReporter):
     """
         The malaria filtered report (ReportMalariaFiltered.json) is the same as the default InsetChart report, but
         provides filtering options to enable the user to select the data to be displayed for each time step or for
         each node. See InsetChart for more information about InsetChart.json.
     """
+    report_name = "ReportMalariaFiltered"
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportMalariaFiltered"
@@ -1607,13 +1778,14 @@ class ReportMalariaFiltered(BuiltInReporter):
 
 
 @dataclass
-class SpatialReportMalariaFiltered(BuiltInReporter):
+class SpatialReportMalariaFiltered(SpatialReportReader, BuiltInReporter):
     """
         The filtered malaria spatial report (SpatialReportMalariaFiltered.bin) provides spatial information on malaria
         simulations and allows for filtering the data and collection over different intervals. This report is similar to
         the Spatial output report but allows for data collection and filtering over different intervals using the
         Start_Day and a Reporting_Interval parameters
     """
+    report_name = "SpatialReportMalariaFiltered"
 
     def config(self, config_builder, manifest):
         self.class_name = "SpatialReportMalariaFiltered"
@@ -1625,10 +1797,11 @@ class SpatialReportMalariaFiltered(BuiltInReporter):
 
 
 @dataclass
-class ReportMalariaFilteredIntraHost(BuiltInReporter):
+class ReportMalariaFilteredIntraHost(InsetChartReportReader, BuiltInReporter):
     """
         The filtered malaria spatial report (ReportMalariaFilteredIntraHost.bin) provides TBD
     """
+    report_name = "ReportMalariaFilteredIntraHost"
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportMalariaFilteredIntraHost"
@@ -1640,12 +1813,13 @@ class ReportMalariaFilteredIntraHost(BuiltInReporter):
 
 
 @dataclass
-class ReportEventCounter(BuiltInReporter):
+class ReportEventCounter(InsetChartReportReader, BuiltInReporter):
     """
         The event counter report is a JSON-formatted file (ReportEventCounter.json) that keeps track of how many of
         each event types occurs during a time step. The report produced is similar to the InsetChart.json channel
         report, where there is one channel for each event defined in the configuration file (config.json).
     """
+    report_name = "ReportEventCounter"
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportEventCounter"
@@ -1657,12 +1831,13 @@ class ReportEventCounter(BuiltInReporter):
 
 
 @dataclass
-class SqlReportMalariaGenetics(BuiltInReporter):
+class SqlReportMalariaGenetics(SqlReportReader, BuiltInReporter):
     """
         The SqlReportMalariaGenetics outputs epidemiological and transmission data. Because of the quantity and complexity of
         the data, the report output is a multi-table SQLite relational database (see https://sqlitebrowser.org/).
         Use the configuration parameters to manage the size of the database.
     """
+    report_name = "SqlReportMalariaGenetics"
 
     def config(self, config_builder, manifest):
         self.class_name = "SqlReportMalariaGenetics"
@@ -1674,12 +1849,13 @@ class SqlReportMalariaGenetics(BuiltInReporter):
 
 
 @dataclass
-class SqlReportMalaria(BuiltInReporter):
+class SqlReportMalaria(SqlReportReader, BuiltInReporter):
     """
         The SqlReportMalaria outputs epidemiological and transmission data. This report does not contain any genomics
         data. Because of the quantity and complexity of the data, the report output is a multi-table SQLite relational
         database (see https://sqlitebrowser.org/). Use the configuration parameters to manage the size of the database.
     """
+    report_name = "SqlReportMalaria"
 
     def config(self, config_builder, manifest):
         self.class_name = "SqlReportMalaria"
@@ -1741,12 +1917,15 @@ class MalariaSurveyJSONAnalyzer(BuiltInReporter):
 
 
 @dataclass
-class ReportDrugStatus(BuiltInReporter):
+class ReportDrugStatus(CsvReportReader, BuiltInReporter):
     """
         The drug status report provides status information on the drugs that an individual has taken or is waiting to
         take. Because the report provides information for each drug, for each individual, and for each time step, you
         may want to use the Start_Day and End_Day parameters to limit the size the output file.
     """
+    report_name = "ReportDrugStatus"
+    categorical_columns = ["Drug_Name", "Gender"]
+    integer_columns = ["NodeID", "IndividualID"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportDrugStatus"
@@ -1758,12 +1937,15 @@ class ReportDrugStatus(BuiltInReporter):
 
 
 @dataclass
-class ReportHumanMigrationTracking(BuiltInReporter):
+class ReportHumanMigrationTracking(CsvReportReader, BuiltInReporter):
     """
         The human migration tracking report is a CSV-formatted report (ReportHumanMigrationTracking.csv) that provides
         details about human travel during simulations. The report provides one line for each surviving individual who
         migrates during the simulation.
     """
+    report_name = "ReportHumanMigrationTracking"
+    categorical_columns = ["Gender", "Event", "MigrationType"]
+    integer_columns = ["IndividualID", "From_NodeID", "To_NodeID"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportHumanMigrationTracking"
@@ -1775,11 +1957,14 @@ class ReportHumanMigrationTracking(BuiltInReporter):
 
 
 @dataclass
-class ReportNodeDemographics(BuiltInReporter):
+class ReportNodeDemographics(CsvReportReader, BuiltInReporter):
     """
         The node demographics report is a CSV-formatted report (ReportNodeDemographics.csv) that provides population
         information stratified by node. For each time step, the report collects data on each node and age bin.
     """
+    report_name = "ReportNodeDemographics"
+    categorical_columns = ["NodeProperty"]
+    parameter_categorical_columns = {"Stratify_By_Gender": ["Gender"], "IP_Key_To_Collect": ["IndividualProp"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportNodeDemographics"
@@ -1791,7 +1976,7 @@ class ReportNodeDemographics(BuiltInReporter):
 
 
 @dataclass
-class ReportNodeDemographicsMalaria(BuiltInReporter):
+class ReportNodeDemographicsMalaria(CsvReportReader, BuiltInReporter):
     """
     This report extends the data collected in the ReportNodeDemographics by adding data about the number of
     infections with specific barcodes. The malaria node demographics genetics report does not include columns for
@@ -1801,6 +1986,10 @@ class ReportNodeDemographicsMalaria(BuiltInReporter):
     Note: If you need detailed data on the infections with different barcodes, use the SqlReportMalaria. That report
     contains data on all barcodes, without specifying what they are.
     """
+    report_name = "ReportNodeDemographicsMalaria"
+    categorical_columns = ["NodeProperty"]
+    parameter_categorical_columns = {"Stratify_By_Gender": ["Gender"], "IP_Key_To_Collect": ["IndividualProp"],
+                                     "Stratify_By_Has_Clinical_Symptoms": ["HasClinicalSymptoms"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportNodeDemographicsMalaria"
@@ -1812,7 +2001,7 @@ class ReportNodeDemographicsMalaria(BuiltInReporter):
 
 
 @dataclass
-class ReportNodeDemographicsMalariaGenetics(BuiltInReporter):
+class ReportNodeDemographicsMalariaGenetics(CsvReportReader, BuiltInReporter):
     """
     This report extends the data collected in the ReportNodeDemographics by adding data about the number of
     infections with specific barcodes. The malaria node demographics genetics report does not include columns for
@@ -1822,6 +2011,9 @@ class ReportNodeDemographicsMalariaGenetics(BuiltInReporter):
     Note: If you need detailed data on the infections with different barcodes, use the SqlReportMalaria. That report
     contains data on all barcodes, without specifying what they are.
     """
+    report_name = "ReportNodeDemographicsMalariaGenetics"
+    categorical_columns = ["NodeProperty"]
+    parameter_categorical_columns = {"Stratify_By_Gender": ["Gender"], "IP_Key_To_Collect": ["IndividualProp"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportNodeDemographicsMalariaGenetics"
@@ -1833,12 +2025,16 @@ class ReportNodeDemographicsMalariaGenetics(BuiltInReporter):
 
 
 @dataclass
-class ReportVectorMigration(BuiltInReporter):
+class ReportVectorMigration(CsvReportReader, BuiltInReporter):
     """
         This report provides detailed information on where and when vectors are migrating.  Because there can be one
         line for each migrating vector, you may want to use the Start_Day and End_Day parameters to limit the
         size the output file.
     """
+    report_name = "ReportVectorMigration"
+    categorical_columns = ["Species", "State", "MigrationType"]
+    integer_columns = ["ID", "FromNodeID", "ToNodeID"]
+    parameter_categorical_columns = {"Include_Genome_Data": ["Genome"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportVectorMigration"
@@ -1850,13 +2046,15 @@ class ReportVectorMigration(BuiltInReporter):
 
 
 @dataclass
-class ReportVectorStatsMalariaGenetics(BuiltInReporter):
+class ReportVectorStatsMalariaGenetics(CsvReportReader, BuiltInReporter):
     """
     This report extends the data collected in the ReportVectorStats by adding data about the number of
     infections with specific barcodes. The malaria node demographics genetics report does not include columns for
     Genome_Markers because this report assumes that the simulation setup parameter Malaria_Model is set to
     MALARIA_MECHANISTIC_MODEL_WITH_PARASITE_GENETICS.
     """
+    report_name = "ReportVectorStatsMalariaGenetics"
+    parameter_categorical_columns = {"Stratify_By_Species": ["Species"]}
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportVectorStatsMalariaGenetics"
@@ -1868,7 +2066,7 @@ class ReportVectorStatsMalariaGenetics(BuiltInReporter):
 
 
 @dataclass
-class ReportInterventionPopAvg(BuiltInReporter):
+class ReportInterventionPopAvg(CsvReportReader, BuiltInReporter):
     """
     ReportInterventionPopAvg is a CSV-formatted report that gives population average
     data on the usage of interventions.  It provides data on the fraction of people
@@ -1879,6 +2077,8 @@ class ReportInterventionPopAvg(BuiltInReporter):
     the data will be for that one intervention.  The individual-level interventions
     will have data for the people in that node.
     """
+    report_name = "ReportInterventionPopAvg"
+    categorical_columns = ["Intervention_Name"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportInterventionPopAvg"
@@ -1890,7 +2090,7 @@ class ReportInterventionPopAvg(BuiltInReporter):
 
 
 @dataclass
-class ReportFpgOutputForObservationalModel(BuiltInReporter):
+class ReportFpgOutputForObservationalModel(FpgReportReader, BuiltInReporter):
     """
     ReportFpgOutputForObservationalModel generates two files:
     infIndexRecursive-genomes-df.csv - This file will be the list of infected people in each node
@@ -1910,11 +2110,12 @@ class ReportFpgOutputForObservationalModel(BuiltInReporter):
 
 
 @dataclass
-class ReportSimulationStats(BuiltInReporter):
+class ReportSimulationStats(CsvReportReader, BuiltInReporter):
     """
     Adds ReportSimulationStats to collect data on the computational performance of the model
     (duration, memory, number of persisted interventions, etc).
     """
+    report_name = "ReportSimulationStats"
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportSimulationStats"
@@ -1926,12 +2127,14 @@ class ReportSimulationStats(BuiltInReporter):
 
 
 @dataclass
-class ReportMicrosporidia(BuiltInReporter):
+class ReportMicrosporidia(CsvReportReader, BuiltInReporter):
     """
     ReportMicrosporidia generates a ReportMicrosporidia.csv. It is a stratified report where the data is stratified
     by time, node, species and microsporidia strain; with columns of counts of vectors in each state for that
     stratification.
     """
+    report_name = "ReportMicrosporidia"
+    categorical_columns = ["Species", "MicrosporidiaStrain"]
 
     def config(self, config_builder, manifest):
         self.class_name = "ReportMicrosporidia"
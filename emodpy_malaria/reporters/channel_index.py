@@ -0,0 +1,205 @@
+"""
+Lazy channel access for InsetChart-style JSON reports, e.g. ReportMalariaFiltered.json or ReportEventCounter.json.
+
+The file is scanned once for the byte span of the "Data" array of every channel. The spans are kept in a small
+index file next to the report (<report>.idx), so later opens of the same file don't scan it again, and a
+channel is decoded into a NumPy array only when it is accessed, reading only its own bytes::
+
+    from emodpy_malaria.reporters.builtin import ReportMalariaFiltered
+
+    report = ReportMalariaFiltered.open("output")
+    pfpr = report["PfHRP2 Prevalence"]                              # float64 array
+    df = report.read(["Infected", "New Clinical Cases"])            # pandas DataFrame
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.streaming import _Scanner, _ArrayParser, DEFAULT_CHUNK_SIZE
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+def _utf8(text: str) -> str:
+    # the file is decoded as latin-1 so that character positions are byte offsets, keys are decoded again as UTF-8
+    try:
+        return text.encode("latin-1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+
+def _file_stamp(path: str) -> list:
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def scan_channel_spans(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple:
+    """
+    Scans an InsetChart-style JSON file for the byte spans of the channels' "Data" arrays.
+
+    Returns:
+        Tuple of the "Header" dictionary and a dictionary channel -> [start, end, units] with the byte offsets of
+        the channel's "Data" array
+    """
+    header = {}
+    channels = {}
+    with open(path, "r", encoding="latin-1", newline="") as handle:
+        scanner = _Scanner(handle, chunk_size)
+        scanner.expect("{")
+        if scanner.peek() == "}":
+            return header, channels
+        while True:
+            key = _utf8(scanner.read_string())
+            scanner.expect(":")
+            if key == "Header":
+                header = json.loads(scanner.scan_value(record=True).encode("latin-1").decode("utf-8"))
+            elif key == "Channels" and scanner.peek() == "{":
+                _scan_channels(scanner, channels)
+            else:
+                scanner.scan_value(record=False)
+            if scanner.peek() == ",":
+                scanner.pos += 1
+                continue
+            scanner.expect("}")
+            return header, channels
+
+
+def _scan_channels(scanner: _Scanner, channels: dict):
+    scanner.expect("{")
+    if scanner.peek() == "}":
+        scanner.pos += 1
+        return
+    while True:
+        name = _utf8(scanner.read_string())
+        scanner.expect(":")
+        span = [None, None, ""]
+        scanner.expect("{")
+        while scanner.peek() != "}":
+            key = scanner.read_string()
+            scanner.expect(":")
+            if key == "Data":
+                scanner.peek()
+                span[0] = scanner.position
+                scanner.scan_value(record=False)
+                span[1] = scanner.position
+            elif key == "Units":
+                span[2] = _utf8(json.loads(scanner.scan_value(record=True)))
+            else:
+                scanner.scan_value(record=False)
+            if scanner.peek() == ",":
+                scanner.pos += 1
+        scanner.pos += 1
+        if span[0] is not None:
+            channels[name] = span
+        if scanner.peek() == ",":
+            scanner.pos += 1
+            continue
+        scanner.expect("}")
+        return
+
+
+class LazyInsetChart:
+    """
+    Read-only view of an InsetChart-style JSON report that decodes channels on access.
+
+    Args:
+        path: path to the JSON file
+        cache: if True the index is read from and written to index_path
+        index_path: path of the index file, defaults to the report's path with the suffix ".idx". An index
+            that doesn't match the size and modification time of the report is rebuilt.
+        dtype: dtype of the decoded arrays
+    """
+    def __init__(self, path: str, cache: bool = True, index_path: str = None, dtype=np.float64):
+        self.path = path
+        self.dtype = dtype
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self._arrays = {}
+        index = self._load_index() if cache else None
+        if index is None:
+            header, spans = scan_channel_spans(path)
+            index = {"Version": INDEX_VERSION, "File": _file_stamp(path), "Header": header, "Channels": spans}
+            if cache:
+                self._save_index(index)
+        self.header = index["Header"]
+        self._spans = index["Channels"]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return None
+        if index.get("Version") != INDEX_VERSION or index.get("File") != _file_stamp(self.path):
+            return None
+        return index
+
+    def _save_index(self, index: dict):
+        try:
+            with open(self.index_path, "w") as index_file:
+                json.dump(index, index_file)
+        except OSError:
+            pass    # e.g. a read-only output directory, the index is rebuilt the next time
+
+    @property
+    def channels(self) -> list:
+        """Names of the channels in the order of the file."""
+        return list(self._spans)
+
+    def units(self, channel: str) -> str:
+        """Units of a channel."""
+        return self._spans[channel][2]
+
+    def __contains__(self, channel: str) -> bool:
+        return channel in self._spans
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __getitem__(self, channel: str) -> np.ndarray:
+        if channel not in self._arrays:
+            self._load([channel])
+        return self._arrays[channel]
+
+    def _load(self, channels: list):
+        missing = [channel for channel in channels if channel not in self._spans]
+        if missing:
+            raise KeyError(f"Channels {missing} not in {self.path}.")
+        # read the spans in file order
+        todo = sorted((self._spans[channel][0], self._spans[channel][1], channel) for channel in channels
+                      if channel not in self._arrays)
+        with open(self.path, "rb") as report_file:
+            for start, end, channel in todo:
+                report_file.seek(start)
+                parser = _ArrayParser(self.dtype)
+                text = ""
+                remaining = end - start
+                while remaining > 0:
+                    chunk = report_file.read(min(remaining, DEFAULT_CHUNK_SIZE)).decode("ascii")
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    text = text[parser.feed(text):] + chunk
+                parser.feed(text)
+                self._arrays[channel] = parser.result()
+
+    def read(self, channels: list = None) -> pd.DataFrame:
+        """
+        Decodes channels into a DataFrame.
+
+        Args:
+            channels: channels to read, None reads all channels
+
+        Returns:
+            A pandas DataFrame with one column per channel and one row per time step
+        """
+        channels = self.channels if channels is None else list(channels)
+        self._load(channels)
+        df = pd.DataFrame({channel: self._arrays[channel] for channel in channels})
+        df.index.name = "Time_Step"
+        return df
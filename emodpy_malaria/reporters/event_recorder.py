@@ -0,0 +1,133 @@
+"""
+Conversion of ReportEventRecorder.csv to a Parquet dataset and filtered reads of the dataset.
+
+The event recorder (see :py:func:`emodpy_malaria.reporters.builtin.add_event_recorder`) writes one row per event
+with the event name and the individual properties repeated as strings. The converter streams the CSV in chunks,
+stores the event names and the other text columns dictionary-encoded and writes Parquet files partitioned by node
+and year, so reads of some events in a time window only touch the matching files and columns::
+
+    from emodpy_malaria.reporters.event_recorder import convert_event_recorder, read_event_recorder
+
+    convert_event_recorder("output/ReportEventRecorder.csv", "output/events")
+    df = read_event_recorder("output/events", events=["Received_Treatment"], start_time=365, end_time=730)
+
+Requires pyarrow (pip install pyarrow).
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.readers import csv_dtypes, read_csv_header
+
+EVENT_RECORDER_FILENAME = "ReportEventRecorder.csv"
+DAYS_PER_YEAR = 365
+PARTITION_COLUMNS = ["Node_ID", "Year"]
+INTEGER_COLUMNS = ["Node_ID", "Individual_ID"]
+CATEGORICAL_COLUMNS = ["Event_Name", "Gender"]
+FLOAT_COLUMNS = ["Time", "Age", "Infected", "Infectiousness"]
+# columns every event recorder writes, the columns after them are the individual properties
+FIXED_COLUMNS = ["Time", "Node_ID", "Event_Name", "Individual_ID", "Age", "Gender", "Infected", "Infectiousness"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet support requires pyarrow, please install it with 'pip install pyarrow'.")
+    return pyarrow
+
+
+def convert_event_recorder(csv_path: str, dataset_dir: str, chunk_size: int = 1_000_000,
+                           partition_by_year: bool = True, compression: str = "zstd",
+                           individual_properties: list = None) -> int:
+    """
+    Converts a ReportEventRecorder.csv to a Parquet dataset partitioned by node (and year).
+
+    Args:
+        csv_path: path to ReportEventRecorder.csv, or the output directory holding it
+        dataset_dir: directory of the dataset, Parquet files of earlier conversions in it are deleted
+        chunk_size: number of rows read and written at a time
+        partition_by_year: if True files are partitioned by node and year (Time // 365), else by node only
+        compression: Parquet compression codec
+        individual_properties: the individual property columns, Report_Event_Recorder_Individual_Properties,
+            None for all columns after the ones every event recorder writes
+
+    Returns:
+        Number of rows converted
+    """
+    pa = _pyarrow()
+    if os.path.isdir(csv_path):
+        csv_path = os.path.join(csv_path, EVENT_RECORDER_FILENAME)
+    # text columns, i.e. Event_Name, Gender and the individual properties, are read as categoricals
+    if individual_properties is None:
+        individual_properties = [name for name in read_csv_header(csv_path) if name not in FIXED_COLUMNS]
+    dtypes = csv_dtypes(csv_path, CATEGORICAL_COLUMNS + list(individual_properties), INTEGER_COLUMNS, FLOAT_COLUMNS)
+    partition_columns = PARTITION_COLUMNS if partition_by_year else PARTITION_COLUMNS[:1]
+
+    for root, _, files in os.walk(dataset_dir):
+        for filename in files:
+            if filename.endswith(".parquet"):
+                os.remove(os.path.join(root, filename))
+
+    rows = 0
+    reader = pd.read_csv(csv_path, engine="c", skipinitialspace=True, dtype=dtypes, chunksize=chunk_size)
+    for index, chunk in enumerate(reader):
+        if partition_by_year:
+            chunk["Year"] = (chunk["Time"] // DAYS_PER_YEAR).astype(np.int32)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        pa.parquet.write_to_dataset(table, dataset_dir, partition_cols=partition_columns,
+                                    basename_template=f"part-{index}-{{i}}.parquet",
+                                    existing_data_behavior="overwrite_or_ignore", compression=compression)
+        rows += len(chunk)
+    return rows
+
+
+def read_event_recorder(dataset_dir: str, events: list = None, start_time: float = None, end_time: float = None,
+                        node_ids: list = None, columns: list = None) -> pd.DataFrame:
+    """
+    Reads events from a dataset written by :py:func:`convert_event_recorder`. Filters on nodes and years skip whole
+    files, filters on events and times are applied while reading.
+
+    Args:
+        dataset_dir: directory of the dataset
+        events: event names to read, None reads all events
+        start_time: first Time included
+        end_time: last Time included
+        node_ids: nodes to read, None reads all nodes
+        columns: columns to read, None reads all columns
+
+    Returns:
+        A pandas DataFrame sorted by Time with categorical Event_Name and individual property columns
+    """
+    pa = _pyarrow()
+    dataset = pa.dataset.dataset(dataset_dir, format="parquet", partitioning="hive")
+    field = pa.dataset.field
+    names = dataset.schema.names
+    conditions = []
+    if events is not None:
+        conditions.append(field("Event_Name").isin(list(events)))
+    if node_ids is not None:
+        conditions.append(field("Node_ID").isin([int(node_id) for node_id in node_ids]))
+    if start_time is not None:
+        conditions.append(field("Time") >= start_time)
+        if "Year" in names:
+            conditions.append(field("Year") >= int(start_time // DAYS_PER_YEAR))
+    if end_time is not None:
+        conditions.append(field("Time") <= end_time)
+        if "Year" in names:
+            conditions.append(field("Year") <= int(end_time // DAYS_PER_YEAR))
+    condition = None
+    for expression in conditions:
+        condition = expression if condition is None else condition & expression
+
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = table.to_pandas()
+    for name in PARTITION_COLUMNS:
+        if name in df.columns:
+            df[name] = df[name].astype(np.int64)    # partition values are read back as int32
+    if "Time" in df.columns:
+        df = df.sort_values("Time", kind="stable").reset_index(drop=True)
+    return df
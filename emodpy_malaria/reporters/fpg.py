@@ -0,0 +1,207 @@
+"""
+Sparse genome matrices from the output of ReportFpgOutputForObservationalModel.
+
+The report writes infIndexRecursive-genomes-df.csv, one row per sampled infected person with the indexes of the
+person's genomes ("recursive_nid", e.g. "[3, 17, 17]") and, with include_genome_ids, their hash codes, and
+variantsXXX_afFPG.npy, the 0/1 barcode of every genome index. The reader turns these into
+
+- a CSR matrix person x genome holding how often a genome occurs in the person,
+- a uint8 matrix genome x barcode position, with genomes of identical barcodes merged into one column,
+
+which can be stored as .npy files and memory-mapped, and offers vectorized pairwise identity-by-state (IBS)::
+
+    from emodpy_malaria.reporters.builtin import ReportFpgOutputForObservationalModel
+
+    fpg = ReportFpgOutputForObservationalModel.read("output")
+    ibs = pairwise_ibs(fpg.barcodes)                 # genome x genome
+    within_host = fpg.within_host_ibs()              # mean IBS of the genomes of each polygenomic person
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+INFECTIONS_FILENAME = "infIndexRecursive-genomes-df.csv"
+VARIANTS_PATTERN = "variants*_afFPG.npy"
+GENOME_INDEX_COLUMN = "recursive_nid"
+LIST_COLUMNS = ["recursive_nid", "genome_ids"]
+
+
+def parse_list_column(column: pd.Series, dtype=np.int64) -> tuple:
+    """
+    Parses a column of lists written as text, e.g. "[3, 17, 17]", without creating Python lists.
+
+    Returns:
+        Tuple of the flattened values and the number of values in each row
+    """
+    text = column.astype(str).str.strip().str.strip("[]").str.strip()
+    lengths = np.where(text.str.len() > 0, text.str.count(",") + 1, 0).astype(np.int64)
+    joined = ",".join(text[lengths > 0])
+    values = np.fromstring(joined, dtype=dtype, sep=",") if joined else np.empty(0, dtype=dtype)
+    if len(values) != lengths.sum():
+        raise ValueError(f"Column {column.name} holds values that are not {np.dtype(dtype).name}.")
+    return values, lengths
+
+
+class FpgGenomeMatrix:
+    """
+    Sparse representation of the FPG output.
+
+    Attributes:
+        people: DataFrame with one row per sampled person (the CSV without its list columns)
+        person_genome: CSR matrix people x genomes, the number of times each genome occurs in the person
+        barcodes: uint8 matrix genomes x barcode positions, one row per distinct barcode
+        genome_index: for every genome (column), the first genome index of the variants file with its barcode
+        genome_map: for every genome index of the variants file, its column in person_genome or -1 if the genome
+            doesn't occur in the samples
+    """
+    def __init__(self, people: pd.DataFrame, person_genome: sparse.csr_matrix, barcodes: np.ndarray,
+                 genome_index: np.ndarray, genome_map: np.ndarray):
+        self.people = people
+        self.person_genome = person_genome
+        self.barcodes = barcodes
+        self.genome_index = genome_index
+        self.genome_map = genome_map
+
+    @classmethod
+    def from_files(cls, infections_csv: str, variants_npy: str, deduplicate: bool = True) -> "FpgGenomeMatrix":
+        """
+        Parses the FPG output files.
+
+        Args:
+            infections_csv: path to infIndexRecursive-genomes-df.csv
+            variants_npy: path to variantsXXX_afFPG.npy
+            deduplicate: if True genomes with identical barcodes share one column
+        """
+        people = pd.read_csv(infections_csv, engine="c", skipinitialspace=True)
+        indexes, lengths = parse_list_column(people[GENOME_INDEX_COLUMN])
+        people = people.drop(columns=[name for name in LIST_COLUMNS if name in people.columns])
+
+        variants = np.load(variants_npy, mmap_mode="r")
+        used, used_inverse = np.unique(indexes, return_inverse=True)
+        used_barcodes = np.asarray(variants[used], dtype=np.uint8)
+        if deduplicate:
+            barcodes, first, barcode_of_used = np.unique(used_barcodes, axis=0, return_index=True,
+                                                         return_inverse=True)
+            barcode_of_used = barcode_of_used.reshape(-1)
+            # keep the columns in order of first genome index
+            order = np.argsort(first, kind="stable")
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            barcodes = barcodes[order]
+            columns_of_used = rank[barcode_of_used]
+            genome_index = used[first[order]]
+        else:
+            barcodes = used_barcodes
+            columns_of_used = np.arange(len(used))
+            genome_index = used
+
+        genome_map = np.full(len(variants), -1, dtype=np.int64)
+        genome_map[used] = columns_of_used
+        rows = np.repeat(np.arange(len(people)), lengths)
+        person_genome = sparse.csr_matrix((np.ones(len(indexes), dtype=np.int32),
+                                           (rows, columns_of_used[used_inverse.reshape(-1)])),
+                                          shape=(len(people), len(barcodes)))
+        person_genome.sum_duplicates()
+        return cls(people, person_genome, np.ascontiguousarray(barcodes), genome_index, genome_map)
+
+    @property
+    def complexity_of_infection(self) -> np.ndarray:
+        """Number of distinct genomes of every person."""
+        return np.diff(self.person_genome.indptr)
+
+    def genomes_of(self, person: int) -> np.ndarray:
+        """Columns of the genomes of the person in row person of people."""
+        return self.person_genome.indices[self.person_genome.indptr[person]:self.person_genome.indptr[person + 1]]
+
+    def within_host_ibs(self) -> np.ndarray:
+        """
+        Mean pairwise IBS of the distinct genomes of every person, NaN for people with a single genome.
+        """
+        result = np.full(len(self.people), np.nan)
+        coi = self.complexity_of_infection
+        for person in np.nonzero(coi > 1)[0]:
+            ibs = pairwise_ibs(self.barcodes[self.genomes_of(person)])
+            upper = np.triu_indices(len(ibs), k=1)
+            result[person] = ibs[upper].mean()
+        return result
+
+    def save(self, directory: str):
+        """Writes the matrices as .npy files and the people as CSV to directory, see :py:meth:`load`."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"person_genome_data": self.person_genome.data, "person_genome_indices": self.person_genome.indices,
+                  "person_genome_indptr": self.person_genome.indptr, "barcodes": self.barcodes,
+                  "genome_index": self.genome_index, "genome_map": self.genome_map}
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        self.people.to_csv(os.path.join(directory, "people.csv"), index=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "FpgGenomeMatrix":
+        """
+        Reads matrices written with :py:meth:`save`.
+
+        Args:
+            directory: directory passed to save()
+            mmap: if True the arrays are memory-mapped read-only instead of read into memory
+        """
+        mmap_mode = "r" if mmap else None
+
+        def load_array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        people = pd.read_csv(os.path.join(directory, "people.csv"))
+        barcodes = load_array("barcodes")
+        person_genome = sparse.csr_matrix((load_array("person_genome_data"), load_array("person_genome_indices"),
+                                           load_array("person_genome_indptr")),
+                                          shape=(len(people), len(barcodes)), copy=False)
+        return cls(people, person_genome, barcodes, load_array("genome_index"), load_array("genome_map"))
+
+
+def pairwise_ibs(barcodes: np.ndarray, other: np.ndarray = None, block_size: int = 4096) -> np.ndarray:
+    """
+    Fraction of identical barcode positions for all pairs of genomes.
+
+    Args:
+        barcodes: 0/1 matrix genomes x positions
+        other: optional second 0/1 matrix, defaults to barcodes
+        block_size: number of rows of barcodes compared at a time
+
+    Returns:
+        float32 matrix len(barcodes) x len(other)
+    """
+    other = barcodes if other is None else other
+    num_positions = barcodes.shape[1]
+    if other.shape[1] != num_positions:
+        raise ValueError(f"Barcodes have {num_positions} and {other.shape[1]} positions.")
+    other_ones = np.asarray(other, dtype=np.float32)
+    other_zeros = 1 - other_ones
+    result = np.empty((len(barcodes), len(other)), dtype=np.float32)
+    for start in range(0, len(barcodes), block_size):
+        ones = np.asarray(barcodes[start:start + block_size], dtype=np.float32)
+        matches = ones @ other_ones.T + (1 - ones) @ other_zeros.T
+        result[start:start + block_size] = matches / num_positions
+    return result
+
+
+def find_variants_file(output_dir: str) -> str:
+    """Returns the path to the variants file in output_dir."""
+    matches = sorted(glob.glob(os.path.join(output_dir, VARIANTS_PATTERN)))
+    if len(matches) != 1:
+        raise FileNotFoundError(f"Expected one {VARIANTS_PATTERN} in {output_dir}, found {matches}.")
+    return matches[0]
+
+
+class FpgReportReader:
+    """
+        Adds ``read()`` to ReportFpgOutputForObservationalModel.
+    """
+    @classmethod
+    def read(cls, output_dir: str, deduplicate: bool = True) -> FpgGenomeMatrix:
+        """
+            Parses the report's files in a simulation's output directory, see :py:class:`FpgGenomeMatrix`.
+        """
+        return FpgGenomeMatrix.from_files(os.path.join(output_dir, INFECTIONS_FILENAME),
+                                          find_variants_file(output_dir), deduplicate)
@@ -0,0 +1,311 @@
+"""
+Estimates of the size of the output of configured reporters.
+
+Some reporters can write very large files, e.g. ReportVectorGenetics stratified by genome, ReportDrugStatus,
+ReportVectorMigration, the SQL reports or ReportEventRecorder without an event filter. The estimator predicts the
+number of rows and bytes of every report of a task from the reporter parameters and the scale of the simulation
+so oversized configurations can be caught before the simulations are submitted::
+
+    from emodpy_malaria.reporters.output_size import SimulationScale, check_output_size
+
+    scale = SimulationScale.from_task(task, population=100_000, num_nodes=50)
+    check_output_size(task, scale, threshold_bytes=5e9)    # raises ValueError listing the reports over 5 GB
+
+The estimates are upper-bound style orders of magnitude (e.g. every person is assumed to be on a drug for
+ReportDrugStatus), not byte-exact predictions.
+"""
+from dataclasses import dataclass, field
+from typing import List
+
+DAYS_PER_YEAR = 365
+DEFAULT_THRESHOLD_BYTES = 10 * 1024 ** 3
+EVENT_RECORDER = "ReportEventRecorder"
+
+
+@dataclass
+class SimulationScale:
+    """
+    Size of a simulation used to estimate the output of its reports.
+
+    Args:
+        num_nodes: number of nodes
+        population: total number of humans
+        duration_days: Simulation_Duration
+        species: vector species names
+        genes_alleles: for every species, the number of alleles of each gene
+        vectors_per_node: number of adult vectors per node and species
+        infections_per_person: average number of concurrent infections per person
+        events_per_person_per_year: individual events per person and year for each listened event
+        events_in_simulation: number of distinct events recorded if ReportEventRecorder records all events
+        vector_migration_fraction: fraction of vectors migrating each day
+        human_migrations_per_year: migrations per person and year
+    """
+    num_nodes: int = 1
+    population: int = 1000
+    duration_days: float = DAYS_PER_YEAR
+    species: List[str] = field(default_factory=list)
+    genes_alleles: dict = field(default_factory=dict)
+    vectors_per_node: int = 10000
+    infections_per_person: float = 0.5
+    events_per_person_per_year: float = 2.0
+    events_in_simulation: int = 30
+    vector_migration_fraction: float = 0.01
+    human_migrations_per_year: float = 1.0
+
+    @classmethod
+    def from_task(cls, task, population: int = None, num_nodes: int = None, **kwargs) -> "SimulationScale":
+        """
+        Reads duration, species and genes from the task's config and nodes and population from its demographics.
+        Values that are passed in take precedence.
+        """
+        parameters = task.config.parameters
+        species = []
+        genes_alleles = {}
+        for species_params in parameters.Vector_Species_Params or []:
+            species.append(species_params["Name"])
+            genes_alleles[species_params["Name"]] = [len(gene["Alleles"]) for gene in species_params.get("Genes", [])]
+
+        demographics = getattr(task, "demographics", None)
+        nodes = getattr(demographics, "nodes", None) or []
+        if num_nodes is None:
+            num_nodes = max(len(nodes), 1)
+        if population is None:
+            population = sum(node.node_attributes.initial_population or 0 for node in nodes) or cls.population
+        return cls(num_nodes=num_nodes, population=population, duration_days=parameters.Simulation_Duration,
+                   species=species, genes_alleles=genes_alleles, **kwargs)
+
+
+@dataclass
+class ReportEstimate:
+    """
+    Estimated output of one report.
+    """
+    report: str
+    rows: float
+    bytes: float
+    flagged: bool = False
+
+    def __str__(self):
+        return f"{self.report}: ~{self.rows:,.0f} rows, ~{self.bytes / 1024 ** 2:,.1f} MB"
+
+
+def _days(parameters: dict, scale: SimulationScale) -> float:
+    start = parameters.get("Start_Day", 0)
+    end = min(parameters.get("End_Day", scale.duration_days), scale.duration_days)
+    return max(end - start, 0)
+
+
+def _nodes(parameters: dict, scale: SimulationScale) -> int:
+    node_ids = parameters.get("Node_IDs_Of_Interest") or []
+    return len(node_ids) if node_ids else scale.num_nodes
+
+
+def _species(parameters: dict, scale: SimulationScale, key: str) -> list:
+    species = parameters.get(key)
+    if isinstance(species, str):
+        return [species]
+    return list(species or scale.species or [None])
+
+
+def _vector_genetics(parameters, scale):
+    alleles = scale.genes_alleles.get(parameters.get("Species"), [])
+    stratify_by = parameters.get("Stratify_By", "GENOME")
+    if stratify_by == "GENOME":
+        strata = 1
+        for num_alleles in alleles:
+            strata *= num_alleles * (num_alleles + 1) // 2     # diploid genotypes of a gene
+    elif stratify_by == "SPECIFIC_GENOME":
+        strata = len(parameters.get("Specific_Genome_Combinations_For_Stratification") or []) or 1
+    else:
+        strata = len(parameters.get("Alleles_For_Stratification") or []) or sum(alleles) or 1
+        strata += len(parameters.get("Allele_Combinations_For_Stratification") or [])
+    columns = 6 + (10 if parameters.get("Include_Vector_State_Columns", 1) else 0) + \
+        (10 if parameters.get("Include_Death_By_State_Columns", 0) else 0)
+    rows = _days(parameters, scale) * _nodes(parameters, scale) * strata
+    return rows, 8 * columns + 6 * len(alleles)
+
+
+def _vector_stats(parameters, scale):
+    species = len(_species(parameters, scale, "Species_List")) if parameters.get("Stratify_By_Species", 0) else 1
+    columns = 30 + sum(10 for key in ["Include_Death_By_State_Columns", "Include_Wolbachia_Columns",
+                                      "Include_Gestation_Columns", "Include_Microsporidia_Columns"]
+                       if parameters.get(key, 0))
+    columns += len(parameters.get("Barcodes") or [])
+    return scale.duration_days * scale.num_nodes * species, 8 * columns
+
+
+def _drug_status(parameters, scale):
+    return _days(parameters, scale) * scale.population, 80
+
+
+def _vector_migration(parameters, scale):
+    vectors = scale.num_nodes * scale.vectors_per_node * max(len(scale.species), 1)
+    return _days(parameters, scale) * vectors * scale.vector_migration_fraction, 60
+
+
+def _sql_report(parameters, scale):
+    days = _days(parameters, scale)
+    rows, size = scale.population, 40.0 * scale.population      # Humans table
+    infections = scale.population * scale.infections_per_person
+    rows += infections * days / 30                              # Infections table, ~monthly turnover
+    size += 30 * infections * days / 30
+    if parameters.get("Include_Health_Table", 1):
+        rows += days * scale.population
+        size += 60 * days * scale.population
+    if parameters.get("Include_Infection_Data_Table", 1):
+        rows += days * infections
+        size += 40 * days * infections
+    if parameters.get("Include_Drug_Status_Table", 0):
+        rows += days * scale.population
+        size += 50 * days * scale.population
+    return rows, size / rows if rows else 0
+
+
+def _infection_stats(parameters, scale):
+    reports = _days(parameters, scale) / max(parameters.get("Reporting_Interval", 1), 1)
+    return reports * scale.population * scale.infections_per_person, 70
+
+
+def _patient_report(parameters, scale):
+    return scale.population, 12 * 10 * _days(parameters, scale)     # ~10 channels per person and day
+
+
+def _node_demographics(parameters, scale):
+    strata = (len(parameters.get("Age_Bins") or []) or 1) * (2 if parameters.get("Stratify_By_Gender", 1) else 1)
+    strata *= 2 if parameters.get("Stratify_By_Has_Clinical_Symptoms", 0) else 1
+    columns = 15 + len(parameters.get("Barcodes") or []) + len(parameters.get("Drug_Resistant_Strings") or []) + \
+        len(parameters.get("HRP_Strings") or [])
+    return scale.duration_days * scale.num_nodes * strata, 8 * columns
+
+
+def _human_migration(parameters, scale):
+    return scale.population * scale.duration_days / DAYS_PER_YEAR * scale.human_migrations_per_year, 70
+
+
+def _fpg_output(parameters, scale):
+    samples = _days(parameters, scale) / max(parameters.get("Sampling_Period", 1), 1)
+    return samples * scale.population * scale.infections_per_person, 60
+
+
+def _spatial_report(parameters, scale):
+    reports = _days(parameters, scale) / max(parameters.get("Reporting_Interval", 1), 1)
+    channels = len(parameters.get("Spatial_Output_Channels") or []) or 1
+    return reports * _nodes(parameters, scale) * channels, 4
+
+
+def _summary_report(parameters, scale):
+    reports = _days(parameters, scale) / max(parameters.get("Reporting_Interval", 1), 1)
+    max_reports = parameters.get("Max_Number_Reports", 0) or reports
+    bins = (len(parameters.get("Age_Bins") or []) or 1) * \
+        ((len(parameters.get("Parasitemia_Bins") or []) or 1) + (len(parameters.get("Infectiousness_Bins") or []) or 1))
+    return min(reports, max_reports), 12 * 20 * bins
+
+
+def _daily_channels(parameters, scale):
+    return _days(parameters, scale), 12 * 40
+
+
+def _intervention_pop_avg(parameters, scale):
+    return _days(parameters, scale) * _nodes(parameters, scale) * 5, 80
+
+
+_ESTIMATORS = {
+    "ReportVectorGenetics": _vector_genetics,
+    "ReportVectorStats": _vector_stats,
+    "ReportVectorStatsMalariaGenetics": _vector_stats,
+    "ReportDrugStatus": _drug_status,
+    "ReportVectorMigration": _vector_migration,
+    "SqlReportMalaria": _sql_report,
+    "SqlReportMalariaGenetics": _sql_report,
+    "ReportInfectionStatsMalaria": _infection_stats,
+    "MalariaPatientJSONReport": _patient_report,
+    "ReportNodeDemographics": _node_demographics,
+    "ReportNodeDemographicsMalaria": _node_demographics,
+    "ReportNodeDemographicsMalariaGenetics": _node_demographics,
+    "ReportHumanMigrationTracking": _human_migration,
+    "ReportFpgOutputForObservationalModel": _fpg_output,
+    "SpatialReportMalariaFiltered": _spatial_report,
+    "MalariaSummaryReport": _summary_report,
+    "ReportMalariaFiltered": _daily_channels,
+    "ReportMalariaFilteredIntraHost": _daily_channels,
+    "ReportEventCounter": _daily_channels,
+    "ReportInterventionPopAvg": _intervention_pop_avg,
+}
+
+
+def estimate_report(class_name: str, parameters: dict, scale: SimulationScale) -> ReportEstimate:
+    """
+    Estimates the output of one report.
+
+    Args:
+        class_name: the reporter's class, e.g. "ReportVectorGenetics"
+        parameters: the reporter's parameters
+        scale: size of the simulation
+
+    Returns:
+        :py:class:`ReportEstimate`, or None if there is no estimator for the report
+    """
+    estimator = _ESTIMATORS.get(class_name)
+    if estimator is None:
+        return None
+    rows, bytes_per_row = estimator(parameters, scale)
+    return ReportEstimate(class_name, rows, rows * bytes_per_row)
+
+
+def estimate_event_recorder(config_parameters, scale: SimulationScale) -> ReportEstimate:
+    """
+    Estimates the output of ReportEventRecorder configured with the Report_Event_Recorder config parameters.
+
+    Returns:
+        :py:class:`ReportEstimate`, or None if the report is not enabled
+    """
+    if not config_parameters.get("Report_Event_Recorder", 0):
+        return None
+    events = config_parameters.get("Report_Event_Recorder_Events") or []
+    if config_parameters.get("Report_Event_Recorder_Ignore_Events_In_List", 0):
+        num_events = max(scale.events_in_simulation - len(events), 1)
+    else:
+        num_events = len(events)
+    parameters = {"Start_Day": config_parameters.get("Report_Event_Recorder_Start_Day", 0),
+                  "End_Day": config_parameters.get("Report_Event_Recorder_End_Day", scale.duration_days)}
+    years = _days(parameters, scale) / DAYS_PER_YEAR
+    rows = scale.population * years * num_events * scale.events_per_person_per_year
+    ips = len(config_parameters.get("Report_Event_Recorder_Individual_Properties") or [])
+    return ReportEstimate(EVENT_RECORDER, rows, rows * (60 + 12 * ips))
+
+
+def estimate_output_size(task, scale: SimulationScale = None,
+                         threshold_bytes: float = DEFAULT_THRESHOLD_BYTES) -> list:
+    """
+    Estimates the output of all built-in reporters of a task and of ReportEventRecorder.
+
+    Args:
+        task: task with configured reporters
+        scale: size of the simulation, defaults to :py:meth:`SimulationScale.from_task`
+        threshold_bytes: reports estimated above this size are flagged
+
+    Returns:
+        List of :py:class:`ReportEstimate`, largest first. Reporters without an estimator are left out.
+    """
+    scale = scale or SimulationScale.from_task(task)
+    estimates = [estimate_report(reporter.class_name, reporter.parameters, scale)
+                 for reporter in task.reporters.built_in_reporters]
+    estimates.append(estimate_event_recorder(task.config.parameters, scale))
+    estimates = [estimate for estimate in estimates if estimate is not None]
+    for estimate in estimates:
+        estimate.flagged = estimate.bytes > threshold_bytes
+    return sorted(estimates, key=lambda estimate: estimate.bytes, reverse=True)
+
+
+def check_output_size(task, scale: SimulationScale = None, threshold_bytes: float = DEFAULT_THRESHOLD_BYTES):
+    """
+    Checks that no report of a task is estimated to write more than threshold_bytes.
+
+    Raises:
+        ValueError: Reports are estimated above the threshold, the message lists them.
+    """
+    flagged = [estimate for estimate in estimate_output_size(task, scale, threshold_bytes) if estimate.flagged]
+    if flagged:
+        lines = "\n".join(f"    {estimate}" for estimate in flagged)
+        raise ValueError(f"These reports are estimated to write more than {threshold_bytes / 1024 ** 3:,.1f} GB, "
+                         f"use Start_Day/End_Day, node ids or fewer stratifications to limit them:\n{lines}\n")
@@ -0,0 +1,287 @@
+"""
+Vectorized reductions of report output for post-processing, e.g. in EMOD's embedded Python hook.
+
+CSV reports are read in chunks with explicit dtypes and reduced per chunk with pandas group-bys, so memory is
+bounded by the size of the reduced output rather than the size of the report. The reductions cover
+
+- node reductions: summing or averaging over nodes (or keeping strata such as "Species" or "NodeID"),
+- time reductions: downsampling daily output to weekly, monthly or yearly bins,
+- conversion of the result to an InsetChart-style JSON file,
+
+and InsetChart-style JSON files can be downsampled the same way. Used from dtk_post_process.py, the small
+reduced files replace the large originals before they are copied back from the cluster::
+
+    from emodpy_malaria.reporters.post_processing import convert_report_vector_stats
+
+    def application(output_path):
+        convert_report_vector_stats(output_path, by=["Species"], time_bin="weekly", remove_csv=True)
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.readers import csv_dtypes, read_csv_header
+from emodpy_malaria.reporters.streaming import read_json_values, _nest, SKIP, DESCEND, VALUE, ARRAY
+
+TIME_BINS = {"daily": 1, "weekly": 7, "monthly": 30, "yearly": 365}
+REDUCTIONS = ["sum", "mean"]
+VECTOR_STATS_FILENAME = "ReportVectorStats.csv"
+# columns that identify a row of ReportVectorStats.csv rather than hold a value
+KEY_COLUMNS = ["Time", "NodeID", "Species", "Genome"]
+
+
+def _time_bin_days(time_bin) -> int:
+    if isinstance(time_bin, str):
+        if time_bin not in TIME_BINS:
+            raise ValueError(f"Unknown time_bin '{time_bin}', use a number of days or one of {list(TIME_BINS)}.")
+        return TIME_BINS[time_bin]
+    if int(time_bin) < 1:
+        raise ValueError(f"time_bin must be at least one day, got {time_bin}.")
+    return int(time_bin)
+
+
+def _check_reduction(name: str, reduction: str):
+    if reduction not in REDUCTIONS:
+        raise ValueError(f"{name} must be one of {REDUCTIONS}, got '{reduction}'.")
+
+
+def bin_times(times, time_bin, start_time: float = None) -> np.ndarray:
+    """
+    Maps times to the start of their time bin.
+
+    Args:
+        times: array of times in days
+        time_bin: bin width in days or one of "daily", "weekly", "monthly" (30 days) or "yearly" (365 days)
+        start_time: start of the first bin, defaults to the first time
+
+    Returns:
+        Array with the start time of the bin of every time
+    """
+    times = np.asarray(times, dtype=np.float64)
+    days = _time_bin_days(time_bin)
+    if start_time is None:
+        start_time = times[0] if len(times) else 0
+    return start_time + (times - start_time) // days * days
+
+
+def reduce_csv_report(csv_path: str, value_columns: list = None, by: list = None, node_reduction: str = "sum",
+                      time_bin=None, time_reduction: str = "mean", chunk_size: int = 500_000,
+                      float_dtype=np.float64) -> pd.DataFrame:
+    """
+    Reduces a CSV report with a "Time" column over the rows of each time step and, optionally, over time bins.
+
+    Args:
+        csv_path: path to the CSV file
+        value_columns: columns to reduce, None reduces all columns except Time, NodeID, Species, Genome and by
+        by: columns kept as strata, e.g. ["Species"] or ["NodeID"], rows with the same Time and strata are reduced
+        node_reduction: "sum" or "mean" of the rows with the same Time and strata
+        time_bin: None keeps every time step, else the bin width in days or one of "daily", "weekly", "monthly"
+            and "yearly"
+        time_reduction: "mean" or "sum" of the time steps in a bin, e.g. "mean" for populations and "sum" for counts
+        chunk_size: number of rows read at a time
+        float_dtype: dtype of the value columns while reading
+
+    Returns:
+        A pandas DataFrame with a (Time, \\*by) index and one column per value column. With time_bin, Time is the
+        start of the bin.
+    """
+    _check_reduction("node_reduction", node_reduction)
+    _check_reduction("time_reduction", time_reduction)
+    by = list(by or [])
+    header = read_csv_header(csv_path)
+    if "Time" not in header:
+        raise ValueError(f"{csv_path} has no Time column.")
+    missing = set(by).difference(header)
+    if missing:
+        raise ValueError(f"Columns {sorted(missing)} not in {csv_path}, available columns are {header}.")
+    if value_columns is None:
+        value_columns = [name for name in header if name not in KEY_COLUMNS and name not in by]
+    else:
+        missing = set(value_columns).difference(header)
+        if missing:
+            raise ValueError(f"Columns {sorted(missing)} not in {csv_path}, available columns are {header}.")
+    keys = ["Time"] + by
+    columns = keys + list(value_columns)
+    dtypes = csv_dtypes(csv_path, categorical=[name for name in by if name != "NodeID"],
+                        integer=["NodeID"] if "NodeID" in header else None, floating=["Time"] + list(value_columns),
+                        float_dtype=float_dtype)
+    dtypes = {name: dtype for name, dtype in dtypes.items() if name in columns}
+
+    sums = []
+    counts = []
+    reader = pd.read_csv(csv_path, engine="c", skipinitialspace=True, usecols=columns, dtype=dtypes,
+                         chunksize=chunk_size)
+    for chunk in reader:
+        groups = chunk.groupby(keys, observed=True, sort=False)
+        sums.append(groups[value_columns].sum())
+        counts.append(groups.size())
+    if not sums:
+        return pd.DataFrame(columns=value_columns, index=pd.MultiIndex.from_tuples([], names=keys) if by else
+                            pd.Index([], name="Time"), dtype=np.float64)
+
+    # a time step may be split across two chunks, so the partial results are combined once more
+    df = pd.concat(sums).groupby(level=keys, sort=True).sum().astype(np.float64)
+    if node_reduction == "mean":
+        df = df.div(pd.concat(counts).groupby(level=keys, sort=True).sum(), axis=0)
+
+    if time_bin is not None:
+        df = df.reset_index()
+        df["Time"] = bin_times(df["Time"], time_bin)
+        groups = df.groupby(keys, sort=True)[value_columns]
+        df = groups.sum() if time_reduction == "sum" else groups.mean()
+    return df
+
+
+def to_channels(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turns the strata of a reduced report into channels: the value column "VectorPopulation" of the stratum
+    "arabiensis" becomes the column "VectorPopulation-arabiensis".
+
+    Args:
+        df: DataFrame returned by :py:func:`reduce_csv_report`
+
+    Returns:
+        A DataFrame indexed by Time with one column per value column and stratum, missing values are 0
+    """
+    if df.index.nlevels == 1:
+        return df
+    wide = df.unstack(level=list(range(1, df.index.nlevels)), fill_value=0)
+    wide.columns = ["-".join(str(name) for name in column) for column in wide.columns]
+    return wide
+
+
+def write_inset_chart(df: pd.DataFrame, json_path: str, units: dict = None, simulation_timestep: float = None,
+                      report_type: str = "InsetChart", indent: int = None):
+    """
+    Writes a DataFrame indexed by Time with one column per channel as an InsetChart-style JSON file.
+
+    Args:
+        df: the channels, e.g. the result of :py:func:`to_channels`
+        json_path: path of the JSON file
+        units: dictionary channel -> units, channels not listed have no units
+        simulation_timestep: time between the rows, defaults to the difference of the first two times
+        report_type: "Report_Type" of the header
+        indent: indentation of the JSON, None writes it compact
+    """
+    units = units or {}
+    times = np.asarray(df.index.get_level_values(0), dtype=np.float64)
+    if simulation_timestep is None:
+        simulation_timestep = float(times[1] - times[0]) if len(times) > 1 else 1
+    header = {"DateTime": "Unknown",
+              "DTK_Version": "Unknown",
+              "Report_Type": report_type,
+              "Report_Version": "1.0",
+              "Start_Time": float(times[0]) if len(times) else 0,
+              "Simulation_Timestep": simulation_timestep,
+              "Timesteps": len(df),
+              "Channels": len(df.columns)}
+    channels = {str(name): {"Units": units.get(name, ""), "Data": df[name].to_numpy(dtype=np.float64).tolist()}
+                for name in df.columns}
+    separators = None if indent else (",", ":")
+    with open(json_path, "w") as json_file:
+        json.dump({"Header": header, "Channels": channels}, json_file, indent=indent, separators=separators)
+
+
+def convert_csv_report(csv_path: str, json_path: str = None, value_columns: list = None, by: list = None,
+                       node_reduction: str = "sum", time_bin=None, time_reduction: str = "mean",
+                       remove_csv: bool = False, chunk_size: int = 500_000, indent: int = None) -> str:
+    """
+    Reduces a CSV report with :py:func:`reduce_csv_report` and writes the result as InsetChart-style JSON with one
+    channel per value column and stratum.
+
+    Args:
+        csv_path: path to the CSV file
+        json_path: path of the JSON file, defaults to csv_path with the extension .json
+        value_columns, by, node_reduction, time_bin, time_reduction, chunk_size: see :py:func:`reduce_csv_report`
+        remove_csv: if True the CSV file is deleted after the conversion
+        indent: indentation of the JSON, None writes it compact
+
+    Returns:
+        Path of the JSON file
+    """
+    if json_path is None:
+        json_path = os.path.splitext(csv_path)[0] + ".json"
+    df = reduce_csv_report(csv_path, value_columns, by, node_reduction, time_bin, time_reduction, chunk_size)
+    simulation_timestep = _time_bin_days(time_bin) if time_bin is not None else None
+    write_inset_chart(to_channels(df), json_path, simulation_timestep=simulation_timestep, indent=indent)
+    if remove_csv:
+        os.remove(csv_path)
+    return json_path
+
+
+def convert_report_vector_stats(output_path: str, by: list = None, time_bin=None, time_reduction: str = "mean",
+                                remove_csv: bool = False, filename: str = VECTOR_STATS_FILENAME,
+                                indent: int = None) -> str:
+    """
+    Converts ReportVectorStats.csv to ReportVectorStats.json with the values summed over all nodes, the
+    vectorized counterpart of ConvertReportVectorStats of the embedded Python examples.
+
+    Args:
+        output_path: the simulation's output directory
+        by: strata kept as separate channels, e.g. ["Species"] for "VectorPopulation-gambiae", ...
+        time_bin: None keeps every time step, else the bin width in days or "weekly", "monthly", ...
+        time_reduction: "mean" or "sum" of the time steps in a bin
+        remove_csv: if True the CSV file is deleted after the conversion
+        filename: name of the CSV file in output_path
+        indent: indentation of the JSON, None writes it compact
+
+    Returns:
+        Path of the JSON file
+    """
+    return convert_csv_report(os.path.join(output_path, filename), by=by, time_bin=time_bin,
+                              time_reduction=time_reduction, remove_csv=remove_csv, indent=indent)
+
+
+def downsample_inset_chart(json_path: str, output_path: str = None, time_bin="weekly", channels: list = None,
+                           sum_channels: list = None, indent: int = None) -> str:
+    """
+    Downsamples an InsetChart-style JSON file, e.g. InsetChart.json or ReportMalariaFiltered.json. The file is
+    streamed, only the selected channels are held in memory.
+
+    Args:
+        json_path: path to the JSON file
+        output_path: path of the downsampled file, None overwrites json_path
+        time_bin: the bin width in time steps or one of "weekly", "monthly" (30) and "yearly" (365)
+        channels: channels to keep, None keeps all channels
+        sum_channels: channels summed over a bin, e.g. "New Clinical Cases", all other channels are averaged
+        indent: indentation of the JSON, None writes it compact
+
+    Returns:
+        Path of the downsampled file
+    """
+    def select(value_path):
+        if value_path[0] != "Channels":
+            return VALUE
+        if len(value_path) == 1:
+            return DESCEND
+        if channels is not None and value_path[1] not in channels:
+            return SKIP
+        if len(value_path) == 2:
+            return DESCEND
+        return ARRAY if value_path[2] == "Data" else VALUE
+
+    report = _nest(read_json_values(json_path, select))
+    header = report.get("Header", {})
+    selected = report.get("Channels", {})
+    sum_channels = set(sum_channels or [])
+    days = _time_bin_days(time_bin)
+
+    downsampled = {}
+    for name, channel in selected.items():
+        data = np.asarray(channel["Data"], dtype=np.float64)
+        bins = np.arange(len(data)) // days
+        sums = np.bincount(bins, weights=data)
+        if name not in sum_channels:
+            sums = sums / np.bincount(bins)
+        downsampled[name] = {"Units": channel.get("Units", ""), "Data": sums.tolist()}
+
+    timesteps = max((len(channel["Data"]) for channel in downsampled.values()), default=0)
+    header = dict(header, Timesteps=timesteps, Channels=len(downsampled),
+                  Simulation_Timestep=header.get("Simulation_Timestep", 1) * days)
+    output_path = output_path or json_path
+    separators = None if indent else (",", ":")
+    with open(output_path, "w") as json_file:
+        json.dump({"Header": header, "Channels": downsampled}, json_file, indent=indent, separators=separators)
+    return output_path
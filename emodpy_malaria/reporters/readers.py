@@ -0,0 +1,345 @@
+"""
+Columnar readers for the output files of the built-in reporters.
+
+The readers are attached to the reporter classes in :py:mod:`emodpy_malaria.reporters.builtin` as ``read()``
+class methods, e.g.::
+
+    from emodpy_malaria.reporters.builtin import ReportVectorStats
+    df = ReportVectorStats.read("output", columns=["Time", "NodeID", "VectorPopulation"])
+
+CSV reports are parsed with the pandas C engine using explicit dtypes: key columns get integer types, string
+columns that follow from the reporter parameters (e.g. "Species" when stratifying by species) are read as
+categoricals and the dtypes of the other columns are inferred, with numbers read as floats.
+"""
+import csv
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.channel_index import LazyInsetChart
+from emodpy_malaria.reporters.streaming import stream_inset_chart, stream_malaria_summary_report
+
+
+def find_report_file(output_dir: str, base_name: str, extension: str, parameters: dict = None,
+                     filename: str = None) -> str:
+    """
+        Finds the output file of a report in output_dir.
+
+    Args:
+        output_dir: the simulation's output directory
+        base_name: name of the report file without extension, e.g. "ReportVectorStats"
+        extension: file extension including the dot, e.g. ".csv"
+        parameters: the reporter's parameters, used for "Filename_Suffix"
+        filename: explicit file name in output_dir, overrides the search
+
+    Returns:
+        Path to the report file
+
+    Raises:
+        FileNotFoundError: No or more than one matching report file in output_dir
+    """
+    if filename:
+        path = os.path.join(output_dir, filename)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Report file {path} not found.")
+        return path
+
+    suffix = parameters.get("Filename_Suffix", "") if parameters else ""
+    candidates = [base_name + extension]
+    if suffix:
+        candidates = [f"{base_name}_{suffix}{extension}", f"{base_name}{suffix}{extension}"]
+    for candidate in candidates:
+        path = os.path.join(output_dir, candidate)
+        if os.path.isfile(path):
+            return path
+
+    # Some reports add species, suffix, etc. to the file name
+    pattern = f"{base_name}*{suffix}*{extension}" if suffix else f"{base_name}*{extension}"
+    matches = sorted(glob.glob(os.path.join(output_dir, pattern)))
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        raise FileNotFoundError(f"No {base_name}{extension} found in {output_dir}.")
+    raise FileNotFoundError(f"Several report files match {pattern} in {output_dir}: {matches}, "
+                            f"please pass filename.")
+
+
+def read_csv_header(path: str) -> list:
+    """
+        Reads the column names of a CSV report.
+    """
+    with open(path, "r", newline="") as csv_file:
+        reader = csv.reader(csv_file, skipinitialspace=True)
+        return [name.strip() for name in next(reader, [])]
+
+
+def csv_dtypes(path: str, categorical: list = None, integer: list = None, floating: list = None,
+               float_dtype=np.float64, text: list = None) -> dict:
+    """
+        Explicit dtypes for the listed columns of a CSV report that are in its header.
+
+    Args:
+        path: path to the CSV file
+        categorical: columns read as pandas categoricals
+        integer: columns read as int64
+        floating: columns read as float_dtype
+        float_dtype: dtype of the floating columns
+        text: columns read as strings
+
+    Returns:
+        Dictionary column name -> dtype, without the columns of the header that aren't listed
+    """
+    dtypes = {}
+    for names, dtype in [(floating, float_dtype), (text, str), (integer, np.int64), (categorical, "category")]:
+        dtypes.update((name, dtype) for name in names or [])
+    return {name: dtypes[name] for name in read_csv_header(path) if name in dtypes}
+
+
+def read_csv_report(path: str, columns: list = None, categorical: list = None, integer: list = None,
+                    float_dtype=np.float64, text: list = None) -> pd.DataFrame:
+    """
+        Reads a CSV report with the pandas C engine and explicit dtypes for the known columns. The dtypes of the
+        other columns are inferred by pandas, numeric ones are converted to float_dtype and text ones are kept
+        as strings.
+
+    Args:
+        path: path to the CSV file
+        columns: columns to read, None reads all columns
+        categorical: columns read as pandas categoricals
+        integer: columns read as int64
+        float_dtype: dtype of the numeric columns that aren't listed, e.g. np.float32 to halve the memory
+        text: columns read as strings, e.g. lists of ids that look numeric when they have a single entry
+
+    Returns:
+        A pandas DataFrame
+    """
+    header = read_csv_header(path)
+    if columns is not None:
+        missing = set(columns).difference(header)
+        if missing:
+            raise ValueError(f"Columns {sorted(missing)} not in {path}, available columns are {header}.")
+    dtypes = csv_dtypes(path, categorical, integer, text=text)
+    if columns is not None:
+        dtypes = {name: dtype for name, dtype in dtypes.items() if name in columns}
+    df = pd.read_csv(path, engine="c", skipinitialspace=True, usecols=columns, dtype=dtypes)
+    for name in df.columns:
+        if name not in dtypes and pd.api.types.is_numeric_dtype(df[name]) and df[name].dtype != float_dtype:
+            df[name] = df[name].astype(float_dtype)
+    return df
+
+
+def read_inset_chart(path: str, channels: list = None) -> pd.DataFrame:
+    """
+        Reads an InsetChart-style JSON report (Header, Channels -> Data), e.g. ReportMalariaFiltered.json or
+        ReportEventCounter.json. The file is streamed, only the selected channels are held in memory.
+
+    Args:
+        path: path to the JSON file
+        channels: channels to read, None reads all channels
+
+    Returns:
+        A pandas DataFrame with one float64 column per channel and one row per time step
+    """
+    report = stream_inset_chart(path, channels)
+    available = report["Channels"]
+    if channels is None:
+        channels = list(available)
+    missing = set(channels).difference(available)
+    if missing:
+        raise ValueError(f"Channels {sorted(missing)} not in {path}.")
+    data = {channel: available[channel] for channel in channels}
+    df = pd.DataFrame(data)
+    df.index.name = "Time_Step"
+    return df
+
+
+def read_malaria_summary_report(path: str, channels: list = None) -> dict:
+    """
+        Reads a MalariaSummaryReport JSON file into NumPy arrays. The file is streamed, only the selected
+        channels are held in memory, see :py:mod:`emodpy_malaria.reporters.streaming`.
+
+    Args:
+        path: path to the JSON file
+        channels: channels to read from the "DataBy..." groups, None reads all channels
+
+    Returns:
+        Dictionary with the metadata ("Metadata", bins, ...) as in the file and, for every "DataBy..." group,
+        a dictionary channel -> float64 array. Arrays are indexed [time, ...bins].
+    """
+    return stream_malaria_summary_report(path, channels)
+
+
+def read_spatial_report(path: str) -> tuple:
+    """
+        Reads a binary spatial report channel, e.g. SpatialReportMalariaFiltered_Population.bin.
+
+        The file holds the number of nodes (int32), the number of time steps (int32), the node ids (uint32)
+        and the data (float32) for each time step and node.
+
+    Args:
+        path: path to the .bin file
+
+    Returns:
+        Tuple of the node ids and a float32 array indexed [time, node]
+    """
+    with open(path, "rb") as bin_file:
+        num_nodes, num_time_steps = np.fromfile(bin_file, dtype=np.int32, count=2)
+        node_ids = np.fromfile(bin_file, dtype=np.uint32, count=num_nodes)
+        data = np.fromfile(bin_file, dtype=np.float32, count=num_nodes * num_time_steps)
+    return node_ids, data.reshape(num_time_steps, num_nodes)
+
+
+class CsvReportReader:
+    """
+        Adds ``read()`` to reporters with a CSV output file.
+
+        Subclasses set report_name and list the text columns of the report in categorical_columns, or in
+        text_columns if they have few repeated values, and the id columns in integer_columns. Text columns that
+        only exist for some values of the reporter's parameters go into parameter_categorical_columns, parameter
+        name -> columns added when the parameter is set or not in the parameters, or are added by overriding
+        column_types(). The dtypes of all other columns are inferred, numeric columns are read as floats.
+    """
+    report_name = None
+    categorical_columns = []
+    integer_columns = ["NodeID"]
+    parameter_categorical_columns = {}
+    text_columns = []
+
+    @classmethod
+    def column_types(cls, parameters: dict = None) -> tuple:
+        """
+            The categorical and integer columns of the report for the reporter's parameters.
+
+        Args:
+            parameters: the reporter's parameters (reporter.parameters), None for all columns the report can have.
+                Parameters missing from the dictionary are treated as set.
+
+        Returns:
+            Tuple of the list of categorical columns and the list of integer columns
+        """
+        categorical = list(cls.categorical_columns)
+        for name, columns in cls.parameter_categorical_columns.items():
+            if parameters is None or name not in parameters or parameters[name]:
+                categorical.extend(columns)
+        return categorical, list(cls.integer_columns)
+
+    @classmethod
+    def read(cls, output_dir: str, columns: list = None, parameters: dict = None, filename: str = None,
+             float_dtype=np.float64) -> pd.DataFrame:
+        """
+            Reads the report's CSV file from a simulation's output directory.
+
+        Args:
+            output_dir: the simulation's output directory
+            columns: columns to read, None reads all columns
+            parameters: the reporter's parameters (reporter.parameters), used for the file name and the column types,
+                see column_types()
+            filename: explicit file name in output_dir
+            float_dtype: dtype of the value columns
+
+        Returns:
+            A pandas DataFrame
+        """
+        path = find_report_file(output_dir, cls.report_name, ".csv", parameters, filename)
+        categorical, integer = cls.column_types(parameters)
+        return read_csv_report(path, columns, categorical, integer, float_dtype, cls.text_columns)
+
+
+class InsetChartReportReader:
+    """
+        Adds ``read()`` to reporters with an InsetChart-style JSON output file.
+    """
+    report_name = None
+
+    @classmethod
+    def read(cls, output_dir: str, channels: list = None, parameters: dict = None,
+             filename: str = None) -> pd.DataFrame:
+        """
+            Reads the report's JSON file from a simulation's output directory.
+
+        Args:
+            output_dir: the simulation's output directory
+            channels: channels to read, None reads all channels
+            parameters: the reporter's parameters (reporter.parameters), used for the file name
+            filename: explicit file name in output_dir
+
+        Returns:
+            A pandas DataFrame with one column per channel
+        """
+        path = find_report_file(output_dir, cls.report_name, ".json", parameters, filename)
+        return read_inset_chart(path, channels)
+
+    @classmethod
+    def open(cls, output_dir: str, parameters: dict = None, filename: str = None,
+             cache: bool = True) -> LazyInsetChart:
+        """
+            Opens the report's JSON file for lazy channel access, see
+            :py:class:`emodpy_malaria.reporters.channel_index.LazyInsetChart`.
+
+        Args:
+            output_dir: the simulation's output directory
+            parameters: the reporter's parameters (reporter.parameters), used for the file name
+            filename: explicit file name in output_dir
+            cache: if True the channel index is kept in a file next to the report
+
+        Returns:
+            A LazyInsetChart
+        """
+        path = find_report_file(output_dir, cls.report_name, ".json", parameters, filename)
+        return LazyInsetChart(path, cache=cache)
+
+
+class SummaryReportReader:
+    """
+        Adds ``read()`` to MalariaSummaryReport.
+    """
+    report_name = "MalariaSummaryReport"
+
+    @classmethod
+    def read(cls, output_dir: str, channels: list = None, parameters: dict = None, filename: str = None) -> dict:
+        """
+            Reads the report's JSON file from a simulation's output directory, see
+            :py:func:`read_malaria_summary_report`.
+        """
+        path = find_report_file(output_dir, cls.report_name, ".json", parameters, filename)
+        return read_malaria_summary_report(path, channels)
+
+
+class SpatialReportReader:
+    """
+        Adds ``read()`` to reporters writing one binary file per channel, e.g. SpatialReportMalariaFiltered.
+    """
+    report_name = None
+
+    @classmethod
+    def read(cls, output_dir: str, channels: list = None, parameters: dict = None) -> dict:
+        """
+            Reads the report's channel files from a simulation's output directory.
+
+        Args:
+            output_dir: the simulation's output directory
+            channels: channels to read, e.g. ["Population"], None reads all channel files found
+            parameters: the reporter's parameters (reporter.parameters), used for "Filename_Suffix"
+
+        Returns:
+            Dictionary channel -> DataFrame with one row per reported time step and one float32 column per node id
+        """
+        suffix = parameters.get("Filename_Suffix", "") if parameters else ""
+        prefix = f"{cls.report_name}_{suffix}_" if suffix else f"{cls.report_name}_"
+        if channels is None:
+            paths = sorted(glob.glob(os.path.join(output_dir, prefix + "*.bin")))
+            channels = [os.path.basename(path)[len(prefix):-len(".bin")] for path in paths]
+            if not channels:
+                raise FileNotFoundError(f"No {prefix}*.bin found in {output_dir}.")
+        result = {}
+        for channel in channels:
+            path = os.path.join(output_dir, f"{prefix}{channel}.bin")
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Report file {path} not found.")
+            node_ids, data = read_spatial_report(path)
+            df = pd.DataFrame(data, columns=node_ids)
+            df.index.name = "Time_Step"
+            result[channel] = df
+        return result
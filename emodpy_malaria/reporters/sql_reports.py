@@ -0,0 +1,313 @@
+"""
+Read-only query layer for the SQLite databases written by SqlReportMalaria and SqlReportMalariaGenetics.
+
+The database is opened read-only with a large page cache and memory-mapped I/O and is never changed. Indexes on
+the columns used to filter and join (time, node, human, infection and genome ids) are created on request in a copy
+of the database, queries are parameterized and their results are returned in chunks, so large reports can be
+processed in bounded memory::
+
+    from emodpy_malaria.reporters.builtin import SqlReportMalaria
+
+    with SqlReportMalaria.read("output") as db:
+        db.create_indexes()     # copies the database to SqlReportMalaria_indexed.db and reads the copy
+        for df in db.query("SELECT * FROM Health WHERE SimTime >= ?", (365,), chunk_size=500_000):
+            ...
+        incidence = db.incidence_by_age_and_time(age_bins_years=[0, 5, 15, 125], time_bin_days=30)
+"""
+import os
+import sqlite3
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.readers import find_report_file
+
+DAYS_PER_YEAR = 365
+
+# Tables of the reports and the columns that get an index if the table has them
+HUMANS_TABLE = "Humans"
+INFECTIONS_TABLE = "Infections"
+HEALTH_TABLE = "Health"
+INFECTION_DATA_TABLE = "InfectionData"
+INDEXED_COLUMNS = ["SimTime", "NodeID", "HomeNodeID", "HumanID", "InfectionID", "GenomeID"]
+INDEXED_SUFFIX = "_indexed.db"
+
+DEFAULT_MMAP_SIZE = 1 << 30         # bytes
+DEFAULT_CACHE_SIZE = 1 << 18        # kibibytes
+
+
+def quote_identifier(name: str) -> str:
+    """Quotes a table, column or index name for use in SQL."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SqlReportDatabase:
+    """
+    Read-only connection to a SqlReportMalaria or SqlReportMalariaGenetics database.
+
+    Args:
+        filename: path to the database, it is only read
+        mmap_size: bytes of the database that are memory-mapped
+        cache_size: size of the page cache in kibibytes
+    """
+    def __init__(self, filename: str, mmap_size: int = DEFAULT_MMAP_SIZE, cache_size: int = DEFAULT_CACHE_SIZE):
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f"Database {filename} not found.")
+        self.filename = filename
+        self.index_file = None
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.connection = self._connect(read_only=True)
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        # only the indexed copy is ever opened for writing
+        filename = self.index_file or self.filename
+        mode = "ro" if read_only else "rw"
+        connection = sqlite3.connect(f"file:{filename}?mode={mode}", uri=True, cached_statements=256)
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        connection.execute(f"PRAGMA cache_size = -{int(self.cache_size)}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def tables(self) -> list:
+        """Names of the tables in the database."""
+        rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+        return [row[0] for row in rows]
+
+    def _table_info(self, table: str) -> list:
+        if table not in self.tables:
+            raise ValueError(f"Table '{table}' not in {self.filename}, available tables are {self.tables}.")
+        return self.connection.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall()
+
+    def columns(self, table: str) -> list:
+        """Names of the columns of a table."""
+        return [row[1] for row in self._table_info(table)]
+
+    def indexes(self) -> list:
+        """Names of the indexes in the database."""
+        rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+        return [row[0] for row in rows]
+
+    def create_indexes(self, columns: list = None, index_file: str = None) -> list:
+        """
+        Creates the missing indexes on time, node, human, infection and genome ids in a copy of the database and
+        reads the copy from then on, later queries on these columns don't need full table scans. The report's
+        database isn't changed. A copy that is older than the report's database is replaced.
+
+        Args:
+            columns: columns that get an index in every table that has them, defaults to INDEXED_COLUMNS
+            index_file: path of the copy, defaults to the report's file name with the suffix INDEXED_SUFFIX
+
+        Returns:
+            Names of the indexes that were created
+        """
+        columns = columns or INDEXED_COLUMNS
+        if index_file is None:
+            index_file = os.path.splitext(self.filename)[0] + INDEXED_SUFFIX
+        if os.path.abspath(index_file) == os.path.abspath(self.filename):
+            raise ValueError(f"The indexes are written to a copy, index_file must not be {self.filename}.")
+        if self.index_file is None or os.path.abspath(index_file) != os.path.abspath(self.index_file):
+            if not os.path.isfile(index_file) or os.path.getmtime(index_file) < os.path.getmtime(self.filename):
+                partial_file = index_file + ".partial"
+                copy = sqlite3.connect(partial_file)
+                try:
+                    self.connection.backup(copy)
+                finally:
+                    copy.close()
+                os.replace(partial_file, index_file)
+            self.connection.close()
+            self.index_file = index_file
+            self.connection = self._connect(read_only=True)
+
+        existing = set(self.indexes())
+        statements = {}
+        for table in self.tables:
+            info = self._table_info(table)
+            primary_keys = {row[1] for row in info if row[5]}
+            for column in [row[1] for row in info]:
+                name = f"idx_{table}_{column}"
+                if column in columns and column not in primary_keys and name not in existing:
+                    statements[name] = (f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} "
+                                        f"ON {quote_identifier(table)} ({quote_identifier(column)})")
+        if statements:
+            # the read-only connection may hold a shared lock, reopen it after writing
+            self.connection.close()
+            writer = self._connect(read_only=False)
+            try:
+                with writer:
+                    for statement in statements.values():
+                        writer.execute(statement)
+                writer.execute("ANALYZE")
+            finally:
+                writer.close()
+                self.connection = self._connect(read_only=True)
+        return list(statements)
+
+    def query(self, sql: str, parameters: tuple = (), chunk_size: int = 100_000,
+              as_arrow: bool = False) -> Iterator:
+        """
+        Runs a parameterized query and yields the result in chunks.
+
+        Args:
+            sql: SQL query with ? placeholders
+            parameters: values of the placeholders
+            chunk_size: maximum number of rows per chunk
+            as_arrow: if True chunks are pyarrow RecordBatches (requires pyarrow) instead of pandas DataFrames
+
+        Returns:
+            Iterator over DataFrames or RecordBatches
+        """
+        if as_arrow:
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("as_arrow=True requires pyarrow, please install it with 'pip install pyarrow'.")
+        cursor = self.connection.execute(sql, parameters)
+        names = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            df = pd.DataFrame.from_records(rows, columns=names)
+            yield pyarrow.RecordBatch.from_pandas(df, preserve_index=False) if as_arrow else df
+
+    def query_df(self, sql: str, parameters: tuple = ()) -> pd.DataFrame:
+        """Runs a parameterized query and returns the whole result as one DataFrame."""
+        chunks = list(self.query(sql, parameters))
+        if chunks:
+            return pd.concat(chunks, ignore_index=True)
+        cursor = self.connection.execute(sql, parameters)
+        return pd.DataFrame(columns=[description[0] for description in cursor.description])
+
+    def infections_by_person(self, human_ids: list, start_time: float = None, end_time: float = None,
+                             chunk_size: int = 100_000) -> Iterator[pd.DataFrame]:
+        """
+        Yields the InfectionData rows of the infections of some humans over time, joined with their human id.
+
+        Args:
+            human_ids: ids of the humans
+            start_time: first SimTime included
+            end_time: last SimTime included
+            chunk_size: maximum number of rows per chunk
+        """
+        placeholders = ", ".join("?" * len(human_ids))
+        sql = (f"SELECT inf.HumanID, data.* FROM {INFECTION_DATA_TABLE} AS data "
+               f"JOIN {INFECTIONS_TABLE} AS inf ON inf.InfectionID = data.InfectionID "
+               f"WHERE inf.HumanID IN ({placeholders})")
+        parameters = list(human_ids)
+        if start_time is not None:
+            sql += " AND data.SimTime >= ?"
+            parameters.append(start_time)
+        if end_time is not None:
+            sql += " AND data.SimTime <= ?"
+            parameters.append(end_time)
+        sql += " ORDER BY inf.HumanID, data.SimTime"
+        return self.query(sql, tuple(parameters), chunk_size)
+
+    def incidence_by_age_and_time(self, age_bins_years: list, time_bin_days: float = 365) -> pd.DataFrame:
+        """
+        New infections per person by age bin and time bin.
+
+        Infections are counted from the Infections table by the age of the human at SimTimeCreated. The population
+        of a bin is the number of Health table rows of the bin divided by the number of reported times in the time
+        bin, i.e. the average population.
+
+        Args:
+            age_bins_years: edges of the age bins in years, e.g. [0, 5, 15, 125]
+            time_bin_days: width of the time bins in days
+
+        Returns:
+            DataFrame with the columns "time_bin" (start day), "age_bin", "infections", "population" and
+            "incidence" (infections per person and time bin)
+        """
+        infections = self.query_df(
+            f"SELECT CAST(inf.SimTimeCreated / ? AS INTEGER) AS time_bin, "
+            f"CAST((h.InitialAgeDays + inf.SimTimeCreated - h.SimTimeAdded) / {DAYS_PER_YEAR} AS INTEGER) AS age, "
+            f"COUNT(*) AS infections "
+            f"FROM {INFECTIONS_TABLE} AS inf JOIN {HUMANS_TABLE} AS h ON h.HumanID = inf.HumanID "
+            f"GROUP BY time_bin, age", (time_bin_days,))
+        population = self.query_df(
+            f"SELECT CAST(SimTime / ? AS INTEGER) AS time_bin, CAST(AgeDays / {DAYS_PER_YEAR} AS INTEGER) AS age, "
+            f"COUNT(*) AS rows FROM {HEALTH_TABLE} GROUP BY time_bin, age", (time_bin_days,))
+        times = self.query_df(
+            f"SELECT CAST(SimTime / ? AS INTEGER) AS time_bin, COUNT(DISTINCT SimTime) AS times "
+            f"FROM {HEALTH_TABLE} GROUP BY time_bin", (time_bin_days,))
+
+        for df in [infections, population]:
+            df["age_bin"] = pd.cut(df["age"], age_bins_years, right=False)
+        infections = infections.groupby(["time_bin", "age_bin"], observed=True)["infections"].sum()
+        population = population.groupby(["time_bin", "age_bin"], observed=True)["rows"].sum()
+        result = pd.concat([infections, population], axis=1).fillna(0).reset_index()
+        result = result.merge(times, on="time_bin", how="left")
+        result["population"] = result["rows"] / result["times"]
+        result["incidence"] = result["infections"] / result["population"].replace(0, np.nan)
+        result["time_bin"] = result["time_bin"] * time_bin_days
+        result["infections"] = result["infections"].astype(np.int64)
+        return result[["time_bin", "age_bin", "infections", "population", "incidence"]]
+
+    def complexity_of_infection(self, start_time: float = None, end_time: float = None,
+                                by_genome: bool = None) -> pd.DataFrame:
+        """
+        Complexity of infection (COI) of every infected human at every reported time.
+
+        Args:
+            start_time: first SimTime included
+            end_time: last SimTime included
+            by_genome: if True the COI is the number of distinct genomes, else the number of infections. Defaults
+                to True if the Infections table has a GenomeID column (SqlReportMalariaGenetics).
+
+        Returns:
+            DataFrame with the columns "SimTime", "HumanID" and "COI"
+        """
+        if by_genome is None:
+            by_genome = "GenomeID" in self.columns(INFECTIONS_TABLE)
+        count = "COUNT(DISTINCT inf.GenomeID)" if by_genome else "COUNT(*)"
+        sql = (f"SELECT data.SimTime, inf.HumanID, {count} AS COI FROM {INFECTION_DATA_TABLE} AS data "
+               f"JOIN {INFECTIONS_TABLE} AS inf ON inf.InfectionID = data.InfectionID WHERE 1 = 1")
+        parameters = []
+        if start_time is not None:
+            sql += " AND data.SimTime >= ?"
+            parameters.append(start_time)
+        if end_time is not None:
+            sql += " AND data.SimTime <= ?"
+            parameters.append(end_time)
+        sql += " GROUP BY data.SimTime, inf.HumanID ORDER BY data.SimTime, inf.HumanID"
+        return self.query_df(sql, tuple(parameters))
+
+    def mean_complexity_of_infection(self, **kwargs) -> pd.DataFrame:
+        """
+        Mean COI of infected humans per reported time, see :py:meth:`complexity_of_infection`.
+
+        Returns:
+            DataFrame with the columns "SimTime", "infected" and "mean_COI"
+        """
+        coi = self.complexity_of_infection(**kwargs)
+        return coi.groupby("SimTime")["COI"].agg(infected="count", mean_COI="mean").reset_index()
+
+
+class SqlReportReader:
+    """
+        Adds ``read()`` to SqlReportMalaria and SqlReportMalariaGenetics.
+    """
+    report_name = None
+
+    @classmethod
+    def read(cls, output_dir: str, parameters: dict = None, filename: str = None, **kwargs) -> SqlReportDatabase:
+        """
+            Opens the report's database in a simulation's output directory, see :py:class:`SqlReportDatabase`.
+        """
+        path = find_report_file(output_dir, cls.report_name, ".db", parameters, filename)
+        return SqlReportDatabase(path, **kwargs)
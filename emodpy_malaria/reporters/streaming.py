@@ -0,0 +1,355 @@
+"""
+Streaming reader for large JSON reports, e.g. MalariaSummaryReport.json and ReportMalariaFiltered.json.
+
+The file is read in chunks and only the selected values are materialized: numeric arrays are parsed straight from
+their text into NumPy arrays, everything that isn't selected is skipped without building Python objects. The memory
+needed is the size of the selected arrays plus one chunk, independent of the size of the file::
+
+    from emodpy_malaria.reporters.streaming import stream_malaria_summary_report
+    report = stream_malaria_summary_report("MalariaSummaryReport.json", channels=["PfPR by Age Bin"])
+    pfpr = report["DataByTimeAndAgeBins"]["PfPR by Age Bin"]    # numpy array [time, age bin]
+"""
+import json
+import re
+import warnings
+from typing import Callable
+
+import numpy as np
+
+# Actions returned by the select function of read_json_values()
+SKIP = 0
+DESCEND = 1
+VALUE = 2
+ARRAY = 3
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r"\s*")
+_STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+_STRUCTURE = re.compile(r'[\[\]{}"]')
+_SCALAR = re.compile(r"[^,\]}\s]+")
+_ARRAY_TO_SPACES = str.maketrans("[],", "   ")
+
+
+class _Scanner:
+    """
+    Reads JSON tokens from a text file handle, keeping only the unread part of the current chunk in memory.
+    """
+    def __init__(self, handle, chunk_size: int):
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.dropped = 0    # number of characters read and removed from the buffer
+
+    def _fill(self):
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            raise ValueError("Unexpected end of JSON file.")
+        self.dropped += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    @property
+    def position(self) -> int:
+        """Number of characters consumed from the start of the file."""
+        return self.dropped + self.pos
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            self._fill()
+
+    def expect(self, character: str):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected '{character}' but found '{found}' in JSON file.")
+        self.pos += 1
+
+    def read_string(self) -> str:
+        self.expect('"')
+        self.pos -= 1
+        while True:
+            match = _STRING_END.match(self.buffer, self.pos + 1)
+            if match:
+                text = self.buffer[self.pos:match.end()]
+                self.pos = match.end()
+                return json.loads(text)
+            self._fill()
+
+    def scan_value(self, record: bool) -> str:
+        """Skips the next value. Returns its text if record is True, else an empty string."""
+        character = self.peek()
+        if character not in "[{\"":
+            while True:
+                match = _SCALAR.match(self.buffer, self.pos)
+                if match is None:
+                    raise ValueError(f"Unexpected '{character}' in JSON file.")
+                if match.end() < len(self.buffer):
+                    break
+                try:
+                    self._fill()
+                except ValueError:  # a scalar at the very end of the file
+                    break
+            text = match.group()
+            self.pos = match.end()
+            return text if record else ""
+        if character == '"':
+            text = self.read_string()
+            return json.dumps(text) if record else ""
+
+        pieces = []
+        start = self.pos
+        depth = 0
+        search_from = self.pos
+        while True:
+            match = _STRUCTURE.search(self.buffer, search_from)
+            if match is None:
+                end = len(self.buffer)
+            else:
+                index = match.start()
+                token = match.group()
+                if token == '"':
+                    string_end = _STRING_END.match(self.buffer, index + 1)
+                    if string_end:
+                        search_from = string_end.end()
+                        continue
+                    end = index     # incomplete string, read more and scan it again
+                else:
+                    depth += 1 if token in "[{" else -1
+                    search_from = index + 1
+                    if depth == 0:
+                        if record:
+                            pieces.append(self.buffer[start:search_from])
+                        self.pos = search_from
+                        return "".join(pieces)
+                    continue
+            if record:
+                pieces.append(self.buffer[start:end])
+            self.pos = end
+            self._fill()
+            start = search_from = 0
+
+    def scan_array(self, dtype=np.float64) -> np.ndarray:
+        """Parses the next value, a numeric array, chunk by chunk into a NumPy array, see parse_numeric_array()."""
+        parser = _ArrayParser(dtype)
+        self.peek()
+        while True:
+            self.pos = parser.feed(self.buffer, self.pos)
+            if parser.done:
+                return parser.result()
+            self._fill()
+
+
+class _ArrayParser:
+    """
+    Parses the text of a rectangular, possibly nested, JSON array of numbers piece by piece into a NumPy array.
+    The numbers of every piece are appended to an array that grows geometrically, the text isn't kept.
+    """
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
+        self.values = np.empty(1024, dtype=dtype)
+        self.size = 0
+        self.depth = 0
+        self.lists_per_level = []   # number of lists opened at each nesting level
+        self.done = False
+
+    def feed(self, text: str, start: int = 0) -> int:
+        """
+        Parses text from start up to the end of the array or, if the array doesn't end in text, up to the last
+        complete number. Sets done at the end of the array.
+
+        Returns:
+            Position in text after the parsed part
+        """
+        if self.depth == 0:
+            start = _WHITESPACE.match(text, start).end()
+            if start == len(text):
+                return start
+            if text[start] != "[":
+                raise ValueError("JSON value is not an array.")
+        end = None
+        for match in _STRUCTURE.finditer(text, start):
+            token = match.group()
+            if token == "[":
+                self.depth += 1
+                if self.depth > len(self.lists_per_level):
+                    self.lists_per_level.append(0)
+                self.lists_per_level[self.depth - 1] += 1
+            elif token == "]":
+                self.depth -= 1
+                if self.depth == 0:
+                    end = match.end()
+                    break
+            else:
+                raise ValueError("JSON array holds non-numeric values.")
+        if end is None:
+            # keep a number that may continue in the next piece
+            end = max(text.rfind(separator, start) for separator in "[], \t\r\n") + 1
+            end = max(end, start)
+        else:
+            self.done = True
+        self._append(text[start:end].translate(_ARRAY_TO_SPACES))
+        return end
+
+    def _append(self, numbers: str):
+        if not numbers or numbers.isspace():
+            return
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            try:
+                values = np.fromstring(numbers, dtype=self.dtype, sep=" ")
+            except DeprecationWarning:
+                raise ValueError("JSON array holds non-numeric values.")
+        if self.size + len(values) > len(self.values):
+            grown = np.empty(max(2 * len(self.values), self.size + len(values)), dtype=self.dtype)
+            grown[:self.size] = self.values[:self.size]
+            self.values = grown
+        self.values[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def result(self) -> np.ndarray:
+        """
+        The parsed array with the shape of the JSON array.
+
+        Raises:
+            ValueError: the array is incomplete or ragged
+        """
+        if not self.done:
+            raise ValueError("Unexpected end of JSON array.")
+        values = self.values[:self.size] if self.size == len(self.values) else self.values[:self.size].copy()
+        lists_per_level = self.lists_per_level
+        shape = [lists_per_level[level + 1] // lists_per_level[level] for level in range(len(lists_per_level) - 1)]
+        shape.append(self.size // lists_per_level[-1])
+        if int(np.prod(shape)) != self.size or int(np.prod(shape[:-1])) != lists_per_level[-1]:
+            raise ValueError("JSON array is ragged and can't be converted to a NumPy array.")
+        return values.reshape(shape)
+
+
+def parse_numeric_array(text: str, dtype=np.float64) -> np.ndarray:
+    """
+    Parses the text of a rectangular, possibly nested, JSON array of numbers into a NumPy array.
+
+    Raises:
+        ValueError: the array holds non-numeric values or is ragged
+    """
+    parser = _ArrayParser(dtype)
+    parser.feed(text)
+    return parser.result()
+
+
+def read_json_values(path: str, select: Callable[[tuple], int], dtype=np.float64,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Streams a JSON file and returns the values selected by select.
+
+    Args:
+        path: path to the JSON file
+        select: function called with the path of every value visited, e.g. ("DataByTime", "PfPR_2to10"). It
+            returns DESCEND to visit the members of an object, VALUE to load the value with json, ARRAY to parse
+            a numeric array into NumPy or SKIP. The root object is always visited.
+        dtype: dtype of the NumPy arrays
+        chunk_size: number of characters read at a time
+
+    Returns:
+        Dictionary path -> value for all values selected with VALUE or ARRAY
+    """
+    results = {}
+    with open(path, "r") as handle:
+        scanner = _Scanner(handle, chunk_size)
+        _walk(scanner, (), select, dtype, results)
+    return results
+
+
+def _walk(scanner: _Scanner, path: tuple, select, dtype, results: dict):
+    action = select(path) if path else DESCEND
+    if action == DESCEND and scanner.peek() == "{":
+        scanner.expect("{")
+        if scanner.peek() == "}":
+            scanner.pos += 1
+            return
+        while True:
+            key = scanner.read_string()
+            scanner.expect(":")
+            _walk(scanner, path + (key,), select, dtype, results)
+            if scanner.peek() == ",":
+                scanner.pos += 1
+                continue
+            scanner.expect("}")
+            return
+    elif action == ARRAY:
+        results[path] = scanner.scan_array(dtype)
+    elif action in [VALUE, DESCEND]:
+        results[path] = json.loads(scanner.scan_value(record=True))
+    else:
+        scanner.scan_value(record=False)
+
+
+def _nest(results: dict) -> dict:
+    nested = {}
+    for path, value in results.items():
+        level = nested
+        for key in path[:-1]:
+            level = level.setdefault(key, {})
+        level[path[-1]] = value
+    return nested
+
+
+def stream_malaria_summary_report(path: str, channels: list = None, groups: list = None, dtype=np.float64,
+                                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Streams a MalariaSummaryReport JSON file, see :py:func:`emodpy_malaria.reporters.readers.read_malaria_summary_report`.
+
+    Args:
+        path: path to the JSON file
+        channels: channels to read from the "DataBy..." groups, None reads all channels
+        groups: "DataBy..." groups to read, e.g. ["DataByTimeAndAgeBins"], None reads all groups
+        dtype: dtype of the arrays, e.g. np.float32 to halve the memory
+        chunk_size: number of characters read at a time
+
+    Returns:
+        Dictionary with the metadata as in the file and, for every selected "DataBy..." group, a dictionary
+        channel -> NumPy array indexed [time, ...bins]. Groups without selected channels are omitted.
+    """
+    def select(value_path):
+        if value_path[0].startswith("DataBy"):
+            if groups is not None and value_path[0] not in groups:
+                return SKIP
+            if len(value_path) == 1:
+                return DESCEND
+            return ARRAY if channels is None or value_path[1] in channels else SKIP
+        return VALUE
+
+    return _nest(read_json_values(path, select, dtype, chunk_size))
+
+
+def stream_inset_chart(path: str, channels: list = None, dtype=np.float64,
+                       chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """
+    Streams an InsetChart-style JSON file, e.g. ReportMalariaFiltered.json.
+
+    Args:
+        path: path to the JSON file
+        channels: channels to read, None reads all channels
+        dtype: dtype of the arrays
+        chunk_size: number of characters read at a time
+
+    Returns:
+        Dictionary with the "Header" and a dictionary "Channels" channel -> NumPy array
+    """
+    def select(value_path):
+        if value_path[0] != "Channels":
+            return VALUE
+        if len(value_path) == 1:
+            return DESCEND
+        if channels is not None and value_path[1] not in channels:
+            return SKIP
+        if len(value_path) == 2:
+            return DESCEND
+        return ARRAY if value_path[2] == "Data" else SKIP
+
+    report = _nest(read_json_values(path, select, dtype, chunk_size))
+    report["Channels"] = {channel: values["Data"] for channel, values in report.get("Channels", {}).items()}
+    return report
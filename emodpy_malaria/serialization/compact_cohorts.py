@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# compact_cohorts.py
+# -----------------------------------------------------------------------------
+# Merges equivalent vector cohorts in serialized populations.
+#
+# After zero_vector_infections() resets cohorts to STATE_ADULT with progress 0
+# and a null strain many cohorts differ only by their population. Cohorts that
+# are identical except for m_ID, population and age (within an age bucket) are
+# merged into one cohort with the summed population and population weighted age.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import math
+from pathlib import Path
+
+from pipeline import PopulationTransform, SerializedPopulationPipeline
+
+# Entries that may differ between merged cohorts
+MERGE_FIELDS = ["m_ID", "population", "age"]
+
+# Cohorts carrying parasites can't be merged, their oocyst/sporozoite cohorts are per vector
+PARASITE_FIELDS = ["m_OocystCohorts", "m_SporozoiteCohorts"]
+
+
+def _cohort_key(cohort: dict, age_bucket_days: float):
+    if cohort.get("__class__") == "VectorCohortIndividual":
+        return None     # individual mosquitoes are never merged
+    if any(cohort.get(field) for field in PARASITE_FIELDS):
+        return None
+    age = cohort.get("age", 0.0)
+    age_bucket = math.floor(age / age_bucket_days) if age_bucket_days > 0 else age
+    rest = {key: value for key, value in cohort.items() if key not in MERGE_FIELDS}
+    return age_bucket, json.dumps(rest, sort_keys=True, separators=(",", ":"))
+
+
+def compact_queue(cohorts: list, age_bucket_days: float = 1.0) -> list:
+    """
+    Merges equivalent cohorts of one queue, i.e. cohorts with the same state, progress, genome, strain,
+    microsporidia status and age bucket. The merged cohort keeps the m_ID of the first cohort, the summed
+    population and the population weighted age. The order of the remaining cohorts is kept.
+
+    Args:
+        cohorts: cohorts of a queue, e.g. vector_population["AdultQueues"]["collection"]
+        age_bucket_days: width of the age buckets in days, 0 only merges cohorts of the same age.
+
+    Returns:
+        The compacted list of cohorts.
+    """
+    compacted = []
+    merged = {}
+    for cohort in cohorts:
+        key = _cohort_key(cohort, age_bucket_days)
+        if key is None:
+            compacted.append(cohort)
+            continue
+        if key not in merged:
+            merged[key] = cohort
+            compacted.append(cohort)
+            continue
+        target = merged[key]
+        population = target.get("population", 0) + cohort.get("population", 0)
+        if population > 0 and "age" in target:
+            target["age"] = (target["age"] * target.get("population", 0)
+                             + cohort.get("age", 0.0) * cohort.get("population", 0)) / population
+        target["population"] = population
+    return compacted
+
+
+def compact_vector_cohorts(vector_pop_list: list, age_bucket_days: float = 1.0) -> dict:
+    """
+    Merges equivalent cohorts in all queues of all vector populations of a node.
+
+    Args:
+        vector_pop_list: list of vector population in a node.
+        age_bucket_days: width of the age buckets in days, 0 only merges cohorts of the same age.
+
+    Returns:
+        Dictionary queue name -> [number of cohorts before, number of cohorts after], summed over species.
+    """
+    report = {}
+    for vector_population in vector_pop_list:
+        for queue_name, queue in vector_population.items():
+            if not queue_name.endswith("Queues") or not isinstance(queue, dict) or "collection" not in queue:
+                continue
+            before = len(queue["collection"])
+            queue["collection"] = compact_queue(queue["collection"], age_bucket_days)
+            counts = report.setdefault(queue_name, [0, 0])
+            counts[0] += before
+            counts[1] += len(queue["collection"])
+    return report
+
+
+class CompactVectorCohorts(PopulationTransform):
+    """
+    Pipeline stage merging equivalent vector cohorts, see :py:func:`compact_vector_cohorts`. Usually added after
+    :py:class:`pipeline.ZeroInfections`.
+
+    Args:
+        age_bucket_days: width of the age buckets in days, 0 only merges cohorts of the same age.
+    """
+    def __init__(self, age_bucket_days: float = 1.0):
+        self.age_bucket_days = age_bucket_days
+        self.report = {}
+
+    def begin(self, simulation):
+        self.report = {}
+
+    def transform_node(self, node, simulation):
+        node_report = compact_vector_cohorts(node["m_vectorpopulations"], self.age_bucket_days)
+        for queue_name, (before, after) in node_report.items():
+            counts = self.report.setdefault(queue_name, [0, 0])
+            counts[0] += before
+            counts[1] += after
+
+    @property
+    def cohorts_before(self) -> int:
+        return sum(before for before, _ in self.report.values())
+
+    @property
+    def cohorts_after(self) -> int:
+        return sum(after for _, after in self.report.values())
+
+    def print_report(self):
+        for queue_name, (before, after) in self.report.items():
+            print(f"{queue_name:>20}: {before} -> {after} cohorts")
+        if self.cohorts_before:
+            print(f"{'total':>20}: {self.cohorts_before} -> {self.cohorts_after} cohorts "
+                  f"({100.0 * (1 - self.cohorts_after / self.cohorts_before):0.1f}% smaller)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge equivalent vector cohorts.",
+                                     epilog="E.g. python compact_cohorts.py -i state-00365_zero.dtk -o compact.dtk")
+    parser.add_argument("-i", "--input_file", type=Path, required=True, help="Serialized population file.")
+    parser.add_argument("-o", "--output_file", type=Path, required=True, help="Serialized population output file.")
+    parser.add_argument("-a", "--age_bucket", type=float, default=1.0, help="Width of age buckets in days.")
+    args = parser.parse_args()
+
+    stage = CompactVectorCohorts(args.age_bucket)
+    SerializedPopulationPipeline([stage]).run(args.input_file, args.output_file)
+    stage.print_report()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# downsample.py
+# -----------------------------------------------------------------------------
+# Creates smaller versions of serialized populations, e.g. for regression tests.
+#
+# Humans are subsampled per node, stratified by age and infection status, so the
+# immunity and infection structure is kept. Vector cohort populations are scaled
+# by the same fraction. Genomes no longer referenced are dropped from the genome
+# map so EMOD can load the file.
+# -----------------------------------------------------------------------------
+import argparse
+from pathlib import Path
+from typing import List
+
+import numpy
+
+import genomes
+from pipeline import PopulationTransform, SerializedPopulationPipeline
+from zero_infections import DAYS_PER_YEAR
+
+DEFAULT_AGE_BINS_YEARS = [0, 1, 2, 5, 10, 15, 20, 30, 40, 50, 60, 125]
+
+
+def downsample_humans(humans: list, fraction: float, rng: numpy.random.Generator,
+                      age_bins_years: List[float] = None) -> list:
+    """
+    Subsamples humans stratified by age bin and infection status. Each stratum keeps round(fraction * size)
+    humans, at least one if the stratum isn't empty. The order of the humans is kept.
+
+    Args:
+        humans: All humans in a node
+        fraction: fraction of humans to keep, 0 < fraction <= 1
+        rng: NumPy random generator
+        age_bins_years: edges of the age bins in years
+
+    Returns:
+        List of kept humans.
+    """
+    if not humans:
+        return []
+    edges = numpy.asarray(age_bins_years if age_bins_years else DEFAULT_AGE_BINS_YEARS, dtype=float) * DAYS_PER_YEAR
+    ages = numpy.fromiter((person["m_age"] for person in humans), dtype=float, count=len(humans))
+    infected = numpy.fromiter((person["m_is_infected"] for person in humans), dtype=bool, count=len(humans))
+    strata = numpy.digitize(ages, edges) * 2 + infected
+
+    keep = numpy.zeros(len(humans), dtype=bool)
+    for stratum in numpy.unique(strata):
+        members = numpy.flatnonzero(strata == stratum)
+        num_keep = max(1, int(round(fraction * len(members))))
+        keep[rng.choice(members, size=num_keep, replace=False)] = True
+    return [humans[index] for index in numpy.flatnonzero(keep)]
+
+
+def scale_vector_populations(vector_pop_list: list, fraction: float, rng: numpy.random.Generator):
+    """
+    Scales cohort populations by fraction. Populations are rounded stochastically so totals are kept in
+    expectation; empty cohorts are removed. Individual mosquitoes (VectorCohortIndividual) are kept with
+    probability fraction.
+
+    Args:
+        vector_pop_list: list of vector population in a node.
+        fraction: scale factor, 0 < fraction <= 1
+        rng: NumPy random generator
+    """
+    for vector_population in vector_pop_list:
+        for queue_name, queue in vector_population.items():
+            if not queue_name.endswith("Queues") or not isinstance(queue, dict) or "collection" not in queue:
+                continue
+            kept = []
+            for cohort in queue["collection"]:
+                if cohort.get("__class__") == "VectorCohortIndividual" or "population" not in cohort:
+                    if rng.random() < fraction:
+                        kept.append(cohort)
+                    continue
+                expected = cohort["population"] * fraction
+                population = int(numpy.floor(expected))
+                population += int(rng.random() < expected - population)
+                if population > 0:
+                    cohort["population"] = population
+                    kept.append(cohort)
+            queue["collection"] = kept
+
+
+class Downsample(PopulationTransform):
+    """
+    Pipeline stage subsampling humans and scaling vector populations, see :py:func:`downsample_humans` and
+    :py:func:`scale_vector_populations`. Unreferenced genomes are removed from the genome map after the last node.
+
+    Args:
+        fraction: fraction of humans and vectors to keep, 0 < fraction <= 1
+        seed: seed of the random generator
+        age_bins_years: edges of the age bins in years used for stratification
+        scale_mc_weight: if True the Monte Carlo weight of kept humans is divided by fraction so the kept humans
+            represent the original population size.
+    """
+    def __init__(self, fraction: float, seed: int = 0, age_bins_years: List[float] = None,
+                 scale_mc_weight: bool = False):
+        if not 0 < fraction <= 1:
+            raise ValueError(f"fraction must be in (0, 1], got {fraction}.")
+        self.fraction = fraction
+        self.seed = seed
+        self.age_bins_years = age_bins_years
+        self.scale_mc_weight = scale_mc_weight
+        self.rng = None
+        self.hash_codes = set()
+        self.removed_genomes = 0
+
+    def begin(self, simulation):
+        self.rng = numpy.random.default_rng(self.seed)
+        self.hash_codes = set()
+        self.removed_genomes = 0
+
+    def transform_node(self, node, simulation):
+        humans = downsample_humans(node["individualHumans"], self.fraction, self.rng, self.age_bins_years)
+        if self.scale_mc_weight:
+            for person in humans:
+                if "m_mc_weight" in person:
+                    person["m_mc_weight"] = person["m_mc_weight"] / self.fraction
+        node["individualHumans"] = humans
+        scale_vector_populations(node.get("m_vectorpopulations", []), self.fraction, self.rng)
+        self.hash_codes |= genomes.referenced_hash_codes(node)
+
+    def end(self, simulation):
+        self.removed_genomes = genomes.prune_genome_map(simulation, self.hash_codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create a smaller version of a serialized population.",
+                                     epilog="E.g. python downsample.py -i state-00365.dtk -o small.dtk -f 0.05")
+    parser.add_argument("-i", "--input_file", type=Path, required=True, help="Serialized population file.")
+    parser.add_argument("-o", "--output_file", type=Path, required=True, help="Serialized population output file.")
+    parser.add_argument("-f", "--fraction", type=float, required=True, help="Fraction of humans and vectors to keep.")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed.")
+    parser.add_argument("--scale_mc_weight", action="store_true", help="Divide Monte Carlo weights by fraction.")
+    args = parser.parse_args()
+
+    stage = Downsample(args.fraction, args.seed, scale_mc_weight=args.scale_mc_weight)
+    SerializedPopulationPipeline([stage]).run(args.input_file, args.output_file)
+    print(f"Removed {stage.removed_genomes} unreferenced genomes.")
@@ -0,0 +1,390 @@
+#!/usr/bin/python
+# dtk_index.py
+# -----------------------------------------------------------------------------
+# Sidecar index for serialized population files.
+#
+# A *.dtk file is scanned once, node by node, and a small JSON file is written
+# next to it (state-00365.dtk -> state-00365.dtk.index.json). The index holds the
+# byte range and compression of every chunk and per node counts of humans,
+# infections and vectors. Summary questions are answered from the index alone,
+# single nodes are extracted by reading only their byte ranges.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import List, Union
+
+import emod_api.serialization.dtkFileTools as dft
+import emod_api.serialization.dtkFileSupport as dtk
+
+INDEX_SUFFIX = ".index.json"
+INDEX_VERSION = 1
+
+# VectorStateEnum defined in VectorEnums.h, see zero_infections.py
+STATE_INFECTIOUS = 0
+STATE_INFECTED = 1
+
+MAGIC_SIZE = 4          # 'IDTK'
+HEADER_SIZE_SIZE = 12   # decimal header size right aligned in 12 characters
+
+# V6 files use three character compression strings, see dtkFileTools.py
+V6_COMPRESSION = {"NON": dft.NONE, "LZ4": dft.LZ4, "SNA": dft.SNAPPY}
+
+
+def read_header(filename: Union[str, Path]):
+    """
+    Reads the header of a serialized population file without reading any of the chunks.
+
+    Args:
+        filename: serialized population file
+
+    Returns:
+        Tuple of header dictionary and the byte offset of the first chunk.
+    """
+    with open(filename, "rb") as handle:
+        magic = handle.read(MAGIC_SIZE).decode()
+        if magic != dft.IDTK:
+            raise UserWarning(f"File has incorrect magic 'number': '{magic}'")
+        header_size = int(handle.read(HEADER_SIZE_SIZE))
+        header = json.loads(handle.read(header_size))
+
+    if "metadata" in header:
+        header = header["metadata"]
+    header.setdefault("version", 1)
+
+    return header, MAGIC_SIZE + HEADER_SIZE_SIZE + header_size
+
+
+def _compression(header: dict) -> str:
+    if header["version"] < 4:
+        if not header.get("compressed", True):
+            return dft.NONE
+        return header.get("engine", dft.SNAPPY).upper()
+    return header.get("compression", header.get("engine", dft.NONE)).upper()
+
+
+def chunk_layout(header: dict, payload_offset: int) -> List[dict]:
+    """
+    Computes the byte range and compression of every chunk from the header.
+
+    Args:
+        header: header dictionary, see :py:func:`read_header`
+        payload_offset: byte offset of the first chunk
+
+    Returns:
+        List of chunks, the first one is the simulation. Every chunk is a dictionary with "type"
+        ("simulation", "node" or "humans"), "offset", "size" and "compression". Chunks of V6 files
+        also have "node_suid" and human chunks have "num_humans".
+    """
+    version = header["version"]
+    chunks = []
+    offset = payload_offset
+
+    if version == 1:
+        raise UserWarning("Version 1 serialized population files are not chunked and can't be indexed.")
+
+    if version < 6:
+        compression = _compression(header)
+        for index, size in enumerate(header["chunksizes"]):
+            chunks.append({"type": "simulation" if index == 0 else "node", "offset": offset, "size": size,
+                           "compression": compression})
+            offset += size
+        return chunks
+
+    size = int(header["sim_chunk_size"], 16)
+    chunks.append({"type": "simulation", "offset": offset, "size": size,
+                   "compression": V6_COMPRESSION[header["sim_compression"]]})
+    offset += size
+    for compression, suid, size_string in zip(header["node_compressions"], header["node_suids"],
+                                              header["node_chunk_sizes"]):
+        size = int(size_string, 16)
+        chunks.append({"type": "node", "offset": offset, "size": size, "compression": V6_COMPRESSION[compression],
+                       "node_suid": int(suid, 16)})
+        offset += size
+    for compression, suid, num_humans, size_string in zip(header["human_compressions"], header["human_node_suids"],
+                                                          header["human_num_humans"], header["human_chunk_sizes"]):
+        size = int(size_string, 16)
+        chunks.append({"type": "humans", "offset": offset, "size": size, "compression": V6_COMPRESSION[compression],
+                       "node_suid": int(suid, 16), "num_humans": int(num_humans, 16)})
+        offset += size
+    return chunks
+
+
+def read_chunk(handle, chunk: dict):
+    """
+    Reads, uncompresses and parses a single chunk.
+
+    Args:
+        handle: file opened in binary mode
+        chunk: chunk dictionary, see :py:func:`chunk_layout`
+
+    Returns:
+        The parsed JSON object of the chunk, nested dictionaries are SerialObjects.
+    """
+    handle.seek(chunk["offset"])
+    data = handle.read(chunk["size"])
+    if len(data) != chunk["size"]:
+        raise UserWarning(f"Only read {len(data)} bytes of {chunk['size']} at offset {chunk['offset']}.")
+    return json.loads(dft.uncompress(data, chunk["compression"]), object_hook=dtk.SerialObject)
+
+
+def _unwrap_node(obj):
+    # Version 2 saves {'suid':{'id':id},'node':{...}}
+    return obj["node"] if "node" in obj and "externalId" not in obj else obj
+
+
+def _unwrap_simulation(obj):
+    # Version 2 saves {'simulation':{...}}
+    return obj["simulation"] if "simulation" in obj and len(obj) == 1 else obj
+
+
+def count_humans(humans: list) -> dict:
+    """
+    Counts humans, infected humans and infections.
+
+    Args:
+        humans: list of serialized humans
+
+    Returns:
+        Dictionary with "humans", "infected_humans" and "infections".
+    """
+    counts = {"humans": len(humans), "infected_humans": 0, "infections": 0}
+    for person in humans:
+        num_infections = len(person.get("infections", []))
+        counts["infections"] += num_infections
+        if person.get("m_is_infected", False) or num_infections:
+            counts["infected_humans"] += 1
+    return counts
+
+
+def count_vectors(vector_pop_list: list) -> dict:
+    """
+    Counts vector cohorts and vectors per species.
+
+    Args:
+        vector_pop_list: list of vector populations in a node (m_vectorpopulations)
+
+    Returns:
+        Dictionary species name -> dictionary with "cohorts", "population", "infected" and "infectious".
+    """
+    species = {}
+    for idx, vector_population in enumerate(vector_pop_list):
+        name = vector_population.get("species_ID", str(idx))
+        counts = species.setdefault(name, {"cohorts": 0, "population": 0, "infected": 0, "infectious": 0})
+        for key, queue in vector_population.items():
+            if not key.endswith("Queues") or not isinstance(queue, dict) or "collection" not in queue:
+                continue
+            for cohort in queue["collection"]:
+                population = cohort.get("population", 1)
+                counts["cohorts"] += 1
+                counts["population"] += population
+                if cohort.get("state") == STATE_INFECTED:
+                    counts["infected"] += population
+                elif cohort.get("state") == STATE_INFECTIOUS:
+                    counts["infectious"] += population
+    return species
+
+
+def index_filename_for(filename: Union[str, Path]) -> Path:
+    """Returns the path of the sidecar index of a serialized population file."""
+    return Path(str(filename) + INDEX_SUFFIX)
+
+
+def build_index(filename: Union[str, Path], index_filename: Union[str, Path] = None, write: bool = True) -> dict:
+    """
+    Scans a serialized population file once and creates the sidecar index. Only one node is uncompressed and
+    parsed at a time.
+
+    Args:
+        filename: serialized population file
+        index_filename: index file, defaults to filename + ".index.json"
+        write: if False the index is only returned, not written
+
+    Returns:
+        The index dictionary.
+    """
+    header, payload_offset = read_header(filename)
+    chunks = chunk_layout(header, payload_offset)
+    stat = os.stat(filename)
+
+    index = {"index_version": INDEX_VERSION,
+             "file_size": stat.st_size,
+             "file_mtime_ns": stat.st_mtime_ns,
+             "version": header["version"],
+             "simulation": chunks[0],
+             "genome_map_size": 0,
+             "nodes": []}
+
+    with open(filename, "rb") as handle:
+        sim = _unwrap_simulation(read_chunk(handle, chunks[0]))
+        if "ParasiteGenetics" in sim:
+            index["genome_map_size"] = len(sim["ParasiteGenetics"].get("m_ParasiteGenomeMap", []))
+        del sim
+
+        human_chunks = [chunk for chunk in chunks if chunk["type"] == "humans"]
+        for chunk in chunks[1:]:
+            if chunk["type"] != "node":
+                continue
+            node = _unwrap_node(read_chunk(handle, chunk))
+            entry = {"node_id": node["externalId"], "node_suid": node["suid"]["id"], "chunk": chunk}
+            if header["version"] < 6:
+                entry.update(count_humans(node["individualHumans"]))
+                entry["human_chunks"] = []
+            else:
+                entry["human_chunks"] = [c for c in human_chunks if c["node_suid"] == chunk["node_suid"]]
+                entry.update(count_humans([]))
+                for human_chunk in entry["human_chunks"]:
+                    counts = count_humans(read_chunk(handle, human_chunk)["human_collection"])
+                    for key, value in counts.items():
+                        entry[key] += value
+            entry["vectors"] = count_vectors(node.get("m_vectorpopulations", []))
+            index["nodes"].append(entry)
+            del node
+
+    if write:
+        with open(index_filename or index_filename_for(filename), "w") as index_file:
+            json.dump(index, index_file, separators=(",", ":"))
+
+    return index
+
+
+class DtkIndex:
+    """
+    Sidecar index of a serialized population file.
+
+    Args:
+        filename: serialized population file
+        rebuild: if True the index is rebuilt even if an up-to-date index file exists.
+
+    Examples:
+        How many infected humans and infectious vectors does node 17 have::
+
+            index = DtkIndex("state-00365.dtk")
+            summary = index.summary(17)
+            print(summary["infected_humans"], summary["infectious_vectors"])
+    """
+    def __init__(self, filename: Union[str, Path], rebuild: bool = False):
+        self.filename = Path(filename)
+        self.index_filename = index_filename_for(filename)
+        self.index = None
+        if not rebuild:
+            self.index = self._load()
+        if self.index is None:
+            self.index = build_index(self.filename, self.index_filename)
+        self._nodes = {entry["node_id"]: entry for entry in self.index["nodes"]}
+
+    def _load(self):
+        if not self.index_filename.exists():
+            return None
+        with open(self.index_filename) as index_file:
+            index = json.load(index_file)
+        stat = os.stat(self.filename)
+        if index.get("index_version") != INDEX_VERSION or index.get("file_size") != stat.st_size \
+                or index.get("file_mtime_ns") != stat.st_mtime_ns:
+            return None  # stale index
+        return index
+
+    @property
+    def node_ids(self) -> List[int]:
+        """External ids of all nodes in file order."""
+        return list(self._nodes)
+
+    @property
+    def genome_map_size(self) -> int:
+        """Number of entries in m_ParasiteGenomeMap."""
+        return self.index["genome_map_size"]
+
+    def summary(self, node_id: int = None) -> dict:
+        """
+        Returns counts for one node or, if node_id is None, totals over all nodes.
+
+        Args:
+            node_id: external id of the node
+
+        Returns:
+            Dictionary with "nodes", "humans", "infected_humans", "infections", "vector_cohorts", "vectors",
+            "infected_vectors", "infectious_vectors" and "genome_map_size".
+        """
+        if node_id is not None and node_id not in self._nodes:
+            raise ValueError(f"Node {node_id} not found in {self.filename}, nodes are {self.node_ids}.")
+        entries = [self._nodes[node_id]] if node_id is not None else self.index["nodes"]
+
+        summary = {"nodes": len(entries), "humans": 0, "infected_humans": 0, "infections": 0, "vector_cohorts": 0,
+                   "vectors": 0, "infected_vectors": 0, "infectious_vectors": 0,
+                   "genome_map_size": self.genome_map_size}
+        for entry in entries:
+            for key in ["humans", "infected_humans", "infections"]:
+                summary[key] += entry[key]
+            for counts in entry["vectors"].values():
+                summary["vector_cohorts"] += counts["cohorts"]
+                summary["vectors"] += counts["population"]
+                summary["infected_vectors"] += counts["infected"]
+                summary["infectious_vectors"] += counts["infectious"]
+        return summary
+
+    def read_simulation(self) -> dict:
+        """Reads only the simulation chunk."""
+        with open(self.filename, "rb") as handle:
+            return _unwrap_simulation(read_chunk(handle, self.index["simulation"]))
+
+    def read_node(self, node_id: int) -> dict:
+        """
+        Reads a single node by reading only its byte range(s). Humans of V6 files are merged into individualHumans.
+
+        Args:
+            node_id: external id of the node
+
+        Returns:
+            The serialized node.
+        """
+        if node_id not in self._nodes:
+            raise ValueError(f"Node {node_id} not found in {self.filename}, nodes are {self.node_ids}.")
+        entry = self._nodes[node_id]
+        with open(self.filename, "rb") as handle:
+            node = _unwrap_node(read_chunk(handle, entry["chunk"]))
+            if entry["human_chunks"]:
+                humans = []
+                for human_chunk in entry["human_chunks"]:
+                    humans.extend(read_chunk(handle, human_chunk)["human_collection"])
+                node["individualHumans"] = humans
+        return node
+
+
+def summarize(filenames: List[Union[str, Path]], rebuild: bool = False) -> List[dict]:
+    """
+    Summarizes many serialized population files, e.g. to triage burn-ins. Files with an up-to-date index are not read.
+
+    Args:
+        filenames: serialized population files
+        rebuild: if True all indices are rebuilt
+
+    Returns:
+        List with one summary (see :py:meth:`DtkIndex.summary`) per file, with an additional "file" entry.
+    """
+    summaries = []
+    for filename in filenames:
+        summary = {"file": str(filename)}
+        summary.update(DtkIndex(filename, rebuild).summary())
+        summaries.append(summary)
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index and summarize serialized population files.",
+                                     epilog="E.g. python dtk_index.py state-00365.dtk -n 17")
+    parser.add_argument("files", type=Path, nargs="+", help="Serialized population file(s).")
+    parser.add_argument("-n", "--node", type=int, default=None, help="Summarize only this node.")
+    parser.add_argument("-r", "--rebuild", action="store_true", help="Rebuild existing indices.")
+    parser.add_argument("-x", "--extract", type=Path, default=None,
+                        help="Write the node selected with --node as json to this file (single input file only).")
+    args = parser.parse_args()
+
+    if args.extract:
+        if args.node is None or len(args.files) != 1:
+            parser.error("--extract requires --node and exactly one input file.")
+        with open(args.extract, "w") as out_file:
+            json.dump(DtkIndex(args.files[0], args.rebuild).read_node(args.node), out_file)
+    else:
+        for dtk_file in args.files:
+            print(json.dumps({"file": str(dtk_file), **DtkIndex(dtk_file, args.rebuild).summary(args.node)}))
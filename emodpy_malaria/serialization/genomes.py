@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# genomes.py
+# -----------------------------------------------------------------------------
+# Helpers for the parasite genomes of serialized populations.
+#
+# Genomes are serialized as {"m_pInner": {"__class__": "ParasiteGenomeInner",
+# "m_HashCode": ..., ...}} wherever they are used (infections, gametocytes,
+# oocyst and sporozoite cohorts, ...) and once more in the genome map of the
+# simulation, simulation["ParasiteGenetics"]["m_ParasiteGenomeMap"].
+#
+# Garbage collection: python genomes.py -i state-00365_zero.dtk -o gc.dtk
+# -----------------------------------------------------------------------------
+import argparse
+from pathlib import Path
+from typing import Iterator, Set
+
+from pipeline import PopulationTransform, SerializedPopulationPipeline
+
+
+def is_genome(obj) -> bool:
+    """True if obj is a serialized genome, i.e. a dictionary with an inner genome with a hash code."""
+    return isinstance(obj, dict) and isinstance(obj.get("m_pInner"), dict) and "m_HashCode" in obj["m_pInner"]
+
+
+def iter_genomes(obj) -> Iterator[dict]:
+    """
+    Yields all serialized genomes (the dictionaries holding "m_pInner") found in obj, e.g. a node, a human or a
+    vector cohort. The walk doesn't descend into genomes.
+    """
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            if is_genome(item):
+                yield item
+                continue
+            stack.extend(value for value in item.values() if isinstance(value, (dict, list)))
+        elif isinstance(item, list):
+            stack.extend(value for value in item if isinstance(value, (dict, list)))
+
+
+def referenced_hash_codes(node: dict) -> Set[int]:
+    """
+    Returns the hash codes of all genomes referenced by humans and vectors of a node.
+    """
+    hash_codes = set()
+    for genome in iter_genomes(list(node["individualHumans"])):
+        hash_codes.add(genome["m_pInner"]["m_HashCode"])
+    for genome in iter_genomes(node.get("m_vectorpopulations", [])):
+        hash_codes.add(genome["m_pInner"]["m_HashCode"])
+    return hash_codes
+
+
+def get_genome_map(simulation: dict):
+    """Returns the genome map of the simulation or None if the simulation doesn't use parasite genetics."""
+    if "ParasiteGenetics" not in simulation:
+        return None
+    return simulation["ParasiteGenetics"].get("m_ParasiteGenomeMap")
+
+
+def prune_genome_map(simulation: dict, hash_codes: Set[int]) -> int:
+    """
+    Removes all entries from the genome map of the simulation that are not in hash_codes.
+
+    Args:
+        simulation: serialized simulation
+        hash_codes: hash codes of the genomes that are kept
+
+    Returns:
+        Number of removed entries.
+    """
+    genome_map = get_genome_map(simulation)
+    if genome_map is None:
+        return 0
+    before = len(genome_map)
+    genome_map[:] = [entry for entry in genome_map if entry["key"] in hash_codes]
+    return before - len(genome_map)
+
+
+def _sequence_key(inner: dict, include_allele_roots: bool):
+    key = tuple(inner["m_NucleotideSequence"])
+    if include_allele_roots:
+        key += tuple(inner.get("m_AlleleRoots", []))
+    return key
+
+
+def canonical_genomes(genome_map: list, include_allele_roots: bool = False) -> dict:
+    """
+    Maps the hash code of every genome map entry to the canonical entry of its nucleotide sequence, i.e. the first
+    entry in the map with the same sequence.
+
+    Args:
+        genome_map: m_ParasiteGenomeMap of the simulation
+        include_allele_roots: if True genomes are only identical if their allele roots are identical, too.
+
+    Returns:
+        Dictionary hash code -> inner genome of the canonical entry.
+    """
+    canonical_by_sequence = {}
+    canonical = {}
+    for entry in genome_map:
+        inner = entry["value"]
+        key = _sequence_key(inner, include_allele_roots)
+        canonical[entry["key"]] = canonical_by_sequence.setdefault(key, inner)
+    return canonical
+
+
+def repoint_genomes(obj, canonical: dict):
+    """
+    Re-points all genomes in obj to their canonical map entry.
+
+    Args:
+        obj: a node, a human, a list of vector populations, ...
+        canonical: dictionary hash code -> canonical inner genome, see :py:func:`canonical_genomes`
+
+    Returns:
+        Tuple of the set of referenced (canonical) hash codes and the number of re-pointed genomes.
+    """
+    hash_codes = set()
+    num_repointed = 0
+    for genome in iter_genomes(obj):
+        hash_code = genome["m_pInner"]["m_HashCode"]
+        inner = canonical.get(hash_code)
+        if inner is not None and inner["m_HashCode"] != hash_code:
+            genome["m_pInner"] = inner
+            num_repointed += 1
+        hash_codes.add(genome["m_pInner"]["m_HashCode"])
+    return hash_codes, num_repointed
+
+
+class GenomeGarbageCollection(PopulationTransform):
+    """
+    Pipeline stage that re-points genomes to one canonical entry per nucleotide sequence and removes all genome map
+    entries that are not referenced by humans, vectors or the simulation. The genome map is read in begin(), nodes
+    are processed one at a time and the map is pruned in end(), so the stage streams with the pipeline.
+
+    Args:
+        deduplicate: if True genomes with identical nucleotide sequences are merged.
+        include_allele_roots: if True genomes are only merged if their allele roots are identical, too.
+    """
+    def __init__(self, deduplicate: bool = True, include_allele_roots: bool = False):
+        self.deduplicate = deduplicate
+        self.include_allele_roots = include_allele_roots
+        self.canonical = {}
+        self.hash_codes = set()
+        self.genomes_before = 0
+        self.removed_genomes = 0
+        self.repointed_genomes = 0
+
+    def begin(self, simulation):
+        genome_map = get_genome_map(simulation)
+        self.genomes_before = len(genome_map) if genome_map else 0
+        self.removed_genomes = 0
+        self.repointed_genomes = 0
+        self.canonical = canonical_genomes(genome_map, self.include_allele_roots) if genome_map and self.deduplicate else {}
+        # genomes referenced outside of the nodes, e.g. by the parasite genetics configuration
+        sim_without_map = {key: value for key, value in simulation.items() if key not in ["ParasiteGenetics", "nodes"]}
+        self.hash_codes, _ = repoint_genomes(sim_without_map, self.canonical)
+
+    def transform_node(self, node, simulation):
+        for obj in [node["individualHumans"], node.get("m_vectorpopulations", [])]:
+            hash_codes, num_repointed = repoint_genomes(list(obj), self.canonical)
+            self.hash_codes |= hash_codes
+            self.repointed_genomes += num_repointed
+
+    def end(self, simulation):
+        self.removed_genomes = prune_genome_map(simulation, self.hash_codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove unreferenced and duplicate genomes from the genome map.")
+    parser.add_argument("-i", "--input_file", type=Path, required=True, help="Serialized population file.")
+    parser.add_argument("-o", "--output_file", type=Path, required=True, help="Serialized population output file.")
+    parser.add_argument("--no_deduplicate", action="store_true", help="Only remove unreferenced genomes.")
+    parser.add_argument("--include_allele_roots", action="store_true",
+                        help="Only merge genomes with identical nucleotide sequences and allele roots.")
+    args = parser.parse_args()
+
+    stage = GenomeGarbageCollection(not args.no_deduplicate, args.include_allele_roots)
+    SerializedPopulationPipeline([stage]).run(args.input_file, args.output_file)
+    print(f"Genome map: {stage.genomes_before} -> {stage.genomes_before - stage.removed_genomes} entries, "
+          f"{stage.repointed_genomes} references re-pointed.")
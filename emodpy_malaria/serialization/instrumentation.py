@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# instrumentation.py
+# -----------------------------------------------------------------------------
+# Structured profiling records for the serialization tools.
+#
+# Tools take an optional Instrumentation. Without a sink (the default) nothing
+# is measured or emitted. With a sink every record is a flat dictionary, e.g.
+#
+#   {"event": "node", "node_id": 17, "humans": 1000, "infections": 52,
+#    "seconds": {"ZeroInfections": 0.01}, "peak_rss_bytes": 123456789, ...}
+#
+# Records can be written as JSON lines to size cluster jobs.
+# -----------------------------------------------------------------------------
+import json
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+
+def peak_rss_bytes() -> int:
+    """Returns the peak resident set size of the process in bytes, or -1 if it can't be determined."""
+    if resource is None:
+        return -1
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024    # Linux reports kilobytes
+
+
+class JsonLinesSink:
+    """
+    Sink writing one JSON object per line.
+
+    Args:
+        filename: output file, records are appended.
+    """
+    def __init__(self, filename):
+        self.handle = open(filename, "a")
+
+    def __call__(self, record: dict):
+        self.handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.handle.flush()
+
+    def close(self):
+        self.handle.close()
+
+
+def print_sink(record: dict):
+    """Sink printing records in a human readable form."""
+    fields = ", ".join(f"{key}={value}" for key, value in record.items() if key not in ["event", "timestamp"])
+    print(f"[{record['event']}] {fields}")
+
+
+class Instrumentation:
+    """
+    Emits structured records to a sink. Without a sink instrumentation is disabled and costs nothing.
+
+    Args:
+        sink: callable receiving one dictionary per record, e.g. :py:class:`JsonLinesSink`, :py:func:`print_sink`
+            or list.append.
+
+    Examples:
+        Collect records in a list::
+
+            records = []
+            SerializedPopulationPipeline(stages).run(source, destination, instrumentation=Instrumentation(records.append))
+    """
+    def __init__(self, sink: Callable[[dict], None] = None):
+        self.sink = sink
+
+    @classmethod
+    def to_jsonl(cls, filename) -> "Instrumentation":
+        """Instrumentation writing JSON lines to filename."""
+        return cls(JsonLinesSink(filename))
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def emit(self, event: str, **fields):
+        """Emits a record, timestamp and peak RSS are added."""
+        if not self.enabled:
+            return
+        record = {"event": event, "timestamp": time.time()}
+        record.update(fields)
+        record["peak_rss_bytes"] = peak_rss_bytes()
+        self.sink(record)
+
+    @contextmanager
+    def measure(self, event: str, **fields):
+        """
+        Context manager emitting a record with the elapsed "seconds". The yielded dictionary can be used to add
+        fields, e.g. counts, to the record.
+        """
+        record = dict(fields)
+        tic = time.perf_counter()
+        yield record
+        record["seconds"] = time.perf_counter() - tic
+        self.emit(event, **record)
+
+    def close(self):
+        if hasattr(self.sink, "close"):
+            self.sink.close()
+
+
+# Default used by all tools: nothing is emitted
+QUIET = Instrumentation()
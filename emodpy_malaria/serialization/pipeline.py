@@ -0,0 +1,288 @@
+#!/usr/bin/python
+# pipeline.py
+# -----------------------------------------------------------------------------
+# Applies several transforms to a serialized population in a single read/write
+# pass, e.g.
+#
+#   SerializedPopulationPipeline([ZeroInfections(keep_individuals=[1, 2]),
+#                                 ReplaceGenomes(get_next_barcode),
+#                                 SetIndividualProperty("Risk", "HIGH")]).run("in.dtk", "out.dtk")
+#
+# Every node is uncompressed and parsed once, all stages are applied to it and
+# it is compressed again before the next node is read.
+# -----------------------------------------------------------------------------
+import argparse
+import importlib
+import os
+import time
+from pathlib import Path
+from typing import List
+
+import emod_api.serialization.dtkFileTools as dft
+
+import dtk_index
+import zero_infections
+import replace_genomes
+from instrumentation import Instrumentation, QUIET, print_sink
+
+
+class PopulationTransform:
+    """
+    Base class of the stages of a :py:class:`SerializedPopulationPipeline`.
+
+    begin() is called once with the simulation before the first node, transform_node() once for every node and
+    end() once after the last node. Changes to the simulation (e.g. the genome map) are written to the output file.
+    """
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    def begin(self, simulation: dict):
+        pass
+
+    def transform_node(self, node: dict, simulation: dict):
+        raise NotImplementedError("Transforms must implement transform_node().")
+
+    def end(self, simulation: dict):
+        pass
+
+
+class ZeroInfections(PopulationTransform):
+    """
+    Removes/Resets infections from humans and vectors, see :py:func:`zero_infections.zero_infections`.
+
+    Args:
+        ignore_nodes: list of node ids. These nodes are skipped.
+        keep_individuals: Ids of individuals. These individuals are skipped.
+        selection: optional :py:class:`zero_infections.HumanSelection` of additional individuals that are skipped.
+        remove: If true infections are removed from vectors, if false infections are reset.
+    """
+    def __init__(self, ignore_nodes: List[int] = None, keep_individuals: List[int] = None,
+                 selection: zero_infections.HumanSelection = None, remove: bool = False):
+        self.ignore_nodes = set(ignore_nodes) if ignore_nodes else set()
+        self.keep_individuals = set(keep_individuals) if keep_individuals else set()
+        self.selection = selection
+        self.remove = remove
+
+    def transform_node(self, node, simulation):
+        if node["externalId"] in self.ignore_nodes:
+            return
+        zero_infections.zero_vector_infections(node["m_vectorpopulations"], self.remove)
+        humans = node["individualHumans"]
+        keep_mask = self.selection.keep_mask(humans, node["externalId"]) if self.selection else None
+        zero_infections.zero_human_infections(humans, self.keep_individuals, keep_mask)
+
+
+class ReplaceGenomes(PopulationTransform):
+    """
+    Replaces genomes in infected individuals and vectors, see :py:func:`replace_genomes.replace_genomes`.
+
+    Args:
+        next_barcode_fn: Function that return the next barcode.
+    """
+    def __init__(self, next_barcode_fn):
+        if next_barcode_fn is None:
+            raise ValueError("You must provide a function that returns the next barcode string")
+        self.next_barcode_fn = next_barcode_fn
+        self.cache_genome_map = {}
+        self.genome_map = None
+
+    def begin(self, simulation):
+        self.genome_map = simulation["ParasiteGenetics"]["m_ParasiteGenomeMap"]
+        self.genome_map.clear()
+        self.cache_genome_map = {}
+
+    def transform_node(self, node, simulation):
+        replace_genomes.replace_node_genomes(node, self.next_barcode_fn, self.genome_map, self.cache_genome_map)
+
+
+class SetIndividualProperty(PopulationTransform):
+    """
+    Sets an individual property of humans. Individual properties are serialized as list of "Key:Value" strings.
+
+    Args:
+        key: individual property key, e.g. "Risk"
+        value: individual property value, e.g. "HIGH"
+        selection: optional :py:class:`zero_infections.HumanSelection`, only selected humans are changed.
+            Defaults to all humans.
+        node_ids: optional list of node ids, only humans in these nodes are changed. Defaults to all nodes.
+    """
+    def __init__(self, key: str, value: str, selection: zero_infections.HumanSelection = None,
+                 node_ids: List[int] = None):
+        self.key = key
+        self.key_value = f"{key}:{value}"
+        self.selection = selection
+        self.node_ids = set(node_ids) if node_ids else None
+
+    def transform_node(self, node, simulation):
+        if self.node_ids is not None and node["externalId"] not in self.node_ids:
+            return
+        humans = node["individualHumans"]
+        if self.selection:
+            indices = self.selection.keep_mask(humans, node["externalId"]).nonzero()[0]
+        else:
+            indices = range(len(humans))
+        prefix = self.key + ":"
+        for index in indices:
+            person = humans[index]
+            properties = [kv for kv in person.get("Properties", []) if not kv.startswith(prefix)]
+            properties.append(self.key_value)
+            person["Properties"] = properties
+
+
+class SerializedPopulationPipeline:
+    """
+    Applies a list of :py:class:`PopulationTransform` to a serialized population in one read/write pass.
+
+    Args:
+        stages: transforms, applied in order to every node.
+
+    Examples:
+        Zero infections and replace genomes::
+
+            pipeline = SerializedPopulationPipeline([ZeroInfections(keep_individuals=[3, 4]),
+                                                     ReplaceGenomes(get_next_barcode)])
+            timings = pipeline.run("state-00365.dtk", "state-00365_zero.dtk")
+    """
+    def __init__(self, stages: List[PopulationTransform]):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.timings = {}
+
+    def _time(self, key, seconds):
+        self.timings[key] = self.timings.get(key, 0.0) + seconds
+
+    def run(self, input_file, output_file, verbose: bool = False,
+            instrumentation: Instrumentation = QUIET) -> dict:
+        """
+        Reads input_file, applies all stages and writes output_file.
+
+        Args:
+            input_file: serialized population file
+            output_file: output file, parent directories are created
+            verbose: if True the total timings are printed
+            instrumentation: receives "read", "node", "stage", "write" and "run" records with timings, counts of
+                humans, infections, vector cohorts and genomes, bytes read and written and peak RSS.
+
+        Returns:
+            Dictionary with the seconds spent reading, writing, parsing nodes and in each stage.
+        """
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Couldn't find specified input file: {input_file}.")
+        self.timings = {}
+        tic_run = time.perf_counter()
+
+        tic = time.perf_counter()
+        dtk_file = dft.read(input_file)
+        simulation = dtk_file.simulation
+        self._time("read", time.perf_counter() - tic)
+        instrumentation.emit("read", file=str(input_file), bytes_read=os.path.getsize(input_file),
+                             seconds=self.timings["read"], genomes=_genome_count(simulation))
+
+        for stage in self.stages:
+            tic = time.perf_counter()
+            stage.begin(simulation)
+            self._time(stage.name, time.perf_counter() - tic)
+
+        nodes = dtk_file.nodes
+        for index in range(len(nodes)):
+            node_seconds = {}
+            tic = time.perf_counter()
+            node = nodes[index]
+            node_seconds["load"] = time.perf_counter() - tic
+            for stage in self.stages:
+                tic = time.perf_counter()
+                stage.transform_node(node, simulation)
+                node_seconds[stage.name] = time.perf_counter() - tic
+            if instrumentation.enabled:
+                instrumentation.emit("node", node_id=node["externalId"], seconds=dict(node_seconds),
+                                     **_node_counts(node))
+            tic = time.perf_counter()
+            nodes[index] = node     # re-serialize and compress the node before the next one is loaded
+            if hasattr(node, "store"):
+                node.store()
+            node_seconds["store"] = time.perf_counter() - tic
+            for key, seconds in node_seconds.items():
+                self._time(key + "_nodes" if key in ["load", "store"] else key, seconds)
+
+        for stage in self.stages:
+            tic = time.perf_counter()
+            stage.end(simulation)
+            self._time(stage.name, time.perf_counter() - tic)
+            instrumentation.emit("stage", stage=stage.name, seconds=self.timings[stage.name])
+
+        tic = time.perf_counter()
+        dtk_file.simulation = simulation
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        dft.write(dtk_file, str(output_file))
+        self._time("write", time.perf_counter() - tic)
+        instrumentation.emit("write", file=str(output_file), bytes_written=os.path.getsize(output_file),
+                             seconds=self.timings["write"], genomes=_genome_count(simulation))
+        instrumentation.emit("run", nodes=len(nodes), seconds=time.perf_counter() - tic_run,
+                             timings=dict(self.timings))
+
+        if verbose:
+            for key, seconds in self.timings.items():
+                print(f"{key:>24}: {seconds:0.4f} s")
+        return dict(self.timings)
+
+
+def _genome_count(simulation: dict) -> int:
+    if "ParasiteGenetics" not in simulation:
+        return 0
+    return len(simulation["ParasiteGenetics"].get("m_ParasiteGenomeMap", []))
+
+
+def _node_counts(node: dict) -> dict:
+    counts = dtk_index.count_humans(node["individualHumans"])
+    counts["vector_cohorts"] = sum(species["cohorts"] for species in
+                                   dtk_index.count_vectors(node.get("m_vectorpopulations", [])).values())
+    return counts
+
+
+def _import_function(module_function: str):
+    module_name, _, function_name = module_function.partition(":")
+    return getattr(importlib.import_module(module_name), function_name or "get_next_barcode")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply several transforms to a serialized population in one pass.",
+                                     epilog="E.g. python pipeline.py -i state-00050.dtk -o out.dtk --zero -k 1 2 "
+                                            "--replace_genomes replace_genomes_get_next_barcode:get_next_barcode "
+                                            "--set_property Risk:HIGH")
+    parser.add_argument("-i", "--input_file", type=Path, required=True, help="Serialized population file.")
+    parser.add_argument("-o", "--output_file", type=Path, required=True, help="Serialized population output file.")
+    parser.add_argument("--zero", action="store_true", help="Zero infections in humans and vectors.")
+    parser.add_argument("--ignore", default=[], type=int, nargs="+", help="Nodes that are not zeroed.")
+    parser.add_argument("-k", "--keep", default=[], type=int, nargs="*", help="Individuals that keep their infections.")
+    parser.add_argument("--remove", action="store_true", help="Remove instead of reset infected vectors.")
+    parser.add_argument("--replace_genomes", type=str, default=None,
+                        help="module:function that returns the next barcode, e.g. "
+                             "replace_genomes_get_next_barcode:get_next_barcode")
+    parser.add_argument("--set_property", type=str, default=[], nargs="+",
+                        help="Individual properties Key:Value set for all humans.")
+    parser.add_argument("-p", "--profile", type=Path, default=None,
+                        help="Write profiling records as JSON lines to this file.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print profiling records.")
+    args = parser.parse_args()
+
+    stages = []
+    if args.zero:
+        stages.append(ZeroInfections(args.ignore, args.keep, remove=args.remove))
+    if args.replace_genomes:
+        stages.append(ReplaceGenomes(_import_function(args.replace_genomes)))
+    for key_value in args.set_property:
+        key, _, value = key_value.partition(":")
+        stages.append(SetIndividualProperty(key, value))
+
+    if not stages:
+        parser.print_help()
+        exit(0)
+
+    if args.profile:
+        instrumentation = Instrumentation.to_jsonl(args.profile)
+    else:
+        instrumentation = Instrumentation(print_sink) if args.verbose else QUIET
+    SerializedPopulationPipeline(stages).run(args.input_file, args.output_file, instrumentation=instrumentation)
+    instrumentation.close()
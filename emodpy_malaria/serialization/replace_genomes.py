@@ -9,6 +9,7 @@ import numpy
 import emod_api.serialization.SerializedPopulation as SerPop
 from pathlib import Path
 import importlib
+from instrumentation import Instrumentation, QUIET
 
 
 class Genome:
@@ -122,7 +123,68 @@ def get_next_genome(next_barcode_fn, allele_root_id, ser_pop_genome_map, cache_g
     return dtk_genome_obj
 
 
-def replace_genomes(input_file, next_barcode_fn, output_file):
+def replace_node_genomes(node, next_barcode_fn, ser_pop_genome_map, cache_genome_map, instrumentation=QUIET):
+    """
+    Replaces genomes in infected individuals and vectors of one node.
+    Args:
+        node (): serialized node
+        next_barcode_fn (): Function that return the next barcode.
+        ser_pop_genome_map (): m_ParasiteGenomeMap of the simulation, new genomes are appended.
+        cache_genome_map (): Dictionary of genomes already created, shared between nodes.
+        instrumentation (): Receives one record with timing and counts for the humans and one per vector population.
+
+    Returns:
+        Nothing
+    """
+    tic1 = time.perf_counter()
+    num_infections = 0
+    for person in node["individualHumans"]:
+        # print("------------ " + str(person["suid"]["id"]) + " -----------------")
+        for infection in person["infections"]:
+            next_genome = get_next_genome(next_barcode_fn, person["suid"]["id"], ser_pop_genome_map, cache_genome_map)
+            length_barcode = len(infection["infection_strain"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
+            assert length_barcode == len(next_genome["m_pInner"]["m_NucleotideSequence"]), f"New barcode has wrong length."
+            infection["infection_strain"]["m_Genome"] = next_genome
+            num_infections += 1
+
+    tic2 = time.perf_counter()
+    instrumentation.emit("replace_genomes.humans", node_id=node["externalId"], seconds=tic2 - tic1,
+                         humans=len(node["individualHumans"]), infections=num_infections,
+                         genomes=len(ser_pop_genome_map))
+
+    for vector_pop in node["m_vectorpopulations"]:
+        tic1 = time.perf_counter()
+        for vector in vector_pop["AdultQueues"]["collection"]:
+           # print("------------ VECTOR " + str(vector["m_ID"]) + " -----------------")
+            for oocyst in vector["m_OocystCohorts"]:
+                genome_oocyst = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
+                length_oocyst_barcode = len(oocyst["m_MaleGametocyteGenome"]["m_pInner"]["m_NucleotideSequence"])
+                assert len(genome_oocyst["m_pInner"]["m_NucleotideSequence"]) == length_oocyst_barcode, f"New barcode has wrong length."
+                oocyst["m_MaleGametocyteGenome"] = genome_oocyst
+
+                genome_oocyst = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
+                length_oocyst_barcode = len(oocyst["m_pStrainIdentity"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
+                assert len(genome_oocyst["m_pInner"]["m_NucleotideSequence"]) == length_oocyst_barcode, f"New barcode has wrong length."
+                oocyst["m_pStrainIdentity"]["m_Genome"] = genome_oocyst
+
+            for sporo in vector["m_SporozoiteCohorts"]:
+                genome_sporo = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
+                length_sporo_barcode = len(sporo["m_MaleGametocyteGenome"]["m_pInner"]["m_NucleotideSequence"])
+                assert len(genome_sporo["m_pInner"]["m_NucleotideSequence"]) == length_sporo_barcode, f"New barcode has wrong length."
+                sporo["m_MaleGametocyteGenome"] = genome_sporo
+
+                genome_sporo = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
+                length_sporo_barcode = len(sporo["m_pStrainIdentity"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
+                assert len(genome_sporo["m_pInner"]["m_NucleotideSequence"]) == length_sporo_barcode, f"New barcode has wrong length."
+                sporo["m_pStrainIdentity"]["m_Genome"] = genome_sporo
+
+        tic2 = time.perf_counter()
+        instrumentation.emit("replace_genomes.vectors", node_id=node["externalId"], seconds=tic2 - tic1,
+                             species=vector_pop.get("species_ID"), cohorts=len(vector_pop["AdultQueues"]["collection"]),
+                             genomes=len(ser_pop_genome_map))
+
+
+def replace_genomes(input_file, next_barcode_fn, output_file, instrumentation=QUIET):
     """
     Replaces genomes in infected individuals and vectors.
     Args:
@@ -130,6 +192,7 @@ def replace_genomes(input_file, next_barcode_fn, output_file):
         next_barcode_fn (): Function that return the next barcode. The function is called once for every infection of an
          individual and once for every vector in the vector population.
         output_file (): Output file with replaced genomes.
+        instrumentation (): Optional :py:class:`instrumentation.Instrumentation` receiving per node records.
 
     Returns:
         Nothing
@@ -146,47 +209,7 @@ def replace_genomes(input_file, next_barcode_fn, output_file):
     cache_genome_map = {}
 
     for node in pop.nodes:
-        tic1 = time.perf_counter()
-        for person in node["individualHumans"]:
-            # print("------------ " + str(person["suid"]["id"]) + " -----------------")
-            for infection in person["infections"]:
-                next_genome = get_next_genome(next_barcode_fn, person["suid"]["id"], ser_pop_genome_map, cache_genome_map)
-                length_barcode = len(infection["infection_strain"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
-                assert length_barcode == len(next_genome["m_pInner"]["m_NucleotideSequence"]), f"New barcode has wrong length."
-                infection["infection_strain"]["m_Genome"] = next_genome
-
-        tic2 = time.perf_counter()
-        print(f"{tic2 - tic1:0.4f}")
-
-        for vector_pop in node["m_vectorpopulations"]:
-            print(len(vector_pop["AdultQueues"]))
-            tic1 = time.perf_counter()
-            for vector in vector_pop["AdultQueues"]["collection"]:
-               # print("------------ VECTOR " + str(vector["m_ID"]) + " -----------------")
-                for oocyst in vector["m_OocystCohorts"]:
-                    genome_oocyst = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
-                    length_oocyst_barcode = len(oocyst["m_MaleGametocyteGenome"]["m_pInner"]["m_NucleotideSequence"])
-                    assert len(genome_oocyst["m_pInner"]["m_NucleotideSequence"]) == length_oocyst_barcode, f"New barcode has wrong length."
-                    oocyst["m_MaleGametocyteGenome"] = genome_oocyst
-
-                    genome_oocyst = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
-                    length_oocyst_barcode = len(oocyst["m_pStrainIdentity"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
-                    assert len(genome_oocyst["m_pInner"]["m_NucleotideSequence"]) == length_oocyst_barcode, f"New barcode has wrong length."
-                    oocyst["m_pStrainIdentity"]["m_Genome"] = genome_oocyst
-
-                for sporo in vector["m_SporozoiteCohorts"]:
-                    genome_sporo = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
-                    length_sporo_barcode = len(sporo["m_MaleGametocyteGenome"]["m_pInner"]["m_NucleotideSequence"])
-                    assert len(genome_sporo["m_pInner"]["m_NucleotideSequence"]) == length_sporo_barcode, f"New barcode has wrong length."
-                    sporo["m_MaleGametocyteGenome"] = genome_sporo
-
-                    genome_sporo = get_next_genome(next_barcode_fn, -999, ser_pop_genome_map, cache_genome_map)
-                    length_sporo_barcode = len(sporo["m_pStrainIdentity"]["m_Genome"]["m_pInner"]["m_NucleotideSequence"])
-                    assert len(genome_sporo["m_pInner"]["m_NucleotideSequence"]) == length_sporo_barcode, f"New barcode has wrong length."
-                    sporo["m_pStrainIdentity"]["m_Genome"] = genome_sporo
-
-            tic2 = time.perf_counter()
-            print(f"{tic2 - tic1:0.4f}")
+        replace_node_genomes(node, next_barcode_fn, ser_pop_genome_map, cache_genome_map, instrumentation)
 
     pop.write(output_file)
 
@@ -224,6 +247,7 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--output_file", type=Path, required=True, help="Serialized population output file.")
     parser.add_argument("-m", "--module", type=str, default="replace_genomes_get_next_barcode", help="Module that contains the function to generate the barcodes.")
     parser.add_argument("-f", "--get_next_barcode_func", type=str, default="get_next_barcode", help="Name of the function that returns the barcodes")
+    parser.add_argument("-p", "--profile", type=Path, default=None, help="Write profiling records as JSON lines to this file.")
     args = parser.parse_args()
 
     try:
@@ -233,7 +257,9 @@ if __name__ == "__main__":
         print("Current working directory:", os.getcwd())
         exit(-1)
 
-    replace_genomes(args.input_file, eval("user_defined_mod." + args.get_next_barcode_func), args.output_file)
+    instrumentation = Instrumentation.to_jsonl(args.profile) if args.profile else QUIET
+    replace_genomes(args.input_file, eval("user_defined_mod." + args.get_next_barcode_func), args.output_file, instrumentation)
+    instrumentation.close()
 
     # importlib.reload(user_defined_mod)  # reimport module to reinitialize variables in module containing function to get next barcode
     # test_replace_genomes(args.output_file, eval("user_defined_mod." + args.get_next_barcode_func))
\ No newline at end of file
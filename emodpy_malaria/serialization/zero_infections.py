@@ -4,8 +4,12 @@ from __future__ import print_function
 import argparse
 import emod_api.serialization.SerializedPopulation as SerPop
 import emod_api.serialization.dtkFileSupport as dtk
+import numpy
+import os
+import time
 from pathlib import Path
 from typing import List
+from instrumentation import Instrumentation, QUIET, print_sink
 
 # VectorStateEnum defined in VectorEnums.h
 STATE_INFECTIOUS = 0
@@ -16,6 +20,8 @@ STATE_IMMATURE = 4
 STATE_LARVA = 5
 STATE_EGG = 6
 
+DAYS_PER_YEAR = 365
+
 Infection_Queues = ["InfectiousQueues", "InfectedQueues", "AdultQueues"]
 
 # To be considered infection free an individual must have these values
@@ -60,28 +66,176 @@ def zero_vector_infections(vector_pop_list: list, remove=False):
                     cohort.m_pStrain = dtk.NullPtr()
 
 
-def zero_human_infections(humans: List[dict], keep_ids: list = []):
+class HumanColumns:
+    """
+    Column view of the humans in a node. Columns are extracted into NumPy arrays the first time they are accessed
+    so predicates only pay for the attributes they use.
+
+    Args:
+        humans: All humans in a node
+        node_id: external id of the node the humans belong to
+    """
+    def __init__(self, humans: List[dict], node_id: int = None):
+        self.humans = humans
+        self.node_id = node_id
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.humans)
+
+    def _column(self, name, getter, dtype):
+        if name not in self._cache:
+            self._cache[name] = numpy.fromiter((getter(person) for person in self.humans), dtype=dtype,
+                                               count=len(self.humans))
+        return self._cache[name]
+
+    @property
+    def ids(self) -> numpy.ndarray:
+        """Individual ids (suid)"""
+        return self._column("ids", lambda person: person["suid"]["id"], numpy.int64)
+
+    @property
+    def ages(self) -> numpy.ndarray:
+        """Age of individuals in days"""
+        return self._column("ages", lambda person: person["m_age"], numpy.float64)
+
+    @property
+    def is_infected(self) -> numpy.ndarray:
+        """Infection flag of individuals"""
+        return self._column("is_infected", lambda person: person["m_is_infected"], bool)
+
+    def property_values(self, key: str) -> numpy.ndarray:
+        """
+        Values of an individual property, e.g. property_values("Risk") returns "HIGH", "LOW", ..., for every human.
+        Individual properties are serialized as list of "Key:Value" strings. Humans without the key get None.
+        """
+        def get_value(person):
+            for key_value in person.get("Properties", []):
+                k, _, v = key_value.partition(":")
+                if k == key:
+                    return v
+            return None
+        return self._column("property:" + key, get_value, object)
+
+
+def age_between(min_age_years: float = 0, max_age_years: float = float("inf")):
+    """
+    Returns a vectorized predicate selecting humans with min_age_years <= age < max_age_years.
+    """
+    def predicate(columns: HumanColumns) -> numpy.ndarray:
+        ages = columns.ages
+        return (ages >= min_age_years * DAYS_PER_YEAR) & (ages < max_age_years * DAYS_PER_YEAR)
+    return predicate
+
+
+def has_individual_property(key: str, values):
+    """
+    Returns a vectorized predicate selecting humans with individual property key set to one of values.
+    """
+    values = {values} if isinstance(values, str) else set(values)
+
+    def predicate(columns: HumanColumns) -> numpy.ndarray:
+        return numpy.isin(columns.property_values(key), list(values))
+    return predicate
+
+
+def in_nodes(node_ids: List[int]):
+    """
+    Returns a vectorized predicate selecting all humans of the given nodes.
+    """
+    node_ids = set(node_ids)
+
+    def predicate(columns: HumanColumns) -> numpy.ndarray:
+        return numpy.full(len(columns), columns.node_id in node_ids, dtype=bool)
+    return predicate
+
+
+class HumanSelection:
+    """
+    Selects the humans of a node whose infection state is kept, i.e. not changed.
+    A human is selected if it matches any of keep_ids, keep_id_ranges or predicates.
+
+    Args:
+        keep_ids: ids of individuals, converted to a sorted array once so a node is matched in O(n log k).
+        keep_id_ranges: list of (first_id, last_id) tuples, both inclusive.
+        predicates: list of vectorized predicates, functions that take a :py:class:`HumanColumns` and return a
+            boolean NumPy mask, e.g. :py:func:`age_between`, :py:func:`has_individual_property`, :py:func:`in_nodes`.
+    """
+    def __init__(self, keep_ids=None, keep_id_ranges: List[tuple] = None, predicates: list = None):
+        self.keep_ids = numpy.unique(numpy.fromiter(keep_ids, dtype=numpy.int64)) if keep_ids else None
+        self.keep_id_ranges = list(keep_id_ranges) if keep_id_ranges else []
+        self.predicates = list(predicates) if predicates else []
+
+    def keep_mask(self, humans: List[dict], node_id: int = None) -> numpy.ndarray:
+        """
+        Returns a boolean mask with one entry per human, True for humans that keep their infections.
+        """
+        columns = HumanColumns(humans, node_id)
+        mask = numpy.zeros(len(humans), dtype=bool)
+        if not humans:
+            return mask
+        if self.keep_ids is not None:
+            mask |= numpy.isin(columns.ids, self.keep_ids)
+        for first_id, last_id in self.keep_id_ranges:
+            ids = columns.ids
+            mask |= (ids >= first_id) & (ids <= last_id)
+        for predicate in self.predicates:
+            mask |= numpy.asarray(predicate(columns), dtype=bool)
+        return mask
+
+
+def _check_uninfected_template(humans: List[dict]):
+    """
+    Checks that every serialized human has all keys of UNINFECTED_HUMAN, so resetting a human never adds keys to
+    it. Raises on the first human that differs.
+    """
+    template_keys = UNINFECTED_HUMAN.keys()
+    for human in humans:
+        if not template_keys <= human.keys():
+            missing_keys = set(UNINFECTED_HUMAN).difference(set(human))
+            raise KeyError("Template Uninfected Human and human of serialized population differ in the following key(s): ", missing_keys)
+
+
+def zero_human_infections(humans: List[dict], keep_ids=[], keep_mask=None, node_id: int = None):
     """
     Sets the infection state of individuals to uninfected.
 
     Args:
         humans: All humans in a node
-        keep_ids: ids of individuals that will be skipped, i.e. infection state is not changed
+        keep_ids: ids of individuals that will be skipped, i.e. infection state is not changed. Either a list/set of
+            ids or a :py:class:`HumanSelection`.
+        keep_mask: optional boolean NumPy mask (one entry per human), True for individuals that will be skipped.
+        node_id: external id of the node, passed to the predicates of a :py:class:`HumanSelection`.
 
     Returns:
-        None
+        The number of humans whose infection state was reset.
 
     """
-    for person in humans:
-        if person.suid.id not in keep_ids:
-            if all(key in person for key in UNINFECTED_HUMAN):
-                person.update(UNINFECTED_HUMAN)
-            else:
-                missing_keys = set(UNINFECTED_HUMAN).difference(set(person))
-                raise KeyError("Template Uninfected Human and human of serialized population differ in the following key(s): ", missing_keys )
+    _check_uninfected_template(humans)
 
+    if isinstance(keep_ids, HumanSelection):
+        mask = keep_ids.keep_mask(humans, node_id)
+    elif keep_ids:
+        keep = keep_ids if isinstance(keep_ids, (set, frozenset)) else set(keep_ids)
+        mask = numpy.fromiter((person["suid"]["id"] in keep for person in humans), dtype=bool, count=len(humans))
+    else:
+        mask = numpy.zeros(len(humans), dtype=bool)
+
+    if keep_mask is not None:
+        keep_mask = numpy.asarray(keep_mask, dtype=bool)
+        if keep_mask.shape != (len(humans),):
+            raise ValueError(f"keep_mask has {keep_mask.size} entries but the node has {len(humans)} humans.")
+        mask |= keep_mask
+
+    reset = numpy.flatnonzero(~mask)
+    for index in reset:
+        humans[index].update(UNINFECTED_HUMAN)
+    return len(reset)
 
-def zero_infections(source_filename: str, dest_filename: str, ignore_nodes: List[int], keep_individuals: List[int], remove=False) -> None:
+
+def zero_infections(source_filename: str, dest_filename: str, ignore_nodes: List[int], keep_individuals: List[int],
+                    remove=False, selection: HumanSelection = None,
+                    instrumentation: Instrumentation = QUIET) -> None:
     """
     Removes/Resets infections from humans and vectors.
 
@@ -91,33 +245,40 @@ def zero_infections(source_filename: str, dest_filename: str, ignore_nodes: List
         ignore_nodes: list of node ids. These nodes are skipped.
         keep_individuals: Ids of individuals. These individuals are skipped.
         remove: If true infections are removed from vectors, if false infections are reset.
+        selection: optional :py:class:`HumanSelection` of additional individuals that are skipped, e.g. id ranges or
+            individuals in an age range.
+        instrumentation: receives a "read" record, one "node" record per node with the number of humans and of
+            humans reset and a "write" record. Quiet by default.
 
     Returns:
         None
     """
-    print('Ignoring nodes {0}'.format(ignore_nodes))
-    print('Keeping infections in humans {0}'.format(keep_individuals))
-    print("Reading file: '{0}'".format(source_filename))
-
-    ser_pop = SerPop.SerializedPopulation(source_filename)
-
-    for index, node in enumerate(ser_pop.nodes):
-        print('Reading node {0} with node_id: {1}'.format(index, node.externalId))
-        if node.externalId not in ignore_nodes:
-            print('Zeroing vector infections')
+    ignore_nodes = set(ignore_nodes)
+    keep_individuals = set(keep_individuals)
+    with instrumentation.measure("read", file=str(source_filename), bytes_read=os.path.getsize(source_filename),
+                                 ignore_nodes=sorted(ignore_nodes), keep_individuals=len(keep_individuals)):
+        ser_pop = SerPop.SerializedPopulation(source_filename)
+
+    for node in ser_pop.nodes:
+        with instrumentation.measure("node", node_id=node.externalId) as record:
+            if node.externalId in ignore_nodes:
+                record["ignored"] = True
+                continue
             zero_vector_infections(node.m_vectorpopulations, remove)
-            print('Zeroing human infections')
-            zero_human_infections(node.individualHumans, keep_individuals)
-        else:
-            print('Ignoring node {0}'.format(index))
+            keep_mask = selection.keep_mask(node.individualHumans, node.externalId) if selection else None
+            record["humans"] = len(node.individualHumans)
+            record["humans_reset"] = zero_human_infections(node.individualHumans, keep_individuals, keep_mask)
 
     # create output path if it doesn't exist
     out_path = Path(dest_filename).parent
     out_path.mkdir(parents=True, exist_ok=True)
+    tic = time.perf_counter()
     ser_pop.write(dest_filename)
+    instrumentation.emit("write", file=str(dest_filename), bytes_written=os.path.getsize(dest_filename),
+                         seconds=time.perf_counter() - tic)
 
 
-def _get_paths(ser_paths: List[str], ser_date: List[str]) -> List[str]:
+def _get_paths(ser_paths: List[str], ser_date: List[str], instrumentation: Instrumentation = QUIET) -> List[str]:
     """
     Get the path to all dtk files with a certain time stamp in a list of directories.
     Files with 'zero' in the name are skipped.
@@ -125,28 +286,28 @@ def _get_paths(ser_paths: List[str], ser_date: List[str]) -> List[str]:
     Args:
         ser_paths: a list of directories to look into for *.dtk files
         ser_date: list of time stamps
+        instrumentation: receives one "file" record per matching file, with "skipped" set for files that are
+            already zeroed.
 
     Returns: A list of paths to dtk files
 
     """
-    print("ser_paths: ", ser_paths)
     files = []
-    for s, serpath in enumerate(ser_paths):
-        print('Processing simulation %d of %d' % (s+1, len(ser_paths)))
+    for serpath in ser_paths:
         dtk_files = [x.name for x in Path(serpath).glob('*.dtk')]
         serialization_files = [Path(serpath, x) for x in dtk_files if ('zero' not in x and any(map(lambda s: s in x, ser_date)))]
 
         for filename in serialization_files:
             output_filename = Path(filename.parent, filename.stem + '_zero' + filename.suffix)
-            if output_filename.name in [x.name for x in Path(serpath).glob('*.dtk')]:
-                print(output_filename.name, ' already zeroed')
-                continue
-            print('Found: {0}   Output: {1}'.format(filename, output_filename))
-            files.append([filename, output_filename])
+            skipped = output_filename.name in dtk_files
+            instrumentation.emit("file", file=str(filename), output_file=str(output_filename), skipped=skipped)
+            if not skipped:
+                files.append([filename, output_filename])
     return files
 
 
-def zero_infection_path(in_out_paths: list, ser_date: list, ignore_nodeids: list = [], keep_humanids: list = []):
+def zero_infection_path(in_out_paths: list, ser_date: list, ignore_nodeids: list = [], keep_humanids: list = [],
+                        instrumentation: Instrumentation = QUIET):
     """
     Loop over all *.dtk files in ser_paths that have ser_date in the file name but not 'zero' and remove human and vector infections.
     '_zero' is appended to the output files.
@@ -156,11 +317,12 @@ def zero_infection_path(in_out_paths: list, ser_date: list, ignore_nodeids: list
         ser_paths: Paths
         ignore_nodeids: list of nodes that are ignored
         keep_humanids: infections are not removed from these humans
+        instrumentation: receives the records of :py:func:`_get_paths` and :py:func:`zero_infections`.
 
     """
-    file_paths = _get_paths(in_out_paths, ser_date)
+    file_paths = _get_paths(in_out_paths, ser_date, instrumentation)
     for in_path, out_path in file_paths:
-        zero_infections(in_path, out_path, ignore_nodeids, keep_humanids)
+        zero_infections(in_path, out_path, ignore_nodeids, keep_humanids, instrumentation=instrumentation)
 
 
 if __name__ == '__main__':
@@ -176,17 +338,25 @@ if __name__ == '__main__':
     remove_from_paths_group.add_argument("-p", "--paths", default=[], nargs='+', type=Path, help="List of paths containing the dtk files.")
     remove_from_paths_group.add_argument("-t", "--time_stamps", default=[], nargs='+', type=str, help="List of timesteps. Filenames containing this timestep are processed, e.g. 001,021,365 ")
 
+    parser.add_argument("--profile", type=Path, default=None, help="Write profiling records as JSON lines to this file.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print profiling records.")
+
     args = parser.parse_args()
+    if args.profile:
+        instrumentation = Instrumentation.to_jsonl(args.profile)
+    else:
+        instrumentation = Instrumentation(print_sink) if args.verbose else QUIET
 
     # Not all combinations of parameters are  allowed
     if args.source and not (args.paths or args.time_stamps):
-        zero_infections(args.source, args.destination, args.ignore, args.keep)
+        zero_infections(args.source, args.destination, args.ignore, args.keep, instrumentation=instrumentation)
 
     elif args.paths and not args.source:
-        zero_infection_path(args.paths, args.time_stamps, args.ignore, args.keep)
+        zero_infection_path(args.paths, args.time_stamps, args.ignore, args.keep, instrumentation)
 
     else:
         parser.print_help()
         exit(0)
+    instrumentation.close()
 
 
@@ -0,0 +1,176 @@
+"""
+Creates small synthetic serialized population files so the serialization tools can be tested without
+running a burn-in first.
+"""
+import json
+import sys
+
+sys.path.append('../../emodpy_malaria/serialization')
+import emod_api.serialization.dtkFileTools as dft
+import emod_api.serialization.dtkFileSupport as dtk
+import zero_infections
+from replace_genomes import Genome
+
+BARCODES = ["AAAA", "CCCC", "GGGG", "TTTT"]
+
+
+def make_genome(barcode: str = "AAAA", allele_root: int = 0) -> dict:
+    return Genome.create_genome(barcode, allele_root).to_dtk_dict()
+
+
+def make_human(suid: int, age_days: float, infected: bool, barcode: str = "AAAA", properties: list = None) -> dict:
+    human = {"__class__": "IndividualHumanMalaria", "suid": {"id": suid}, "m_age": age_days,
+             "m_gender": suid % 2, "Properties": properties if properties else ["Risk:LOW"],
+             "susceptibility": {"age": age_days}}
+    human.update(json.loads(json.dumps(zero_infections.UNINFECTED_HUMAN)))
+    if infected:
+        human["infections"] = [{"suid": {"id": 1000 + suid},
+                                "infection_strain": {"m_Genome": make_genome(barcode, suid)}}]
+        human["m_is_infected"] = True
+        human["infectiousness"] = 0.25
+    return human
+
+
+def make_cohort(m_id: int, state: int, population: int, barcode: str = None, age: float = 0.0) -> dict:
+    cohort = {"__class__": "VectorCohort", "m_ID": m_id, "state": state, "progress": 0.5 if state < 2 else 0.0,
+              "population": population, "age": age, "m_pStrain": dtk.NullPtr(),
+              "m_Genome": {"m_Bits": 0}, "m_bHasMicrosporidia": False,
+              "m_OocystCohorts": [], "m_SporozoiteCohorts": []}
+    if barcode:
+        cohort["m_pStrain"] = {"m_Genome": make_genome(barcode, -999)}
+        sporo = {"m_MaleGametocyteGenome": make_genome(barcode, -999),
+                 "m_pStrainIdentity": {"m_Genome": make_genome(barcode, -999)}}
+        cohort["m_SporozoiteCohorts" if state == zero_infections.STATE_INFECTIOUS else "m_OocystCohorts"].append(sporo)
+    return cohort
+
+
+def make_node(external_id: int, num_humans: int, first_suid: int = 1) -> dict:
+    """
+    Every other human is infected; one adult, one infected and one infectious cohort per 10 humans.
+    """
+    humans = [make_human(suid, 365.0 * (suid % 60), suid % 2 == 1, BARCODES[suid % len(BARCODES)])
+              for suid in range(first_suid, first_suid + num_humans)]
+    adults, infected, infectious = [], [], []
+    for idx in range(max(1, num_humans // 10)):
+        adults.append(make_cohort(3 * idx, zero_infections.STATE_ADULT, 100, age=float(idx % 3)))
+        infected.append(make_cohort(3 * idx + 1, zero_infections.STATE_INFECTED, 10, BARCODES[idx % 4]))
+        infectious.append(make_cohort(3 * idx + 2, zero_infections.STATE_INFECTIOUS, 5, BARCODES[(idx + 1) % 4]))
+    vector_population = {"species_ID": "gambiae",
+                         "AdultQueues": {"collection": adults},
+                         "InfectedQueues": {"collection": infected},
+                         "InfectiousQueues": {"collection": infectious},
+                         "MaleQueues": {"collection": []}}
+    return {"__class__": "NodeMalaria", "externalId": external_id, "suid": {"id": external_id},
+            "individualHumans": humans, "m_vectorpopulations": [vector_population],
+            "m_IndividualHumanSuidGenerator": {"next_suid": {"id": first_suid + num_humans}, "numtasks": 1}}
+
+
+def all_genomes(nodes: list) -> list:
+    """Genome map entries for every genome referenced in nodes."""
+    entries = {}
+    for node in nodes:
+        for human in node["individualHumans"]:
+            for infection in human["infections"]:
+                inner = infection["infection_strain"]["m_Genome"]["m_pInner"]
+                entries[inner["m_HashCode"]] = inner
+        for queue in ["AdultQueues", "InfectedQueues", "InfectiousQueues"]:
+            for cohort in node["m_vectorpopulations"][0][queue]["collection"]:
+                for sub in cohort["m_OocystCohorts"] + cohort["m_SporozoiteCohorts"]:
+                    for genome in [sub["m_MaleGametocyteGenome"], sub["m_pStrainIdentity"]["m_Genome"]]:
+                        entries[genome["m_pInner"]["m_HashCode"]] = genome["m_pInner"]
+    return [{"key": key, "value": value} for key, value in entries.items()]
+
+
+def _build_population(node_sizes, stale_genomes: int):
+    nodes, first_suid = [], 1
+    for idx, size in enumerate(node_sizes):
+        nodes.append(make_node(idx + 1, size, first_suid))
+        first_suid += size
+    genome_map = all_genomes(nodes)
+    for idx in range(stale_genomes):
+        stale = Genome.create_genome("ACGT", 10000 + idx).to_dtk_map_entry()
+        genome_map.append(stale)
+
+    simulation = {"__class__": "SimulationMalaria", "nodes": [],
+                  "infectionSuidGenerator": {"next_suid": {"id": 5000}, "numtasks": 1},
+                  "ParasiteGenetics": {"m_ParasiteGenomeMap": genome_map}}
+    return simulation, nodes
+
+
+def write_population(filename, node_sizes=(20, 30), stale_genomes: int = 0, version: int = 4,
+                     compression: str = dft.NONE) -> list:
+    """
+    Writes a serialized population file with one node per entry of node_sizes.
+
+    Args:
+        filename: output file
+        node_sizes: number of humans per node, node ids are 1, 2, ...
+        stale_genomes: number of additional, unreferenced genome map entries
+        version: file version 2 to 5, see :py:func:`write_population_v6` for version 6
+        compression: compression of all chunks, dft.NONE, dft.LZ4 or dft.SNAPPY
+
+    Returns:
+        The list of nodes written.
+    """
+    simulation, nodes = _build_population(node_sizes, stale_genomes)
+    dtk_file = {2: dft.DtkFileV2, 3: dft.DtkFileV3, 4: dft.DtkFileV4, 5: dft.DtkFileV5}[version]()
+    if version == 2:
+        # version 2 wraps the simulation and every node, see dtkFileTools.py
+        dtk_file.objects.append({"simulation": simulation})
+        for node in nodes:
+            dtk_file.objects.append({"suid": {"id": node["suid"]["id"]}, "node": node})
+    else:
+        dtk_file.objects.append(simulation)
+        for node in nodes:
+            dtk_file.objects.append(node)
+    dtk_file.compression = compression
+    dft.write(dtk_file, filename)
+    return nodes
+
+
+def write_population_v6(filename, node_sizes=(20, 30), stale_genomes: int = 0, humans_per_chunk: int = 8,
+                        compressions=("LZ4", "NON")) -> list:
+    """
+    Writes a version 6 serialized population file, humans are stored in chunks of humans_per_chunk separate from
+    their nodes. The chunks use the V6 compression strings of compressions ("NON", "LZ4" or "SNA") in turn.
+
+    Returns:
+        The list of nodes written, with their humans.
+    """
+    simulation, nodes = _build_population(node_sizes, stale_genomes)
+    engines = {"NON": dft.NONE, "LZ4": dft.LZ4, "SNA": dft.SNAPPY}
+    chunks = []
+    header = {"version": 6, "author": "IDM", "tool": "DTK", "date": "Mon Jan 1 00:00:00 1970", "emod_info": {},
+              "node_suids": [], "node_compressions": [], "node_chunk_sizes": [], "human_compressions": [],
+              "human_node_suids": [], "human_num_humans": [], "human_chunk_sizes": []}
+
+    def add_chunk(obj):
+        compression = compressions[len(chunks) % len(compressions)]
+        chunks.append(dft.compress(json.dumps(obj, separators=(",", ":")).encode(), engines[compression]))
+        return compression, format(len(chunks[-1]), "016x")
+
+    header["sim_compression"], header["sim_chunk_size"] = add_chunk(simulation)
+    for node in nodes:
+        node_without_humans = {key: value for key, value in node.items() if key != "individualHumans"}
+        compression, size = add_chunk(node_without_humans)
+        header["node_suids"].append(format(node["suid"]["id"], "016x"))
+        header["node_compressions"].append(compression)
+        header["node_chunk_sizes"].append(size)
+    for node in nodes:
+        humans = node["individualHumans"]
+        for start in range(0, len(humans), humans_per_chunk):
+            collection = humans[start:start + humans_per_chunk]
+            compression, size = add_chunk({"human_collection": collection})
+            header["human_node_suids"].append(format(node["suid"]["id"], "016x"))
+            header["human_num_humans"].append(format(len(collection), "016x"))
+            header["human_compressions"].append(compression)
+            header["human_chunk_sizes"].append(size)
+
+    header_text = json.dumps(header, separators=(",", ":"))
+    with open(filename, "wb") as handle:
+        handle.write(dft.IDTK.encode())
+        handle.write("{:>12}".format(len(header_text)).encode())
+        handle.write(header_text.encode())
+        for chunk in chunks:
+            handle.write(chunk)
+    return nodes
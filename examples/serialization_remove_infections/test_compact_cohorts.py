@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import pytest
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import compact_cohorts
+import pipeline
+import zero_infections
+import synthetic_population
+import emod_api.serialization.dtkFileTools as dft
+
+
+def test_compact_queue():
+    cohorts = [synthetic_population.make_cohort(1, zero_infections.STATE_ADULT, 100, age=1.0),
+               synthetic_population.make_cohort(2, zero_infections.STATE_ADULT, 300, age=1.5),
+               synthetic_population.make_cohort(3, zero_infections.STATE_ADULT, 50, age=2.0),
+               synthetic_population.make_cohort(4, zero_infections.STATE_INFECTED, 10, "ACGT", age=1.0)]
+    compacted = compact_cohorts.compact_queue(cohorts, age_bucket_days=1.0)
+    assert [cohort["m_ID"] for cohort in compacted] == [1, 3, 4]
+    assert compacted[0]["population"] == 400
+    assert compacted[0]["age"] == pytest.approx(1.375)
+
+    # cohorts with different genomes are not merged
+    cohorts = [synthetic_population.make_cohort(1, zero_infections.STATE_ADULT, 100),
+               synthetic_population.make_cohort(2, zero_infections.STATE_ADULT, 100)]
+    cohorts[1]["m_Genome"] = {"m_Bits": 1}
+    assert len(compact_cohorts.compact_queue(cohorts)) == 2
+
+
+def test_compact_after_zero(tmp_path):
+    source = tmp_path / "state-00365.dtk"
+    destination = tmp_path / "state-00365_compact.dtk"
+    synthetic_population.write_population(source, node_sizes=(100,))
+
+    stage = compact_cohorts.CompactVectorCohorts(age_bucket_days=5.0)
+    pipeline.SerializedPopulationPipeline([pipeline.ZeroInfections(), stage]).run(source, destination, verbose=False)
+    assert stage.cohorts_before == 30
+    assert stage.cohorts_after < stage.cohorts_before
+
+    vectors = dft.read(str(destination)).nodes[0].m_vectorpopulations[0]
+    population = sum(c.population for q in zero_infections.Infection_Queues for c in vectors[q].collection)
+    assert population == 10 * (100 + 10 + 5)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import pytest
+import numpy
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import downsample
+import genomes
+import pipeline
+import synthetic_population
+import emod_api.serialization.dtkFileTools as dft
+
+
+def test_downsample_humans_is_stratified():
+    humans = [synthetic_population.make_human(suid, 365.0 * (suid % 20), suid % 4 == 0) for suid in range(1, 401)]
+    kept = downsample.downsample_humans(humans, 0.25, numpy.random.default_rng(1))
+    assert 90 <= len(kept) <= 110
+    infected_fraction = sum(person["m_is_infected"] for person in kept) / len(kept)
+    assert infected_fraction == pytest.approx(0.25, abs=0.05)
+    assert [person["suid"]["id"] for person in kept] == sorted(person["suid"]["id"] for person in kept)
+
+
+def test_downsample_file(tmp_path):
+    source = tmp_path / "state-00365.dtk"
+    destination = tmp_path / "state-00365_small.dtk"
+    synthetic_population.write_population(source, node_sizes=(200, 100), stale_genomes=5)
+
+    stage = downsample.Downsample(0.1, seed=3)
+    pipeline.SerializedPopulationPipeline([stage]).run(source, destination, verbose=False)
+    assert stage.removed_genomes >= 5
+
+    result = dft.read(str(destination))
+    genome_map = genomes.get_genome_map(result.simulation)
+    hash_codes = set()
+    for node in result.nodes:
+        assert len(node.individualHumans) < 40
+        hash_codes |= genomes.referenced_hash_codes(node)
+    # every referenced genome is in the map and the map has no unreferenced entries
+    assert {entry.key for entry in genome_map} == hash_codes
+
+
+def test_downsample_fraction_checked():
+    with pytest.raises(ValueError):
+        downsample.Downsample(0)
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import pytest
+import os
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import dtk_index
+import synthetic_population
+import emod_api.serialization.SerializedPopulation as SerPop
+import emod_api.serialization.dtkFileSupport as dtk
+import emod_api.serialization.dtkFileTools as dft
+
+
+@pytest.fixture()
+def dtk_file(tmp_path):
+    filename = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(filename, node_sizes=(20, 30), stale_genomes=3)
+    return filename
+
+
+def test_build_index(dtk_file):
+    index = dtk_index.build_index(dtk_file)
+    assert os.path.exists(dtk_index.index_filename_for(dtk_file))
+    assert [node["node_id"] for node in index["nodes"]] == [1, 2]
+    assert index["nodes"][0]["humans"] == 20
+    assert index["nodes"][0]["infected_humans"] == 10
+    assert index["nodes"][1]["vectors"]["gambiae"]["infectious"] == 3 * 5
+
+    # byte ranges cover the whole file
+    last = index["nodes"][-1]["chunk"]
+    assert last["offset"] + last["size"] == os.path.getsize(dtk_file)
+
+
+def test_summary_matches_full_load(dtk_file):
+    index = dtk_index.DtkIndex(dtk_file)
+    ser_pop = SerPop.SerializedPopulation(str(dtk_file))
+    genome_map = ser_pop.dtk.simulation["ParasiteGenetics"]["m_ParasiteGenomeMap"]
+
+    total = index.summary()
+    assert total["nodes"] == 2
+    assert total["humans"] == sum(len(node.individualHumans) for node in ser_pop.nodes)
+    assert total["infections"] == sum(len(h.infections) for node in ser_pop.nodes for h in node.individualHumans)
+    assert total["genome_map_size"] == len(genome_map)
+
+    node_2 = index.summary(2)
+    assert node_2["humans"] == 30
+    assert node_2["infected_humans"] == 15
+    assert node_2["vector_cohorts"] == 9
+
+    with pytest.raises(ValueError):
+        index.summary(17)
+
+
+def test_read_node(dtk_file):
+    index = dtk_index.DtkIndex(dtk_file)
+    node = index.read_node(2)
+    assert node.externalId == 2
+    assert len(node.individualHumans) == 30
+    assert node.individualHumans[0].suid.id == 21
+
+
+def test_stale_index_is_rebuilt(dtk_file):
+    dtk_index.DtkIndex(dtk_file)
+    synthetic_population.write_population(dtk_file, node_sizes=(5,))
+    os.utime(dtk_file, ns=(1, 1))   # make sure the modification time differs
+    index = dtk_index.DtkIndex(dtk_file)
+    assert index.node_ids == [1]
+    assert index.summary()["humans"] == 5
+
+
+def test_summarize(dtk_file, tmp_path):
+    other = tmp_path / "state-00730.dtk"
+    synthetic_population.write_population(other, node_sizes=(7,))
+    summaries = dtk_index.summarize([dtk_file, other])
+    assert [s["humans"] for s in summaries] == [50, 7]
+
+
+def _write(filename, version, compression):
+    if version == 6:
+        synthetic_population.write_population_v6(filename, node_sizes=(20, 30), stale_genomes=3,
+                                                 compressions=compression)
+    else:
+        synthetic_population.write_population(filename, node_sizes=(20, 30), stale_genomes=3, version=version,
+                                              compression=compression)
+
+
+@pytest.mark.parametrize("version, compression", [(2, dft.LZ4), (3, dft.NONE), (5, dft.LZ4), (6, ("LZ4", "NON")),
+                                                  (6, ("SNA", "LZ4"))])
+def test_index_versions(tmp_path, version, compression):
+    if "SNA" in compression and not dtk.SNAPPY_SUPPORT:
+        pytest.skip("snappy is not installed")
+    filename = tmp_path / "state-00365.dtk"
+    _write(filename, version, compression)
+
+    index = dtk_index.DtkIndex(filename)
+    assert index.index["version"] == version
+    assert index.node_ids == [1, 2]
+    ser_pop = SerPop.SerializedPopulation(str(filename))
+    total = index.summary()
+    assert total["humans"] == 50
+    assert total["infected_humans"] == 25
+    assert total["infections"] == sum(len(h["infections"]) for node in ser_pop.nodes for h in node["individualHumans"])
+    assert total["genome_map_size"] == len(ser_pop.dtk.simulation["ParasiteGenetics"]["m_ParasiteGenomeMap"])
+    assert total["infectious_vectors"] == 5 * (2 + 3)
+    assert index.read_simulation()["infectionSuidGenerator"]["next_suid"]["id"] == 5000
+
+    node = index.read_node(2)
+    assert node["externalId"] == 2
+    assert [h["suid"]["id"] for h in node["individualHumans"]] == list(range(21, 51))
+
+    # the chunks follow each other and end at the end of the file
+    chunks = dtk_index.chunk_layout(*dtk_index.read_header(filename))
+    for chunk, next_chunk in zip(chunks, chunks[1:]):
+        assert chunk["offset"] + chunk["size"] == next_chunk["offset"]
+    assert chunks[-1]["offset"] + chunks[-1]["size"] == os.path.getsize(filename)
+    if version == 6:
+        human_chunks = [chunk for chunk in chunks if chunk["type"] == "humans"]
+        assert sum(chunk["num_humans"] for chunk in human_chunks) == 50
+        assert len(index.index["nodes"][1]["human_chunks"]) == 4      # 30 humans in chunks of 8
+        assert {chunk["compression"] for chunk in chunks} == {dtk_index.V6_COMPRESSION[c] for c in compression}
+
+
+if __name__ == '__main__':
+    pytest.main()
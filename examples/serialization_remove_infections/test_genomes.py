@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import pytest
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import genomes
+import pipeline
+import synthetic_population
+import emod_api.serialization.dtkFileTools as dft
+
+
+@pytest.fixture()
+def dtk_file(tmp_path):
+    filename = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(filename, node_sizes=(20, 30), stale_genomes=7)
+    return filename
+
+
+def test_iter_genomes():
+    human = synthetic_population.make_human(1, 100.0, True, "ACGT")
+    cohort = synthetic_population.make_cohort(1, 1, 10, "ACGT")
+    assert len(list(genomes.iter_genomes(human))) == 1
+    assert len(list(genomes.iter_genomes([human, cohort]))) == 4
+
+
+def test_garbage_collection_only(dtk_file, tmp_path):
+    destination = tmp_path / "state-00365_gc.dtk"
+    before = len(genomes.get_genome_map(dft.read(str(dtk_file)).simulation))
+
+    stage = genomes.GenomeGarbageCollection(deduplicate=False)
+    pipeline.SerializedPopulationPipeline([pipeline.ZeroInfections(), stage]).run(dtk_file, destination, verbose=False)
+
+    # zeroing removes human infections, vectors still carry their oocyst/sporozoite cohorts
+    genome_map = genomes.get_genome_map(dft.read(str(destination)).simulation)
+    assert stage.genomes_before == before
+    assert stage.repointed_genomes == 0
+    assert len(genome_map) == before - stage.removed_genomes
+    assert {entry.key for entry in genome_map} == stage.hash_codes
+
+
+def test_deduplicate(dtk_file, tmp_path):
+    destination = tmp_path / "state-00365_dedup.dtk"
+    stage = genomes.GenomeGarbageCollection()
+    pipeline.SerializedPopulationPipeline([stage]).run(dtk_file, destination, verbose=False)
+    assert stage.repointed_genomes > 0
+
+    result = dft.read(str(destination))
+    genome_map = genomes.get_genome_map(result.simulation)
+    sequences = [tuple(entry.value.m_NucleotideSequence) for entry in genome_map]
+    assert len(sequences) == len(set(sequences)) == len(synthetic_population.BARCODES)
+
+    referenced = set()
+    for node in result.nodes:
+        referenced |= genomes.referenced_hash_codes(node)
+    assert referenced == {entry.key for entry in genome_map}
+
+
+if __name__ == '__main__':
+    pytest.main()
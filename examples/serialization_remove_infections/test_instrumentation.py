@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import pipeline
+import synthetic_population
+import zero_infections
+from instrumentation import Instrumentation, QUIET
+
+
+def test_quiet_by_default(tmp_path, capsys):
+    source = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(source, node_sizes=(10,))
+    capsys.readouterr()
+    pipeline.SerializedPopulationPipeline([pipeline.ZeroInfections()]).run(source, tmp_path / "out.dtk")
+    assert "ZeroInfections" not in capsys.readouterr().out
+    assert not QUIET.enabled
+
+
+def test_pipeline_records(tmp_path):
+    source = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(source, node_sizes=(10, 20))
+    records = []
+    pipeline.SerializedPopulationPipeline([pipeline.ZeroInfections()]).run(
+        source, tmp_path / "out.dtk", instrumentation=Instrumentation(records.append))
+
+    events = [record["event"] for record in records]
+    assert events == ["read", "node", "node", "stage", "write", "run"]
+    assert records[0]["bytes_read"] > 0
+    assert records[-2]["bytes_written"] > 0
+    assert [record["humans"] for record in records if record["event"] == "node"] == [10, 20]
+    assert "ZeroInfections" in records[1]["seconds"]
+    assert all(record["peak_rss_bytes"] != 0 for record in records)
+
+
+def test_jsonl(tmp_path):
+    filename = tmp_path / "profile.jsonl"
+    instrumentation = Instrumentation.to_jsonl(filename)
+    with instrumentation.measure("stage", stage="test") as record:
+        record["humans"] = 3
+    instrumentation.close()
+    lines = filename.read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["humans"] == 3 and record["seconds"] >= 0
+
+
+def test_zero_infections_records(tmp_path, capsys):
+    source = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(source, node_sizes=(10, 20))
+    capsys.readouterr()
+    zero_infections.zero_infections(source, tmp_path / "quiet.dtk", [], [])
+    assert "node" not in capsys.readouterr().out.lower()
+
+    records = []
+    zero_infections.zero_infection_path([tmp_path], ["00365"], ignore_nodeids=[2], keep_humanids=[1],
+                                        instrumentation=Instrumentation(records.append))
+    assert [record["event"] for record in records] == ["file", "read", "node", "node", "write"]
+    assert records[0]["skipped"] is False
+    assert records[2]["humans"] == 10 and records[2]["humans_reset"] == 9
+    assert records[3]["ignored"] is True and "humans" not in records[3]
+    assert records[4]["bytes_written"] > 0
+
+    records.clear()
+    zero_infections.zero_infection_path([tmp_path], ["00365"], instrumentation=Instrumentation(records.append))
+    assert [(record["event"], record["skipped"]) for record in records] == [("file", True)]
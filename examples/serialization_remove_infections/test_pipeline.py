@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import pytest
+import sys
+sys.path.append('../../emodpy_malaria/serialization')
+import pipeline
+import zero_infections
+import synthetic_population
+import emod_api.serialization.dtkFileTools as dft
+
+
+@pytest.fixture()
+def dtk_file(tmp_path):
+    filename = tmp_path / "state-00365.dtk"
+    synthetic_population.write_population(filename, node_sizes=(20, 30))
+    return filename
+
+
+def _barcodes(barcodes):
+    index = [0]
+
+    def get_next_barcode():
+        index[0] += 1
+        return barcodes[index[0] % len(barcodes)]
+    return get_next_barcode
+
+
+def test_pipeline_applies_all_stages(dtk_file, tmp_path):
+    destination = tmp_path / "out" / "state-00365_zero.dtk"
+    stages = [pipeline.ZeroInfections(keep_individuals=[1, 21]),
+              pipeline.ReplaceGenomes(_barcodes(["ACGT", "TGCA"])),
+              pipeline.SetIndividualProperty("Risk", "HIGH", node_ids=[2])]
+    timings = pipeline.SerializedPopulationPipeline(stages).run(dtk_file, destination, verbose=False)
+    assert {"read", "write", "ZeroInfections", "ReplaceGenomes", "SetIndividualProperty"} <= set(timings)
+
+    result = dft.read(str(destination))
+    genome_map = result.simulation["ParasiteGenetics"]["m_ParasiteGenomeMap"]
+    assert len(genome_map) > 0
+    for node in result.nodes:
+        infected = [human.suid.id for human in node.individualHumans if human.m_is_infected]
+        assert infected == ([1] if node.externalId == 1 else [21])
+        for human in node.individualHumans:
+            for infection in human.infections:
+                assert infection.infection_strain.m_Genome.m_pInner.m_NucleotideSequence in [[0, 1, 2, 3], [3, 2, 1, 0]]
+            assert human.Properties == (["Risk:HIGH"] if node.externalId == 2 else ["Risk:LOW"])
+        for queue in zero_infections.Infection_Queues:
+            for cohort in node.m_vectorpopulations[0][queue].collection:
+                assert cohort.state == zero_infections.STATE_ADULT
+
+
+def test_set_individual_property_selection(dtk_file, tmp_path):
+    destination = tmp_path / "state-00365_risk.dtk"
+    selection = zero_infections.HumanSelection(keep_id_ranges=[(1, 5)])
+    pipeline.SerializedPopulationPipeline([pipeline.SetIndividualProperty("Risk", "HIGH", selection)]).run(
+        dtk_file, destination, verbose=False)
+    node = dft.read(str(destination)).nodes[0]
+    high = [human.suid.id for human in node.individualHumans if "Risk:HIGH" in human.Properties]
+    assert high == [1, 2, 3, 4, 5]
+
+
+def test_pipeline_needs_stages():
+    with pytest.raises(ValueError):
+        pipeline.SerializedPopulationPipeline([])
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -8,6 +8,7 @@ import zero_infections
 import emod_api.serialization.SerializedPopulation as SerPop
 import emod_api.serialization.dtkFileSupport as dtk
 import copy
+import json
 
 my_dir = None
 
@@ -111,6 +112,76 @@ def test_zero_human_infections():
                 assert False
 
 
+def _make_humans(n: int, infected: bool = True) -> list:
+    """
+    Creates n serialized humans with ids 1..n and age 365 * id days.
+    """
+    humans = []
+    for idx in range(1, n + 1):
+        human = dtk.SerialObject({"suid": {"id": idx}, "m_age": 365.0 * idx, "Properties": [f"Risk:{'HIGH' if idx % 2 else 'LOW'}"]})
+        human.update(zero_infections.UNINFECTED_HUMAN)
+        if infected:
+            human.update({"infections": [{"suid": {"id": idx}}], "m_is_infected": True, "infectiousness": 0.5})
+        humans.append(human)
+    # serialized populations are read with SerialObject as object hook, i.e. nested entries are SerialObjects, too
+    return json.loads(json.dumps(humans), object_hook=dtk.SerialObject)
+
+
+def test_zero_human_infections_keep_ids():
+    humans = _make_humans(10)
+    zero_infections.zero_human_infections(humans, keep_ids={2, 5})
+    kept = [h.suid.id for h in humans if h.m_is_infected]
+    assert kept == [2, 5]
+
+
+def test_zero_human_infections_selection():
+    humans = _make_humans(10)
+    selection = zero_infections.HumanSelection(keep_ids=[1],
+                                               keep_id_ranges=[(4, 5)],
+                                               predicates=[zero_infections.age_between(min_age_years=9.5)])
+    zero_infections.zero_human_infections(humans, keep_ids=selection)
+    kept = [h.suid.id for h in humans if h.m_is_infected]
+    assert kept == [1, 4, 5, 10]
+    assert all(h.infections == [] for h in humans if not h.m_is_infected)
+
+
+def test_zero_human_infections_property_and_node_predicates():
+    humans = _make_humans(6)
+    selection = zero_infections.HumanSelection(predicates=[zero_infections.has_individual_property("Risk", "LOW")])
+    zero_infections.zero_human_infections(humans, keep_ids=selection)
+    assert [h.suid.id for h in humans if h.m_is_infected] == [2, 4, 6]
+
+    humans = _make_humans(3)
+    selection = zero_infections.HumanSelection(predicates=[zero_infections.in_nodes([7])])
+    zero_infections.zero_human_infections(humans, keep_ids=selection, node_id=7)
+    assert all(h.m_is_infected for h in humans)
+
+
+def test_zero_human_infections_keep_mask():
+    humans = _make_humans(4)
+    zero_infections.zero_human_infections(humans, keep_mask=[True, False, False, True])
+    assert [h.suid.id for h in humans if h.m_is_infected] == [1, 4]
+
+    with pytest.raises(ValueError):
+        zero_infections.zero_human_infections(_make_humans(4), keep_mask=[True])
+
+
+def test_zero_human_infections_schema_checked_per_node():
+    humans = _make_humans(3)
+    del humans[0]["m_new_infection_state"]
+    with pytest.raises(KeyError) as e_info:
+        zero_infections.zero_human_infections(humans)
+    assert '{\'m_new_infection_state\'}' == str(e_info.value.args[1])
+
+    # every human is checked, not only the first one of the node
+    humans = _make_humans(3)
+    del humans[2]["m_gametocytes_detected"]
+    with pytest.raises(KeyError) as e_info:
+        zero_infections.zero_human_infections(humans)
+    assert '{\'m_gametocytes_detected\'}' == str(e_info.value.args[1])
+    assert humans[0].m_is_infected   # nothing was changed
+
+
 def test_zero_vector_infections_dont_remove():
     source = Path_dtk_Files
     destination = "test_out_state-00365.dtk"
@@ -1,9 +1,11 @@
 import os
 import json
+import tempfile
 import unittest
 import emodpy_malaria.demographics.MalariaDemographics as MalariaDemographics
 from emod_api.demographics.Node import Node
 import emod_api.demographics.Demographics as ApiDemographics
+import numpy as np
 import pandas as pd
 
 from pathlib import Path
@@ -236,6 +238,42 @@ class DemoTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             bad_demog.add_initial_vectors_per_species_from_csv(bad_csv_path)
 
+    def test_add_vector_species_from_csv_defaults(self):
+        """
+        Checks that add_initial_vectors_per_species_from_csv() moves populations shared by most nodes to Defaults
+        """
+        import tempfile
+        rows = [(node_id, 100, 0) for node_id in range(1, 8)] + [(8, 5, 6), (9, 5, 6)]
+        data = pd.DataFrame(rows, columns=["node_id", "gambiae", "funestus"])
+        nodes = [Node(0, 0, 500, forced_id=node_id) for node_id in range(1, 10)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        demog.add_initial_vectors_per_species({"gambiae": 1}, node_ids=[3])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "vectors.csv")
+            data.to_csv(csv_path, index=False)
+            demog.add_initial_vectors_per_species_from_csv(csv_path)
+        demog_dict = demog.to_dict()
+
+        self.assertEqual(demog_dict["Defaults"]["NodeAttributes"]["InitialVectorsPerSpecies"],
+                         {"gambiae": 100, "funestus": 0})
+        for node in demog_dict["Nodes"]:
+            if node["NodeID"] in [8, 9]:
+                self.assertEqual(node["NodeAttributes"]["InitialVectorsPerSpecies"], {"gambiae": 5, "funestus": 6})
+            else:
+                self.assertNotIn("InitialVectorsPerSpecies", node["NodeAttributes"])
+
+        # a file with some of the nodes only sets these nodes
+        nodes = [Node(0, 0, 500, forced_id=node_id) for node_id in [1, 2, 3, 20]]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, "vectors.csv")
+            data.iloc[:3].to_csv(csv_path, index=False)
+            demog.add_initial_vectors_per_species_from_csv(csv_path)
+        demog_dict = demog.to_dict()
+        self.assertNotIn("InitialVectorsPerSpecies", demog_dict["Defaults"]["NodeAttributes"])
+        self.assertEqual(len([node for node in demog_dict["Nodes"]
+                              if "InitialVectorsPerSpecies" in node["NodeAttributes"]]), 3)
+
     def test_add_vector_species(self):
         """
         Tests that add_initial_vectors_per_species():
@@ -291,6 +329,237 @@ class DemoTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             demog_with_nodes.add_initial_vectors_per_species(init_vector_species=vec_species2, node_ids=[6])
 
+    def test_node_index(self):
+        nodes = [Node(0, 0, 1000, forced_id=node_id) for node_id in range(1, 4)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        self.assertIs(demog.get_node_by_id(2), nodes[1])
+
+        # adding, removing and renumbering nodes rebuilds the index
+        demog.nodes.append(Node(0, 0, 1000, forced_id=10))
+        self.assertEqual(demog.get_node_by_id(10).id, 10)
+        demog.nodes.remove(nodes[0])
+        with self.assertRaises(ValueError):
+            demog.get_node_by_id(1)
+        nodes[2].forced_id = 30
+        self.assertIs(demog.get_node_by_id(30), nodes[2])
+        with self.assertRaises(ValueError):
+            demog.get_node_by_id(3)
+        demog.nodes = [Node(0, 0, 1000, forced_id=7)]
+        self.assertListEqual(list(demog.get_nodes_by_id([7])), [7])
+
+        # an empty list selects no nodes, only None selects the default node
+        self.assertDictEqual(demog.get_nodes_by_id([]), {})
+        with self.assertRaises(ValueError):
+            demog.get_nodes_by_id(None)
+        demog.default_node = Node(0, 0, 0, forced_id=0)
+        self.assertIs(demog.get_nodes_by_id(None)[0], demog.default_node)
+        self.assertIs(demog.get_nodes_by_id([None, 7])[0], demog.default_node)
+
+        # per-node setters look nodes up in the index, which is built once and not per call
+        many_nodes = [Node(0, 0, 1000, forced_id=node_id) for node_id in range(1, 2001)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=many_nodes)
+        index = demog._node_index()
+        for node in many_nodes:
+            demog.add_initial_vectors_per_species({"gambiae": 10}, node_ids=[node.id])
+        self.assertIs(demog._node_index(), index)
+        self.assertEqual(many_nodes[-1].node_attributes.to_dict()["InitialVectorsPerSpecies"], {"gambiae": 10})
+
+    def test_spatial_index(self):
+        rng = np.random.default_rng(3)
+        lats = rng.uniform(-1, 1, 500)
+        lons = rng.uniform(29.5, 31.5, 500)
+        nodes = [Node(lat, lon, 1000, forced_id=node_id) for node_id, (lat, lon) in enumerate(zip(lats, lons), 1)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+
+        # brute-force haversine
+        lat1, lat2 = np.radians(lats)[:, None], np.radians(lats)[None, :]
+        dlon = np.radians(lons)[None, :] - np.radians(lons)[:, None]
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        expected = 2 * 6371 * np.arcsin(np.sqrt(a))
+
+        index = demog.spatial_index()
+        self.assertTrue(np.allclose(index.distances(), expected, atol=1e-6))
+        self.assertTrue(np.allclose(index.distances([5, 7], [1, 2, 3]), expected[[4, 6]][:, [0, 1, 2]], atol=1e-6))
+        for node_id in [1, 250, 500]:
+            row = expected[node_id - 1]
+            within = demog.nodes_within(node_id, km=30)
+            self.assertSetEqual(set(within), {i + 1 for i in np.flatnonzero(row <= 30)} - {node_id})
+            self.assertTrue(np.all(np.diff(row[np.array(within) - 1]) >= 0))
+            nearest, km = index.nearest(node_id, k=5)
+            self.assertListEqual(nearest.tolist(), (np.argsort(row)[1:6] + 1).tolist())
+            self.assertTrue(np.allclose(km, np.sort(row)[1:6], atol=1e-6))
+        self.assertEqual(demog.nearest_nodes(1, k=3), index.nearest(1, k=3)[0].tolist())
+        self.assertIn(1, demog.nodes_within(1, km=0, include_self=True))
+
+        sources, targets, km = index.neighbours(k=4, km=20)
+        self.assertTrue(np.all(km <= 20 + 1e-6))
+        self.assertTrue(np.allclose(km, expected[sources, targets], atol=1e-6))
+        self.assertTrue(np.all(np.bincount(sources, minlength=500) <= 4))
+        sources, targets, km = index.neighbours(km=20)
+        self.assertEqual(len(sources), int(((expected <= 20).sum() - 500)))
+
+        # the index is rebuilt when nodes change
+        demog.nodes.append(Node(0, 30, 1000, forced_id=1000))
+        self.assertIsNot(demog.spatial_index(), index)
+        self.assertIs(demog.spatial_index(), demog.spatial_index())
+        with self.assertRaises(ValueError):
+            demog.nodes_within(2000, km=10)
+
+    def test_build_migration(self):
+        from emod_api.migration import Migration, from_file
+        from emodpy_malaria.demographics.migration import build_migration
+
+        rng = np.random.default_rng(5)
+        num_nodes = 200
+        lats = rng.uniform(-1, 1, num_nodes)
+        lons = rng.uniform(29, 31, num_nodes)
+        pops = rng.integers(100, 10000, num_nodes)
+        pops[3] = 0
+        nodes = [Node(lat, lon, int(pop), forced_id=node_id)
+                 for node_id, (lat, lon, pop) in enumerate(zip(lats, lons, pops), 1)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes, idref="migration_test")
+        km = demog.spatial_index().distances()
+        params = [7.5e-06, 0.97, 0.97, -1.1]
+
+        migration = build_migration(demog, model="gravity", params=params, k=12, migration_type=Migration.LOCAL)
+        counts = np.bincount(migration.sources, minlength=num_nodes + 1)
+        self.assertTrue(np.all(counts <= 8))
+        self.assertEqual(counts[4], 0)
+        for source in [1, 50, 200]:
+            row = km[source - 1]
+            neighbours = np.argsort(row)[1:13]
+            rates = np.minimum(1, params[0] * pops[source - 1] ** params[1] * pops[neighbours] ** params[2]
+                               * row[neighbours] ** params[3] / pops[source - 1])
+            rates[pops[neighbours] == 0] = 0
+            expected = sorted(zip(-rates, neighbours + 1))[:8]
+            selected = migration.sources == source
+            self.assertListEqual(migration.destinations[selected].tolist(), [node_id for _, node_id in expected])
+            self.assertTrue(np.allclose(migration.rates[selected], [-rate for rate, _ in expected]))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = migration.to_file(os.path.join(tmp_dir, "local_migration.bin"))
+            with open(str(path) + ".json") as meta_file:
+                metadata = json.load(meta_file)["Metadata"]
+            self.assertEqual(metadata["DatavalueCount"], 8)
+            self.assertEqual(metadata["MigrationType"], "LOCAL_MIGRATION")
+            self.assertEqual(metadata["IdReference"], "migration_test")
+            self.assertEqual(metadata["NodeCount"], num_nodes - 1)
+            read = from_file(path)
+            for source in [1, 50, 200]:
+                selected = migration.sources == source
+                self.assertDictEqual(dict(read._layers[0][source]),
+                                     dict(zip(migration.destinations[selected].tolist(),
+                                              migration.rates[selected].tolist())))
+
+        regional = build_migration(demog, model="radiation", params=[0.01], km=50, k=40,
+                                   migration_type=Migration.REGIONAL, exclude_nodes=[1])
+        self.assertTrue(np.all(np.bincount(regional.sources) <= 30))
+        self.assertNotIn(1, regional.sources)
+        self.assertNotIn(1, regional.destinations)
+        source, destination = int(regional.sources[0]), int(regional.destinations[0])
+        row = km[source - 1]
+        between = pops[(row < row[destination - 1]) & (np.arange(num_nodes) != source - 1)].sum()
+        m, n = pops[source - 1], pops[destination - 1]
+        self.assertAlmostEqual(regional.rates[0], 0.01 * m * n / ((m + between) * (m + n + between)))
+
+        with self.assertRaises(ValueError):
+            build_migration(demog, model="gravity", params=params)
+        with self.assertRaises(ValueError):
+            build_migration(demog, model="commuting", params=params, k=3)
+
+    @staticmethod
+    def effective_attributes(demog_dict):
+        effective = {}
+        for node in demog_dict["Nodes"]:
+            for section in ["NodeAttributes", "IndividualAttributes"]:
+                attributes = dict(demog_dict["Defaults"].get(section, {}))
+                for key, value in node.get(section, {}).items():
+                    default = attributes.get(key)
+                    attributes[key] = dict(default, **value) if isinstance(default, dict) and isinstance(value, dict) \
+                        else value
+                effective[(node["NodeID"], section)] = attributes
+        return effective
+
+    def test_compact(self):
+        demog_dict = {
+            "Metadata": {"NodeCount": 4},
+            "Defaults": {"NodeAttributes": {"BirthRate": 0.1}, "IndividualAttributes": {"RiskDistribution1": 1}},
+            "Nodes": [{"NodeID": node_id,
+                       "NodeAttributes": {"InitialPopulation": 100 * node_id, "BirthRate": 0.2,
+                                          "InitialVectorsPerSpecies": {"gambiae": 10}},
+                       "IndividualAttributes": {"PrevalenceDistributionFlag": 1,
+                                                "AgeDistribution": {"DistributionValues": [0, 1]}}}
+                      for node_id in range(1, 5)]}
+        demog_dict["Nodes"][3]["NodeAttributes"].pop("BirthRate")
+        demog_dict["Nodes"][2]["NodeAttributes"]["InitialVectorsPerSpecies"] = {"gambiae": 3}
+        demog_dict["Nodes"][1]["IndividualAttributes"]["RiskDistribution1"] = 1
+        original = json.loads(json.dumps(demog_dict))
+
+        compacted = MalariaDemographics.compact_demographics(demog_dict)
+        self.assertDictEqual(demog_dict, original)
+        self.assertDictEqual(self.effective_attributes(compacted), self.effective_attributes(original))
+        defaults = compacted["Defaults"]
+        # 3 nodes with 0.2, the node inheriting 0.1 gets it explicitly
+        self.assertEqual(defaults["NodeAttributes"]["BirthRate"], 0.2)
+        self.assertEqual(compacted["Nodes"][3]["NodeAttributes"]["BirthRate"], 0.1)
+        self.assertEqual(defaults["NodeAttributes"]["InitialVectorsPerSpecies"], {"gambiae": 10})
+        self.assertEqual(compacted["Nodes"][2]["NodeAttributes"]["InitialVectorsPerSpecies"], {"gambiae": 3})
+        self.assertEqual(defaults["IndividualAttributes"]["AgeDistribution"], {"DistributionValues": [0, 1]})
+        # the copy of the default is removed, too, which leaves no IndividualAttributes
+        self.assertEqual(defaults["IndividualAttributes"]["RiskDistribution1"], 1)
+        self.assertNotIn("IndividualAttributes", compacted["Nodes"][1])
+        # unique values stay with the nodes
+        self.assertNotIn("InitialPopulation", defaults["NodeAttributes"])
+
+        nodes = [Node(0, 0, 1000, forced_id=node_id) for node_id in range(1, 6)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        demog.add_initial_vectors_per_species({"gambiae": 10}, node_ids=[1, 2, 3, 4])
+        out_filename = os.path.join(self.out_folder, "demographics_compact.json")
+        delete_existing_file(out_filename)
+        demog.generate_file(out_filename, compact=True)
+        with open(out_filename, 'r') as demo_file:
+            demog_json = json.load(demo_file)
+        os.remove(out_filename)
+        self.assertEqual(demog_json["Defaults"]["NodeAttributes"]["InitialPopulation"], 1000)
+        self.assertNotIn("InitialPopulation", demog_json["Nodes"][0]["NodeAttributes"])
+        # node 5 has no InitialVectorsPerSpecies of its own or in Defaults, the attribute can't be moved
+        self.assertNotIn("InitialVectorsPerSpecies", demog_json["Defaults"]["NodeAttributes"])
+        self.assertIn("InitialVectorsPerSpecies", demog_json["Nodes"][0]["NodeAttributes"])
+        self.assertDictEqual(self.effective_attributes(demog_json), self.effective_attributes(demog.to_dict()))
+
+    def test_stream_to_file(self):
+        import tempfile
+        from emodpy_malaria.demographics.streaming import write_demographics, validate_demographics
+        nodes = [Node(node_id, -node_id, 100 * node_id, forced_id=node_id) for node_id in range(1, 6)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        demog.add_initial_vectors_per_species({"gambiae": 10}, node_ids=[2])
+        expected = json.loads(json.dumps(demog.to_dict()))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for compact_separators in [True, False]:
+                filename = os.path.join(tmp_dir, f"demographics_{compact_separators}.json")
+                demog.stream_to_file(filename, compact_separators=compact_separators)
+                with open(filename, 'r') as demo_file:
+                    self.assertDictEqual(json.load(demo_file), expected)
+                self.assertListEqual(validate_demographics(filename, chunk_size=16), [])
+
+            # nodes from a generator, with a duplicate id and a node without population
+            def generate_nodes():
+                for node_id in [1, 2, 2, 3]:
+                    yield {"NodeID": node_id, "NodeAttributes": {"Latitude": 0, "Longitude": 0}}
+            filename = os.path.join(tmp_dir, "generated.json")
+            count = write_demographics(filename, {"IdReference": "test"}, {"NodeAttributes": {"InitialPopulation": 5}},
+                                       generate_nodes())
+            self.assertEqual(count, 4)
+            with open(filename, 'r') as demo_file:
+                self.assertEqual(json.load(demo_file)["Metadata"], {"IdReference": "test", "NodeCount": 4})
+            problems = validate_demographics(filename)
+            self.assertEqual(len(problems), 1)
+            self.assertIn("[2]", problems[0])
+
+            write_demographics(filename, {}, {}, [{"NodeID": 0, "NodeAttributes": {"Latitude": 0}}])
+            problems = validate_demographics(filename)
+            self.assertEqual(len(problems), 3)
+
     def test_from_csv_bad_id(self):
         input_file = os.path.join('demo_data', 'demog_in_faulty.csv')
 
@@ -369,6 +638,50 @@ class DemoTest(unittest.TestCase):
 
         # Todo: assert frac_rural after we figure out the definition of this parameter
 
+    def test_from_params_synthetic(self):
+        columns = MalariaDemographics.synthetic_node_columns(num_nodes=(4, 3), tot_pop=1e5, frac_rural=0.4, seed=7,
+                                                             init_prev=(0.1, 0.3), risk_sigma=1.2,
+                                                             habitat_multiplier=(0.5, 2))
+        self.assertListEqual(columns["node_id"].tolist(), list(range(1, 13)))
+        self.assertEqual(columns["pop"].iloc[0], 60000)
+        self.assertAlmostEqual(columns["pop"].iloc[1:].sum(), 40000, delta=11)
+        self.assertListEqual(list(zip(columns["lat"], columns["lon"])),
+                             [(lat, lon) for lat in range(4) for lon in range(3)])
+        self.assertTrue(columns["init_prev"].between(0.1, 0.3).all())
+        self.assertTrue((columns["risk_sigma"] == 1.2).all())
+        self.assertTrue(columns["habitat_multiplier"].between(0.5, 2).all())
+
+        demog = MalariaDemographics.from_params(tot_pop=1e5, num_nodes=(4, 3), frac_rural=0.4, seed=7,
+                                                init_prev=(0.1, 0.3), risk_sigma=1.2, habitat_multiplier=(0.5, 2))
+        self.assertEqual(len(demog.nodes), 12)
+        node = demog.to_dict()["Nodes"][5]
+        row = columns.iloc[5]
+        self.assertEqual(node["NodeID"], 6)
+        self.assertEqual(node["NodeAttributes"]["InitialPopulation"], row["pop"])
+        self.assertEqual(node["IndividualAttributes"]["PrevalenceDistribution1"], row["init_prev"])
+        self.assertEqual(node["IndividualAttributes"]["RiskDistribution2"], 1.2)
+        self.assertEqual(node["NodeAttributes"]["LarvalHabitatMultiplier"][0]["Factor"], row["habitat_multiplier"])
+        # the same seed gives the same population
+        pd.testing.assert_frame_equal(columns, MalariaDemographics.synthetic_node_columns(
+            num_nodes=(4, 3), tot_pop=1e5, frac_rural=0.4, seed=7, init_prev=(0.1, 0.3), risk_sigma=1.2,
+            habitat_multiplier=(0.5, 2)))
+        with self.assertRaises(ValueError):
+            MalariaDemographics.synthetic_node_columns(num_nodes=10, frac_rural=1.5)
+
+        demog = MalariaDemographics.from_template_node(lat=[1, 2, 3], lon=5, pop=[100, 200, 300], forced_id=10)
+        self.assertListEqual([node.id for node in demog.nodes], [10, 11, 12])
+        self.assertListEqual([node.node_attributes.latitude for node in demog.nodes], [1, 2, 3])
+        self.assertListEqual([node.node_attributes.initial_population for node in demog.nodes], [100, 200, 300])
+
+    def test_from_params_matches_emod_api(self):
+        # without a seed, the nodes are the same as emod_api's for the same global random state
+        for num_nodes, frac_rural in [(25, 0.3), ((4, 3), 0.5), (1, 0.2), (10, 0)]:
+            np.random.seed(11)
+            expected = ApiDemographics.from_params(tot_pop=2e4, num_nodes=num_nodes, frac_rural=frac_rural).nodes
+            np.random.seed(11)
+            nodes = MalariaDemographics.from_params(tot_pop=2e4, num_nodes=num_nodes, frac_rural=frac_rural).nodes
+            self.assertListEqual([node.to_dict() for node in nodes], [node.to_dict() for node in expected])
+
     def test_add_larval_habitat_multiplier(self):
         out_filename = os.path.join(self.out_folder, "demographics_from_csv.json")
         delete_existing_file(out_filename)
@@ -396,6 +709,43 @@ class DemoTest(unittest.TestCase):
             else:
                 self.assertNotIn("LarvalHabitatMultiplier", node['NodeAttributes'])
 
+    def test_add_larval_habitat_multipliers(self):
+        import schema_path_file
+        nodes = [Node(0, 0, 1000, forced_id=node_id) for node_id in range(1, 5)]
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        rows = [(node_id, habitat, species, 0.5 if habitat == "CONSTANT" else 2.0)
+                for node_id in range(1, 5) for habitat in ["CONSTANT", "TEMPORARY_RAINFALL"]
+                for species in ["arabiensis", "funestus"]]
+        multipliers = pd.DataFrame(rows, columns=["node_id", "habitat", "species", "factor"])
+        multipliers.loc[(multipliers["node_id"] == 3) & (multipliers["species"] == "funestus"), "factor"] = 0.1
+        demog.add_larval_habitat_multipliers(schema_path_file.schema_file, multipliers)
+        demog_json = demog.to_dict()
+
+        defaults = demog_json["Defaults"]["NodeAttributes"]["LarvalHabitatMultiplier"]
+        self.assertEqual(len(defaults), 4)
+        self.assertEqual(defaults[0], {"Factor": 0.5, "Habitat": "CONSTANT", "Species": "arabiensis"})
+        for node in demog_json["Nodes"]:
+            if node["NodeID"] == 3:
+                node_multipliers = node["NodeAttributes"]["LarvalHabitatMultiplier"]
+                self.assertListEqual([spec["Factor"] for spec in node_multipliers], [0.5, 0.1, 2.0, 0.1])
+            else:
+                self.assertNotIn("LarvalHabitatMultiplier", node["NodeAttributes"])
+
+        # only some of the nodes: nothing is moved to Defaults, species defaults to ALL_SPECIES
+        demog = MalariaDemographics.MalariaDemographics(nodes=nodes)
+        demog.add_larval_habitat_multipliers(schema_path_file.schema_file,
+                                             pd.DataFrame({"node_id": [2], "habitat": ["CONSTANT"], "factor": [3]}))
+        self.assertNotIn("LarvalHabitatMultiplier", demog.raw["Defaults"]["NodeAttributes"])
+        self.assertEqual(demog.get_node_by_id(2).node_attributes.larval_habitat_multiplier,
+                         [{"Factor": 3.0, "Habitat": "CONSTANT", "Species": "ALL_SPECIES"}])
+
+        with self.assertRaises(ValueError):
+            demog.add_larval_habitat_multipliers(schema_path_file.schema_file, pd.DataFrame(
+                {"node_id": [2], "habitat": ["NOT_A_HABITAT"], "factor": [1]}))
+        with self.assertRaises(ValueError):
+            demog.add_larval_habitat_multipliers(schema_path_file.schema_file, pd.DataFrame(
+                {"node_id": [99], "habitat": ["CONSTANT"], "factor": [1]}))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.event_recorder import convert_event_recorder, read_event_recorder
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "requires pyarrow")
+class TestEventRecorderParquet(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+        rng = np.random.default_rng(3)
+        num_events = 2000
+        self.df = pd.DataFrame({
+            "Time": np.sort(rng.integers(0, 3 * 365, num_events)).astype(float),
+            "Node_ID": rng.integers(1, 4, num_events),
+            "Event_Name": rng.choice(["Births", "NewClinicalCase", "Received_Treatment"], num_events),
+            "Individual_ID": rng.integers(1, 500, num_events),
+            "Age": rng.random(num_events) * 10000,
+            "Gender": rng.choice(["M", "F"], num_events),
+            "Infected": rng.integers(0, 2, num_events),
+            "Infectiousness": rng.random(num_events),
+            "Risk": rng.choice(["HIGH", "LOW"], num_events)})
+        self.df.to_csv(os.path.join(self.output_dir, "ReportEventRecorder.csv"), index=False)
+        self.dataset_dir = os.path.join(self.output_dir, "events")
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_convert_and_read_all(self):
+        rows = convert_event_recorder(self.output_dir, self.dataset_dir, chunk_size=700)
+        self.assertEqual(rows, len(self.df))
+        self.assertEqual(sorted(os.listdir(self.dataset_dir)), ["Node_ID=1", "Node_ID=2", "Node_ID=3"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dataset_dir, "Node_ID=1"))),
+                         ["Year=0", "Year=1", "Year=2"])
+
+        df = read_event_recorder(self.dataset_dir)
+        self.assertEqual(len(df), len(self.df))
+        self.assertEqual(df["Event_Name"].dtype.name, "category")
+        self.assertEqual(df["Risk"].dtype.name, "category")
+        self.assertEqual(df["Node_ID"].dtype, np.int64)
+
+        # converting again replaces the dataset
+        convert_event_recorder(self.output_dir, self.dataset_dir, chunk_size=1500)
+        self.assertEqual(len(read_event_recorder(self.dataset_dir)), len(self.df))
+
+    def test_filtered_read(self):
+        convert_event_recorder(os.path.join(self.output_dir, "ReportEventRecorder.csv"), self.dataset_dir,
+                               chunk_size=700)
+        df = read_event_recorder(self.dataset_dir, events=["Received_Treatment", "Births"], start_time=300,
+                                 end_time=500, node_ids=[2, 3], columns=["Time", "Event_Name", "Individual_ID"])
+        expected = self.df[self.df["Event_Name"].isin(["Received_Treatment", "Births"]) &
+                           self.df["Time"].between(300, 500) & self.df["Node_ID"].isin([2, 3])]
+        self.assertEqual(list(df.columns), ["Time", "Event_Name", "Individual_ID"])
+        self.assertEqual(len(df), len(expected))
+        self.assertListEqual(sorted(df["Individual_ID"].tolist()), sorted(expected["Individual_ID"].tolist()))
+
+
+if __name__ == '__main__':
+    unittest.main()
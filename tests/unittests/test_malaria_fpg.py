@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.builtin import ReportFpgOutputForObservationalModel
+from emodpy_malaria.reporters.fpg import FpgGenomeMatrix, pairwise_ibs, parse_list_column
+
+
+class TestFpgGenomeMatrix(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+        # genome indexes 1 and 3 have the same barcode, genome 4 isn't sampled
+        self.variants = np.array([[0, 0, 0, 0],
+                                  [1, 1, 0, 0],
+                                  [1, 1, 1, 1],
+                                  [1, 1, 0, 0],
+                                  [0, 1, 0, 1]], dtype=np.int32)
+        np.save(os.path.join(self.output_dir, "variants4_afFPG.npy"), self.variants)
+        people = pd.DataFrame({"population": [1, 1, 2], "day": [10, 10, 20], "IndividualID": [5, 6, 7],
+                               "recursive_nid": ["[0]", "[1, 2, 1]", "[3, 1, 0]"],
+                               "genome_ids": ["[11]", "[22, 33, 22]", "[44, 22, 11]"]})
+        people.to_csv(os.path.join(self.output_dir, "infIndexRecursive-genomes-df.csv"), index=False)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_parse_list_column(self):
+        values, lengths = parse_list_column(pd.Series(["[1, 2]", "[]", "[3]"], name="nid"))
+        self.assertListEqual(values.tolist(), [1, 2, 3])
+        self.assertListEqual(lengths.tolist(), [2, 0, 1])
+        with self.assertRaises(ValueError):
+            parse_list_column(pd.Series(["[1, a]"], name="nid"))
+
+    def test_read_deduplicated(self):
+        fpg = ReportFpgOutputForObservationalModel.read(self.output_dir)
+        self.assertListEqual(list(fpg.people.columns), ["population", "day", "IndividualID"])
+        self.assertEqual(fpg.barcodes.dtype, np.uint8)
+        self.assertEqual(fpg.barcodes.shape, (3, 4))
+        self.assertListEqual(fpg.genome_index.tolist(), [0, 1, 2])
+        self.assertListEqual(fpg.genome_map.tolist(), [0, 1, 2, 1, -1])
+        self.assertListEqual(fpg.person_genome.toarray().tolist(), [[1, 0, 0], [0, 2, 1], [1, 2, 0]])
+        self.assertListEqual(fpg.complexity_of_infection.tolist(), [1, 2, 2])
+
+        not_deduplicated = ReportFpgOutputForObservationalModel.read(self.output_dir, deduplicate=False)
+        self.assertEqual(not_deduplicated.barcodes.shape, (4, 4))
+
+    def test_ibs(self):
+        fpg = ReportFpgOutputForObservationalModel.read(self.output_dir)
+        ibs = pairwise_ibs(fpg.barcodes, block_size=2)
+        expected = (fpg.barcodes[:, None, :] == fpg.barcodes[None, :, :]).mean(axis=2)
+        self.assertTrue(np.allclose(ibs, expected))
+        within = fpg.within_host_ibs()
+        self.assertTrue(np.isnan(within[0]))
+        self.assertAlmostEqual(within[1], 0.5)
+        self.assertAlmostEqual(within[2], 0.5)
+
+    def test_save_and_load_mmap(self):
+        fpg = ReportFpgOutputForObservationalModel.read(self.output_dir)
+        directory = os.path.join(self.output_dir, "fpg_sparse")
+        fpg.save(directory)
+        loaded = FpgGenomeMatrix.load(directory)
+        self.assertIsInstance(loaded.barcodes, np.memmap)
+        self.assertTrue(np.array_equal(loaded.person_genome.toarray(), fpg.person_genome.toarray()))
+        self.assertTrue(np.array_equal(loaded.barcodes, fpg.barcodes))
+        pd.testing.assert_frame_equal(loaded.people, fpg.people)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.post_processing import reduce_csv_report, to_channels, convert_report_vector_stats, \
+    downsample_inset_chart, bin_times
+
+
+class TestPostProcessing(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+        rng = np.random.default_rng(5)
+        rows = [(time, node, species) for time in range(1, 22) for node in [1, 2, 3]
+                for species in ["arabiensis", "gambiae"]]
+        self.df = pd.DataFrame(rows, columns=["Time", "NodeID", "Species"])
+        self.df["Time"] = self.df["Time"].astype(float)
+        self.df["VectorPopulation"] = rng.integers(0, 1000, len(self.df)).astype(float)
+        self.df["STATE_INFECTIOUS"] = rng.integers(0, 10, len(self.df)).astype(float)
+        self.csv_path = os.path.join(self.output_dir, "ReportVectorStats.csv")
+        self.df.to_csv(self.csv_path, index=False)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_bin_times(self):
+        self.assertListEqual(bin_times([1, 7, 8, 15], "weekly").tolist(), [1, 1, 8, 15])
+        self.assertListEqual(bin_times([0, 29, 30], 30).tolist(), [0, 0, 30])
+        with self.assertRaises(ValueError):
+            bin_times([1], "fortnightly")
+
+    def test_node_reduction(self):
+        expected = self.df.groupby("Time")[["VectorPopulation", "STATE_INFECTIOUS"]].sum()
+        # small chunks split time steps across chunks
+        df = reduce_csv_report(self.csv_path, chunk_size=4)
+        self.assertListEqual(list(df.columns), ["VectorPopulation", "STATE_INFECTIOUS"])
+        pd.testing.assert_frame_equal(df, expected)
+
+        mean = reduce_csv_report(self.csv_path, value_columns=["VectorPopulation"], by=["NodeID"],
+                                 node_reduction="mean", chunk_size=5)
+        expected = self.df.groupby(["Time", "NodeID"])[["VectorPopulation"]].mean()
+        pd.testing.assert_frame_equal(mean, expected)
+
+        with self.assertRaises(ValueError):
+            reduce_csv_report(self.csv_path, by=["Genome"])
+
+    def test_time_reduction_and_channels(self):
+        df = reduce_csv_report(self.csv_path, by=["Species"], time_bin="weekly", time_reduction="sum", chunk_size=7)
+        self.assertListEqual(sorted(set(df.index.get_level_values("Time"))), [1, 8, 15])
+        gambiae = self.df[(self.df["Species"] == "gambiae") & (self.df["Time"] < 8)]
+        self.assertAlmostEqual(df.loc[(1, "gambiae"), "VectorPopulation"], gambiae["VectorPopulation"].sum())
+
+        channels = to_channels(df)
+        self.assertIn("STATE_INFECTIOUS-arabiensis", channels.columns)
+        self.assertEqual(len(channels), 3)
+
+    def test_convert_report_vector_stats(self):
+        json_path = convert_report_vector_stats(self.output_dir, time_bin="weekly", remove_csv=True)
+        self.assertFalse(os.path.exists(self.csv_path))
+        with open(json_path) as json_file:
+            report = json.load(json_file)
+        self.assertEqual(report["Header"]["Timesteps"], 3)
+        self.assertEqual(report["Header"]["Simulation_Timestep"], 7)
+        self.assertEqual(report["Header"]["Channels"], 2)
+        daily = self.df.groupby("Time")["VectorPopulation"].sum().to_numpy()
+        self.assertTrue(np.allclose(report["Channels"]["VectorPopulation"]["Data"], daily.reshape(3, 7).mean(axis=1)))
+
+    def test_downsample_inset_chart(self):
+        path = os.path.join(self.output_dir, "InsetChart.json")
+        data = np.arange(10, dtype=float)
+        with open(path, "w") as json_file:
+            json.dump({"Header": {"Simulation_Timestep": 1, "Timesteps": 10, "Channels": 3},
+                       "Channels": {"Adult Vectors": {"Units": "", "Data": data.tolist()},
+                                    "New Clinical Cases": {"Units": "cases", "Data": data.tolist()},
+                                    "Births": {"Units": "", "Data": data.tolist()}}}, json_file)
+        downsample_inset_chart(path, time_bin=4, channels=["Adult Vectors", "New Clinical Cases"],
+                               sum_channels=["New Clinical Cases"])
+        with open(path) as json_file:
+            report = json.load(json_file)
+        self.assertEqual(report["Header"]["Timesteps"], 3)
+        self.assertEqual(report["Header"]["Simulation_Timestep"], 4)
+        self.assertNotIn("Births", report["Channels"])
+        self.assertListEqual(report["Channels"]["Adult Vectors"]["Data"], [1.5, 5.5, 8.5])
+        self.assertListEqual(report["Channels"]["New Clinical Cases"]["Data"], [6, 22, 17])
+        self.assertEqual(report["Channels"]["New Clinical Cases"]["Units"], "cases")
+
+
+if __name__ == '__main__':
+    unittest.main()
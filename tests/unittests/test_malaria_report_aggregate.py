@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from emodpy_malaria.reporters.builtin import ReportMalariaFiltered, MalariaSummaryReport, ReportVectorStats, \
+    SpatialReportMalariaFiltered, SqlReportMalaria, ReportFpgOutputForObservationalModel
+from emodpy_malaria.reporters.aggregate import aggregate_reports, load_aggregation, ChannelStatistics
+
+
+class TestReportAggregation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.rng = np.random.default_rng(1)
+        self.output_dirs = []
+        self.tags = []
+        self.prevalence = []
+        for index in range(8):
+            output_dir = os.path.join(self.tmp_dir.name, f"sim_{index}", "output")
+            os.makedirs(output_dir)
+            prevalence = self.rng.random(5)
+            report = {"Header": {"Timesteps": 5},
+                      "Channels": {"PfHRP2 Prevalence": {"Units": "", "Data": prevalence.tolist()},
+                                   "Infected": {"Units": "", "Data": (100 * prevalence).tolist()},
+                                   "Statistical Population": {"Units": "", "Data": [100] * 5}}}
+            with open(os.path.join(output_dir, "ReportMalariaFiltered.json"), "w") as json_file:
+                json.dump(report, json_file)
+            self.output_dirs.append(output_dir)
+            self.tags.append({"scale": index % 2})
+            self.prevalence.append(prevalence)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_channel_statistics(self):
+        values = self.rng.random((50, 3, 4))
+        statistics = ChannelStatistics(sample_size=100)
+        for value in values:
+            statistics.add(value)
+        self.assertEqual(statistics.count, 50)
+        self.assertTrue(np.allclose(statistics.mean, values.mean(axis=0)))
+        self.assertTrue(np.allclose(statistics.variance, values.var(axis=0, ddof=1)))
+        self.assertTrue(np.allclose(statistics.quantiles([0.1, 0.5]), np.quantile(values, [0.1, 0.5], axis=0)))
+        with self.assertRaises(ValueError):
+            statistics.add(np.zeros(3))
+
+    def test_aggregate_by_tag(self):
+        for processes in [1, 2]:
+            result = aggregate_reports(self.output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence"],
+                                       tags=self.tags, processes=processes)
+            self.assertEqual(len(result.groups), 2)
+            for scale in [0, 1]:
+                expected = np.array(self.prevalence[scale::2])
+                summary = result.summary({"scale": scale})["PfHRP2 Prevalence"]
+                self.assertEqual(summary["count"], 4)
+                self.assertTrue(np.allclose(summary["mean"], expected.mean(axis=0)))
+                self.assertTrue(np.allclose(summary["variance"], expected.var(axis=0, ddof=1)))
+                self.assertEqual(summary["quantiles"].shape, (5, 5))
+
+    def test_shared_reservoir(self):
+        # with a reservoir smaller than the group, all channels sample the same simulations
+        result = aggregate_reports(self.output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence", "Infected"],
+                                   processes=1, sample_size=3, quantiles=[0, 0.5, 1], seed=5)
+        summary = result.summary()
+        self.assertEqual(summary["Infected"]["count"], 8)
+        self.assertTrue(np.allclose(summary["Infected"]["quantiles"], 100 * summary["PfHRP2 Prevalence"]["quantiles"]))
+
+    def test_shape_mismatch_failure(self):
+        output_dir = os.path.join(self.tmp_dir.name, "short", "output")
+        os.makedirs(output_dir)
+        report = {"Header": {"Timesteps": 3},
+                  "Channels": {"PfHRP2 Prevalence": {"Units": "", "Data": [0.1, 0.2, 0.3]},
+                               "Infected": {"Units": "", "Data": [10, 20, 30]}}}
+        with open(os.path.join(output_dir, "ReportMalariaFiltered.json"), "w") as json_file:
+            json.dump(report, json_file)
+        output_dirs = self.output_dirs + [output_dir]
+        result = aggregate_reports(output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence", "Infected"],
+                                   processes=1)
+        self.assertEqual(list(result.failures), [output_dir])
+        self.assertIn("ValueError", result.failures[output_dir])
+        summary = result.summary()
+        self.assertEqual(summary["PfHRP2 Prevalence"]["count"], 8)
+        self.assertEqual(summary["Infected"]["count"], 8)
+        with self.assertRaises(ValueError):
+            aggregate_reports(output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence"], processes=1,
+                              raise_errors=True)
+
+    def test_sample_order(self):
+        # the reservoir samples the same simulations for the same seed, however the results arrive
+        results = [aggregate_reports(self.output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence"],
+                                     processes=processes, sample_size=2, quantiles=[0, 1],
+                                     seed=3).summary()["PfHRP2 Prevalence"]
+                   for processes in [1, 2, 3]]
+        for result in results[1:]:
+            self.assertTrue(np.array_equal(result["quantiles"], results[0]["quantiles"]))
+
+    def test_csv_summary_and_spatial_reports(self):
+        populations = []
+        for index, output_dir in enumerate(self.output_dirs):
+            population = self.rng.random(4) * 1000
+            populations.append(population)
+            with open(os.path.join(output_dir, "ReportVectorStats.csv"), "w") as csv_file:
+                csv_file.write("Time,NodeID,Species,VectorPopulation\n")
+                for time, value in enumerate(population):
+                    csv_file.write(f"{time},1,gambiae,{value}\n")
+            summary = {"Metadata": {"Reporting_Interval": 365},
+                       "DataByTime": {"PfPR_2to10": population.tolist()}}
+            with open(os.path.join(output_dir, "MalariaSummaryReport.json"), "w") as json_file:
+                json.dump(summary, json_file)
+            with open(os.path.join(output_dir, "SpatialReportMalariaFiltered_Population.bin"), "wb") as bin_file:
+                np.array([2, 2], dtype=np.int32).tofile(bin_file)
+                np.array([1, 2], dtype=np.uint32).tofile(bin_file)
+                population.astype(np.float32).tofile(bin_file)
+        expected = np.mean(populations, axis=0)
+        for reporter_class, channel, mean in [(ReportVectorStats, "VectorPopulation", expected),
+                                              (MalariaSummaryReport, "PfPR_2to10", expected),
+                                              (SpatialReportMalariaFiltered, "Population",
+                                               expected.astype(np.float32).reshape(2, 2))]:
+            result = aggregate_reports(self.output_dirs, reporter_class, [channel], processes=1)
+            self.assertEqual(result.failures, {})
+            summary = result.summary()[channel]
+            self.assertEqual(summary["count"], 8)
+            self.assertTrue(np.allclose(summary["mean"], mean, rtol=1e-6))
+
+    def test_unsupported_readers(self):
+        for reporter_class in [SqlReportMalaria, ReportFpgOutputForObservationalModel]:
+            with self.assertRaises(TypeError) as context:
+                aggregate_reports(self.output_dirs, reporter_class, ["Channel"], processes=1)
+            self.assertIn(reporter_class.__name__, str(context.exception))
+
+    def test_failures_and_save(self):
+        output_dirs = self.output_dirs + [os.path.join(self.tmp_dir.name, "missing")]
+        filename = os.path.join(self.tmp_dir.name, "aggregate.npz")
+        result = aggregate_reports(output_dirs, ReportMalariaFiltered, ["PfHRP2 Prevalence"], processes=1,
+                                   quantiles=[0.5], output_file=filename)
+        self.assertEqual(list(result.failures), [output_dirs[-1]])
+        with self.assertRaises(FileNotFoundError):
+            aggregate_reports(output_dirs, MalariaSummaryReport, ["PfPR_2to10"], processes=1, raise_errors=True)
+
+        loaded = load_aggregation(filename)
+        self.assertEqual(loaded["quantiles"], [0.5])
+        self.assertEqual(len(loaded["groups"]), 1)
+        channel = loaded["groups"][0]["PfHRP2 Prevalence"]
+        self.assertEqual(channel["count"], 8)
+        self.assertTrue(np.allclose(channel["mean"], np.mean(self.prevalence, axis=0)))
+        self.assertTrue(np.allclose(channel["quantiles"][0], np.median(self.prevalence, axis=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
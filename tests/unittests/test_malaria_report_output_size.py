@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+file_dir = os.path.dirname(__file__)
+sys.path.append(file_dir)
+
+from emodpy.reporters.base import Reporters
+from emodpy_malaria.reporters.builtin import add_report_vector_genetics, add_drug_status_report, \
+    add_report_malaria_filtered
+from emodpy_malaria.reporters.output_size import SimulationScale, estimate_output_size, check_output_size, \
+    estimate_report
+import schema_path_file
+
+
+class TestReportOutputSize(unittest.TestCase):
+    def setUp(self) -> None:
+        self.scale = SimulationScale(num_nodes=100, population=100000, duration_days=20 * 365,
+                                     species=["gambiae"], genes_alleles={"gambiae": [4, 4, 3]})
+        self.task = SimpleNamespace(reporters=Reporters(), config=SimpleNamespace(parameters={}))
+
+    def add(self, reporter):
+        self.task.reporters.add_reporter(reporter)
+
+    def test_genome_stratification_is_flagged(self):
+        self.add(add_report_vector_genetics(None, schema_path_file, species="gambiae", stratify_by="GENOME"))
+        self.add(add_report_malaria_filtered(None, schema_path_file))
+        estimates = estimate_output_size(self.task, self.scale, threshold_bytes=1e9)
+        self.assertEqual([estimate.report for estimate in estimates], ["ReportVectorGenetics",
+                                                                       "ReportMalariaFiltered"])
+        self.assertTrue(estimates[0].flagged)
+        self.assertFalse(estimates[1].flagged)
+        # 10 * 10 * 6 genotypes per node and day
+        self.assertEqual(estimates[0].rows, 20 * 365 * 100 * 600)
+        with self.assertRaises(ValueError) as context:
+            check_output_size(self.task, self.scale, threshold_bytes=1e9)
+        self.assertIn("ReportVectorGenetics", str(context.exception))
+
+    def test_limits_reduce_estimate(self):
+        full = estimate_report("ReportDrugStatus", add_drug_status_report(None, schema_path_file).parameters,
+                               self.scale)
+        limited = estimate_report("ReportDrugStatus", add_drug_status_report(None, schema_path_file, start_day=365,
+                                                                             end_day=2 * 365).parameters, self.scale)
+        self.assertAlmostEqual(full.rows / limited.rows, 20)
+        specific = add_report_vector_genetics(None, schema_path_file, species="gambiae", stratify_by="SPECIFIC_GENOME",
+                                              specific_genome_combinations_for_stratification=[
+                                                  {"Allele_Combination": [["a0", "*"]]}])
+        self.assertEqual(estimate_report("ReportVectorGenetics", specific.parameters, self.scale).rows,
+                         20 * 365 * 100)
+        self.assertIsNone(estimate_report("NotAReport", {}, self.scale))
+
+    def test_event_recorder(self):
+        self.task.config.parameters = {"Report_Event_Recorder": 1, "Report_Event_Recorder_Events": [],
+                                       "Report_Event_Recorder_Ignore_Events_In_List": 1}
+        unfiltered = estimate_output_size(self.task, self.scale, threshold_bytes=1e9)
+        self.assertEqual(unfiltered[0].report, "ReportEventRecorder")
+        self.assertTrue(unfiltered[0].flagged)
+        self.task.config.parameters = {"Report_Event_Recorder": 1, "Report_Event_Recorder_Events": ["Births"],
+                                       "Report_Event_Recorder_Ignore_Events_In_List": 0}
+        filtered = estimate_output_size(self.task, self.scale, threshold_bytes=1e9)
+        self.assertAlmostEqual(unfiltered[0].rows / filtered[0].rows, self.scale.events_in_simulation)
+
+
+if __name__ == '__main__':
+    unittest.main()
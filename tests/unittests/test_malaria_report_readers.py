@@ -0,0 +1,238 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from emodpy_malaria.reporters.builtin import ReportVectorStats, ReportMalariaFiltered, MalariaSummaryReport, \
+    SpatialReportMalariaFiltered, ReportNodeDemographics, ReportVectorMigration, ReportSimpleMalariaTransmission
+from emodpy_malaria.reporters import readers, streaming, channel_index
+
+
+class TestReportReaders(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def write_vector_stats(self, filename="ReportVectorStats.csv"):
+        with open(os.path.join(self.output_dir, filename), "w") as csv_file:
+            csv_file.write("Time,NodeID,Species,Population,VectorPopulation,STATE_INFECTIOUS\n")
+            csv_file.write("0,1,gambiae,1000,500.5,0\n")
+            csv_file.write("0,2,funestus,2000,700,3\n")
+            csv_file.write("1,1,gambiae,1001,499,1\n")
+
+    def test_read_csv_report_dtypes(self):
+        self.write_vector_stats()
+        df = ReportVectorStats.read(self.output_dir)
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df["NodeID"].dtype, np.int64)
+        self.assertEqual(df["Species"].dtype.name, "category")
+        self.assertEqual(df["VectorPopulation"].dtype, np.float64)
+        self.assertEqual(sorted(df["Species"].cat.categories), ["funestus", "gambiae"])
+
+    def test_read_csv_report_columns(self):
+        self.write_vector_stats(filename="ReportVectorStats_test.csv")
+        df = ReportVectorStats.read(self.output_dir, columns=["NodeID", "VectorPopulation"],
+                                    parameters={"Filename_Suffix": "test"}, float_dtype=np.float32)
+        self.assertEqual(list(df.columns), ["NodeID", "VectorPopulation"])
+        self.assertEqual(df["VectorPopulation"].dtype, np.float32)
+        with self.assertRaises(ValueError):
+            ReportVectorStats.read(self.output_dir, columns=["NotAColumn"])
+
+    def test_read_csv_report_parameter_dtypes(self):
+        # the first rows look numeric or are empty, the dtypes come from the reporter's parameters
+        with open(os.path.join(self.output_dir, "ReportNodeDemographics.csv"), "w") as csv_file:
+            csv_file.write("Time,NodeID,Gender,AgeYears,IndividualProp,NumIndividuals,NumInfected\n")
+            csv_file.write("0,1,M,5,0,100,3\n")
+            csv_file.write("0,1,F,5,1,120,4\n")
+            csv_file.write("0,1,F,5,Unknown,2,0\n")
+        parameters = {"Stratify_By_Gender": 1, "IP_Key_To_Collect": "Cohort"}
+        df = ReportNodeDemographics.read(self.output_dir, parameters=parameters)
+        self.assertEqual(df["IndividualProp"].dtype.name, "category")
+        self.assertListEqual(df["IndividualProp"].tolist(), ["0", "1", "Unknown"])
+        self.assertEqual(df["Gender"].dtype.name, "category")
+        self.assertEqual(df["AgeYears"].dtype, np.float64)
+        self.assertEqual(ReportNodeDemographics.column_types({"Stratify_By_Gender": 0, "IP_Key_To_Collect": ""}),
+                         (["NodeProperty"], ["NodeID"]))
+
+        with open(os.path.join(self.output_dir, "ReportVectorMigration.csv"), "w") as csv_file:
+            csv_file.write("Time,ID,FromNodeID,ToNodeID,MigrationType,Species,Age,Gender,State,Genome\n")
+            csv_file.write("1,7,1,2,local,gambiae,3,0,STATE_ADULT,\n")
+            csv_file.write("1,8,2,1,local,gambiae,4,1,STATE_INFECTED,X-Y\n")
+        df = ReportVectorMigration.read(self.output_dir, parameters={"Include_Genome_Data": 1})
+        self.assertEqual(df["Genome"].dtype.name, "category")
+        self.assertTrue(pd.isna(df["Genome"][0]))
+        self.assertEqual(df["Genome"][1], "X-Y")
+        self.assertEqual(df["ToNodeID"].dtype, np.int64)
+
+    def test_read_csv_report_text_columns(self):
+        # text columns the reporter doesn't list are inferred instead of failing to parse as floats
+        with open(os.path.join(self.output_dir, "ReportSimpleMalariaTransmission.csv"), "w") as csv_file:
+            csv_file.write("acquireTime,acquireIndividualId,acquireInfectionIds,transmitTime,transmitIndividualId,"
+                           "transmitInfectionIds,transmitGametocyteDensities,Comment\n")
+            csv_file.write("10,5,12,3,2,7,0.25,first\n")
+            csv_file.write("12,6,13 14,4,3,8 9,0.5 0.75,second\n")
+        df = ReportSimpleMalariaTransmission.read(self.output_dir)
+        self.assertListEqual(df["acquireInfectionIds"].tolist(), ["12", "13 14"])
+        self.assertListEqual(df["transmitGametocyteDensities"].tolist(), ["0.25", "0.5 0.75"])
+        self.assertListEqual(df["Comment"].tolist(), ["first", "second"])
+        self.assertEqual(df["acquireIndividualId"].dtype, np.int64)
+        self.assertEqual(df["acquireTime"].dtype, np.float64)
+        df = ReportSimpleMalariaTransmission.read(self.output_dir, columns=["acquireTime", "acquireInfectionIds"],
+                                                  float_dtype=np.float32)
+        self.assertEqual(df["acquireTime"].dtype, np.float32)
+        self.assertListEqual(df["acquireInfectionIds"].tolist(), ["12", "13 14"])
+
+        # a parameter missing from a partial dictionary may still add its column
+        with open(os.path.join(self.output_dir, "ReportNodeDemographics.csv"), "w") as csv_file:
+            csv_file.write("Time,NodeID,Gender,IndividualProp,NumIndividuals\n")
+            csv_file.write("0,1,M,0,100\n")
+            csv_file.write("0,1,F,1,120\n")
+        df = ReportNodeDemographics.read(self.output_dir, parameters={"Stratify_By_Gender": 1})
+        self.assertEqual(df["IndividualProp"].dtype.name, "category")
+        self.assertListEqual(df["IndividualProp"].tolist(), ["0", "1"])
+
+    def test_find_report_file(self):
+        with self.assertRaises(FileNotFoundError):
+            ReportVectorStats.read(self.output_dir)
+        self.write_vector_stats(filename="ReportVectorStats_a.csv")
+        self.write_vector_stats(filename="ReportVectorStats_b.csv")
+        with self.assertRaises(FileNotFoundError):
+            ReportVectorStats.read(self.output_dir)
+        df = ReportVectorStats.read(self.output_dir, filename="ReportVectorStats_b.csv")
+        self.assertEqual(len(df), 3)
+
+    def test_read_inset_chart(self):
+        report = {"Header": {"Timesteps": 3},
+                  "Channels": {"Blood Smear Parasite Prevalence": {"Units": "", "Data": [0.1, 0.2, 0.3]},
+                               "Statistical Population": {"Units": "", "Data": [100, 101, 102]}}}
+        with open(os.path.join(self.output_dir, "ReportMalariaFiltered.json"), "w") as json_file:
+            json.dump(report, json_file)
+        df = ReportMalariaFiltered.read(self.output_dir, channels=["Statistical Population"])
+        self.assertEqual(list(df.columns), ["Statistical Population"])
+        self.assertListEqual(df["Statistical Population"].tolist(), [100.0, 101.0, 102.0])
+
+    def test_lazy_inset_chart(self):
+        report = {"Header": {"Timesteps": 3, "Report_Type": "InsetChart"},
+                  "Channels": {"Births": {"Units": "births", "Data": [1, 2, 3]},
+                               "Prévalence": {"Data": [0.5, 0.25, 0.125], "Units": ""},
+                               "Empty": {"Units": "", "Data": []}}}
+        path = os.path.join(self.output_dir, "ReportMalariaFiltered.json")
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=4, ensure_ascii=False)
+
+        header, spans = channel_index.scan_channel_spans(path, chunk_size=7)
+        self.assertEqual(header, report["Header"])
+        self.assertEqual(list(spans), ["Births", "Prévalence", "Empty"])
+        with open(path, "rb") as json_file:
+            content = json_file.read()
+        start, end, units = spans["Prévalence"]
+        self.assertEqual(json.loads(content[start:end]), [0.5, 0.25, 0.125])
+
+        lazy = ReportMalariaFiltered.open(self.output_dir)
+        self.assertTrue(os.path.isfile(path + channel_index.INDEX_SUFFIX))
+        self.assertEqual(lazy.units("Births"), "births")
+        self.assertListEqual(lazy["Prévalence"].tolist(), [0.5, 0.25, 0.125])
+        self.assertEqual(len(lazy["Empty"]), 0)
+        with self.assertRaises(KeyError):
+            lazy["Not a channel"]
+
+        # the cached index is used as long as the report doesn't change
+        with mock.patch.object(channel_index, "scan_channel_spans") as scan:
+            df = ReportMalariaFiltered.open(self.output_dir).read(["Births"])
+            scan.assert_not_called()
+        self.assertListEqual(df["Births"].tolist(), [1.0, 2.0, 3.0])
+        # the index file doesn't match the report file pattern
+        self.assertEqual(len(ReportMalariaFiltered.read(self.output_dir, channels=["Births"])), 3)
+
+        report["Channels"]["Births"]["Data"] = [10, 20, 30, 40]
+        with open(path, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file)
+        os.utime(path, ns=(0, 0))
+        self.assertListEqual(ReportMalariaFiltered.open(self.output_dir)["Births"].tolist(), [10, 20, 30, 40])
+
+    def test_read_summary_report(self):
+        report = {"Metadata": {"Reporting_Interval": 30},
+                  "Age Bins": [5, 15, 125],
+                  "DataByTime": {"PfPR_2to10": [0.1, 0.2], "Annual EIR": [1.0, 2.0]},
+                  "DataByTimeAndAgeBins": {"PfPR by Age Bin": [[0.1, 0.2, 0.3], [0.2, 0.3, 0.4]]}}
+        with open(os.path.join(self.output_dir, "MalariaSummaryReport_Annual.json"), "w") as json_file:
+            json.dump(report, json_file)
+        result = MalariaSummaryReport.read(self.output_dir, parameters={"Filename_Suffix": "Annual"})
+        self.assertEqual(result["Age Bins"], [5, 15, 125])
+        self.assertEqual(result["DataByTimeAndAgeBins"]["PfPR by Age Bin"].shape, (2, 3))
+        self.assertTrue(np.array_equal(result["DataByTime"]["Annual EIR"], [1.0, 2.0]))
+
+    def test_read_spatial_report(self):
+        data = np.arange(6, dtype=np.float32).reshape(3, 2)
+        with open(os.path.join(self.output_dir, "SpatialReportMalariaFiltered_Population.bin"), "wb") as bin_file:
+            np.array([2, 3], dtype=np.int32).tofile(bin_file)
+            np.array([7, 11], dtype=np.uint32).tofile(bin_file)
+            data.tofile(bin_file)
+        result = SpatialReportMalariaFiltered.read(self.output_dir)
+        self.assertEqual(list(result), ["Population"])
+        df = result["Population"]
+        self.assertEqual(list(df.columns), [7, 11])
+        pd.testing.assert_frame_equal(df, pd.DataFrame(data, columns=np.array([7, 11], dtype=np.uint32)),
+                                      check_names=False)
+        self.assertTrue(np.array_equal(readers.read_spatial_report(
+            os.path.join(self.output_dir, "SpatialReportMalariaFiltered_Population.bin"))[1], data))
+
+    def test_stream_summary_report(self):
+        report = {"Metadata": {"Note": "a \"quoted\" ] } string"},
+                  "DataByTime": {"PfPR_2to10": [0.1, 0.2, 1e-5], "Annual EIR": [1, 2, 3]},
+                  "DataByTimeAndAgeBins": {"PfPR by Age Bin": [[0.1, 0.2, 0.3], [0.2, 0.3, 0.4]],
+                                           "PfPR by Parasitemia and Age Bin": [[[1, 2], [3, 4]], [[5, 6], [7, 8]]],
+                                           "Empty": []}}
+        path = os.path.join(self.output_dir, "MalariaSummaryReport.json")
+        with open(path, "w") as json_file:
+            json.dump(report, json_file, indent=2)
+        for chunk_size in [1, 5, 1 << 20]:
+            result = streaming.stream_malaria_summary_report(path, chunk_size=chunk_size)
+            self.assertEqual(result["Metadata"], report["Metadata"])
+            for group in ["DataByTime", "DataByTimeAndAgeBins"]:
+                for channel, data in report[group].items():
+                    expected = np.array(data, dtype=np.float64)
+                    self.assertEqual(result[group][channel].shape, expected.shape)
+                    self.assertTrue(np.array_equal(result[group][channel], expected))
+
+        result = streaming.stream_malaria_summary_report(path, channels=["PfPR by Age Bin"], chunk_size=3,
+                                                         dtype=np.float32)
+        self.assertNotIn("DataByTime", result)
+        self.assertEqual(list(result["DataByTimeAndAgeBins"]), ["PfPR by Age Bin"])
+        self.assertEqual(result["DataByTimeAndAgeBins"]["PfPR by Age Bin"].dtype, np.float32)
+
+    def test_parse_numeric_array_errors(self):
+        with self.assertRaises(ValueError):
+            streaming.parse_numeric_array("[[1, 2], [3]]")
+        with self.assertRaises(ValueError):
+            streaming.parse_numeric_array('[1, "a"]')
+        with self.assertRaises(ValueError):
+            streaming.parse_numeric_array("[1, null]")
+        with self.assertRaises(ValueError):
+            streaming.parse_numeric_array("[[1, 2], [3,")
+
+    def test_array_parser_pieces(self):
+        # numbers split between pieces are parsed once the next piece arrives
+        expected = np.arange(3000, dtype=np.float64).reshape(1000, 3) / 7
+        text = json.dumps(expected.tolist())
+        for piece_size in [1, 13, 4096]:
+            parser = streaming._ArrayParser()
+            buffer = ""
+            for start in range(0, len(text), piece_size):
+                buffer = buffer[parser.feed(buffer):] + text[start:start + piece_size]
+                self.assertLessEqual(len(buffer), piece_size + 25)
+            parser.feed(buffer)
+            result = parser.result()
+            self.assertEqual(result.shape, expected.shape)
+            self.assertTrue(np.array_equal(result, expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,17 @@
 import unittest
 import os
 import sys
+import json
+import io
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
 file_dir = os.path.dirname(__file__)
 sys.path.append(file_dir)
 
 from emodpy_malaria.reporters.builtin import *
+from emodpy_malaria.reporters import builtin
 import schema_path_file
 
 empty_string = ""
@@ -903,6 +909,124 @@ class TestMalariaReport(unittest.TestCase):
         self.assertEqual(self.p_dict['Sampling_Period'], test_int)
     # endregion
 
+    # region add_reports
+    def test_add_reports_list(self):
+        spec = [{"report": "ReportVectorStats", "stratify_by_species": True},
+                {"report": "add_malaria_summary_report", "age_bins": test_list, "filename_suffix": test_string},
+                {"report": "drug_status_report", "start_day": test_start_day}]
+        reporters = add_reports(None, schema_path_file, spec)
+        self.assertEqual([reporter.class_name for reporter in reporters],
+                         ["ReportVectorStats", "MalariaSummaryReport", "ReportDrugStatus"])
+        self.assertEqual(reporters[0].parameters['Stratify_By_Species'], 1)
+        self.assertEqual(reporters[1].parameters['Age_Bins'], test_list)
+        self.assertEqual(reporters[1].parameters['Filename_Suffix'], test_string)
+        self.assertEqual(reporters[2].parameters['Start_Day'], test_start_day)
+        self.assertEqual(reporters[2].parameters['End_Day'], default_end_day)
+
+    def test_add_reports_dict_and_file(self):
+        spec = {"ReportMalariaFiltered": [{"filename_suffix": test_string1}, {"filename_suffix": test_string2}],
+                "ReportSimulationStats": None}
+        reporters = add_reports(None, schema_path_file, spec)
+        self.assertEqual([reporter.parameters.get('Filename_Suffix') for reporter in reporters[:2]],
+                         [test_string1, test_string2])
+        self.assertEqual(reporters[2].class_name, "ReportSimulationStats")
+
+        spec_file = os.path.join(file_dir, "test_add_reports_spec.json")
+        with open(spec_file, "w") as json_file:
+            json.dump({"reports": [{"report": "ReportEventCounter", "event_trigger_list": ["Births"]}]}, json_file)
+        try:
+            reporters = add_reports(None, schema_path_file, spec_file)
+        finally:
+            os.remove(spec_file)
+        self.assertEqual(reporters[0].parameters['Event_Trigger_List'], ["Births"])
+
+    def test_add_reports_invalid(self):
+        spec = [{"report": "NotAReport"},
+                {"report": "ReportVectorStats", "not_a_parameter": 1},
+                {"report": "ReportDrugStatus", "start_day": 1}]
+        with self.assertRaises(ValueError) as context:
+            add_reports(None, schema_path_file, spec)
+        message = str(context.exception)
+        self.assertIn("NotAReport", message)
+        self.assertIn("not_a_parameter", message)
+        self.assertNotIn("entry 2", message)
+
+    def test_add_reports_invalid_values(self):
+        spec = [{"report": "MalariaSummaryReport", "reporting_interval": -5},
+                {"report": "ReportVectorGenetics", "species": "gambiae", "stratify_by": "NOT_A_STRATIFICATION"},
+                {"report": "ReportDrugStatus", "start_day": 1}]
+        task = self.make_task()
+        with self.assertRaises(ValueError) as context:
+            add_reports(task, schema_path_file, spec)
+        message = str(context.exception)
+        self.assertIn("entry 0 (MalariaSummaryReport)", message)
+        self.assertIn("Reporting_Interval", message)
+        self.assertIn("NOT_A_STRATIFICATION", message)
+        self.assertNotIn("entry 2", message)
+        task.reporters.add_reporter.assert_not_called()
+
+    def test_add_reports_task(self):
+        spec = [{"report": "ReportVectorStats"},
+                {"report": "ReportVectorMigration", "start_day": test_start_day},
+                {"report": "ReportMalariaFiltered", "filename_suffix": test_string}]
+        task = self.make_task()
+        with mock.patch.object(builtin, "add_visualizations") as add_visualizations, \
+                mock.patch.object(builtin, "check_vectors") as check_vectors:
+            self.assertIsNone(add_reports(task, schema_path_file, spec))
+        # the add functions are called with the task and run their own checks
+        self.assertEqual(add_visualizations.call_args_list, [mock.call(task)] * 3)
+        self.assertEqual([call for call in check_vectors.call_args_list if call.args[0] is task], [mock.call(task)] * 2)
+        reporters = [call.args[0] for call in task.reporters.add_reporter.call_args_list]
+        self.assertEqual([reporter.class_name for reporter in reporters],
+                         ["ReportVectorStats", "ReportVectorMigration", "ReportMalariaFiltered"])
+        self.assertEqual(reporters[0].parameters['Species_List'], ["gambiae", "funestus"])
+
+        task = self.make_task(malaria_model="MALARIA_MECHANISTIC_MODEL")
+        with self.assertRaises(ValueError) as context:
+            add_reports(task, schema_path_file, [{"report": "ReportFpgOutputForObservationalModel"}])
+        self.assertIn("MALARIA_MECHANISTIC_MODEL_WITH_PARASITE_GENETICS", str(context.exception))
+
+    @staticmethod
+    def make_task(malaria_model="MALARIA_MECHANISTIC_MODEL_WITH_PARASITE_GENETICS"):
+        parameters = SimpleNamespace(Vector_Species_Params=[{"Name": "gambiae"}, {"Name": "funestus"}],
+                                     Malaria_Model=malaria_model)
+        return SimpleNamespace(config=SimpleNamespace(parameters=parameters), reporters=mock.Mock())
+    # endregion
+
+    # region visualizations
+    def test_add_visualizations(self):
+        vis = {"diseases": {"generic": ["AllInsets"], "malaria": ["MalariaSummaryReport"]},
+               "sites": {"AllInsets": {"url": "https://example.org/insets"},
+                         "MalariaSummaryReport": {"url": "https://example.org/summary"}}}
+
+        class Assets(list):
+            def add_asset(self, filename, fail_on_duplicate=True):
+                self.append(SimpleNamespace(filename=filename))
+
+        builtin._visualization_pointers.cache_clear()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch("urllib.request.urlopen", return_value=io.BytesIO(json.dumps(vis).encode())) as urlopen:
+            os.chdir(tmp_dir)
+            try:
+                task = SimpleNamespace(common_assets=Assets([SimpleNamespace(filename="AllInsets.html")]))
+                add_visualizations(task)
+                add_visualizations(task)
+                other_task = SimpleNamespace(common_assets=Assets())
+                add_visualizations(other_task)
+                with open("MalariaSummaryReport.html") as pointer_file:
+                    self.assertEqual(pointer_file.read(), "https://example.org/summary")
+            finally:
+                os.chdir(cwd)
+                builtin._visualization_pointers.cache_clear()
+        # the sites are downloaded once, pointer files already in the assets aren't added again
+        urlopen.assert_called_once()
+        self.assertEqual([asset.filename for asset in task.common_assets], ["AllInsets.html",
+                                                                            "MalariaSummaryReport.html"])
+        self.assertEqual([asset.filename for asset in other_task.common_assets], ["AllInsets.html",
+                                                                                  "MalariaSummaryReport.html"])
+    # endregion
+
 
 if __name__ == '__main__':
     unittest.main()
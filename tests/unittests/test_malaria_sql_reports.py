@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import pandas as pd
+
+from emodpy_malaria.reporters.builtin import SqlReportMalaria, SqlReportMalariaGenetics
+
+
+def write_database(filename, genomes=False):
+    connection = sqlite3.connect(filename)
+    genome_column = ", GenomeID INT" if genomes else ""
+    connection.executescript(f"""
+        CREATE TABLE Humans (HumanID INT PRIMARY KEY NOT NULL, SimTimeAdded REAL, HomeNodeID INT, IsFemale INT,
+                             InitialAgeDays REAL);
+        CREATE TABLE Infections (InfectionID INT PRIMARY KEY NOT NULL, HumanID INT, SimTimeCreated REAL
+                                 {genome_column});
+        CREATE TABLE Health (SimTime REAL, HumanID INT, NodeID INT, AgeDays REAL, HasClinicalSymptoms INT);
+        CREATE TABLE InfectionData (SimTime REAL, InfectionID INT, AsexualParasites REAL);
+    """)
+    # human 1 is 2 years old, human 2 is 20 years old at time 0
+    connection.executemany("INSERT INTO Humans VALUES (?, ?, ?, ?, ?)",
+                           [(1, 0, 1, 0, 2 * 365), (2, 0, 1, 1, 20 * 365)])
+    for time in range(0, 60, 10):
+        connection.executemany("INSERT INTO Health VALUES (?, ?, ?, ?, ?)",
+                               [(time, 1, 1, 2 * 365 + time, 0), (time, 2, 1, 20 * 365 + time, 0)])
+    infections = [(1, 1, 5), (2, 1, 15), (3, 2, 35)]
+    if genomes:
+        infections = [infection + (genome,) for infection, genome in zip(infections, [7, 7, 8])]
+    connection.executemany(f"INSERT INTO Infections VALUES ({', '.join('?' * len(infections[0]))})", infections)
+    # infections 1 and 2 overlap from time 20 to 30
+    rows = [(time, 1, 100.0) for time in [10, 20, 30]] + [(time, 2, 50.0) for time in [20, 30, 40]] + \
+           [(time, 3, 10.0) for time in [40, 50]]
+    connection.executemany("INSERT INTO InfectionData VALUES (?, ?, ?)", rows)
+    connection.commit()
+    connection.close()
+
+
+class TestSqlReports(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = self.tmp_dir.name
+        write_database(os.path.join(self.output_dir, "SqlReportMalaria.db"))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_read_only_and_indexes(self):
+        report_file = os.path.join(self.output_dir, "SqlReportMalaria.db")
+        with open(report_file, "rb") as db_file:
+            report = db_file.read()
+        with SqlReportMalaria.read(self.output_dir) as db:
+            self.assertIn("Health", db.tables)
+            with self.assertRaises(sqlite3.OperationalError):
+                db.connection.execute("DELETE FROM Humans")
+            created = db.create_indexes()
+            self.assertIn("idx_Health_SimTime", created)
+            self.assertIn("idx_InfectionData_InfectionID", created)
+            self.assertNotIn("idx_Humans_HumanID", created)     # primary key
+            self.assertEqual(db.create_indexes(), [])
+            plan = " ".join(str(row) for row in
+                            db.connection.execute("EXPLAIN QUERY PLAN SELECT * FROM Health WHERE SimTime = 10"))
+            self.assertIn("idx_Health_SimTime", plan)
+            with self.assertRaises(sqlite3.OperationalError):
+                db.connection.execute("DELETE FROM Humans")
+            with self.assertRaises(ValueError):
+                db.create_indexes(index_file=report_file)
+
+        # the indexes are in the copy, the report's database is unchanged
+        with open(report_file, "rb") as db_file:
+            self.assertEqual(db_file.read(), report)
+        index_file = os.path.join(self.output_dir, "SqlReportMalaria_indexed.db")
+        with SqlReportMalaria.read(self.output_dir) as db:
+            self.assertNotIn("idx_Health_SimTime", db.indexes())
+            self.assertEqual(db.create_indexes(), [])               # the copy is reused
+            self.assertEqual(db.index_file, index_file)
+            self.assertIn("idx_Health_SimTime", db.indexes())
+
+    def test_identifiers(self):
+        connection = sqlite3.connect(os.path.join(self.output_dir, "SqlReportMalaria.db"))
+        connection.execute('CREATE TABLE "Odd ""Name" (SimTime REAL, "Node ID" INT)')
+        connection.commit()
+        connection.close()
+        with SqlReportMalaria.read(self.output_dir) as db:
+            self.assertEqual(db.columns('Odd "Name'), ["SimTime", "Node ID"])
+            with self.assertRaises(ValueError):
+                db.columns("Health') --")
+            created = db.create_indexes(columns=["SimTime", "Node ID"],
+                                        index_file=os.path.join(self.output_dir, "copy.db"))
+            self.assertIn('idx_Odd "Name_SimTime', created)
+            self.assertIn('idx_Odd "Name_Node ID', created)
+
+    def test_chunked_query(self):
+        with SqlReportMalaria.read(self.output_dir) as db:
+            chunks = list(db.query("SELECT * FROM Health WHERE HumanID = ?", (1,), chunk_size=4))
+            self.assertEqual([len(chunk) for chunk in chunks], [4, 2])
+            self.assertEqual(list(chunks[0].columns), db.columns("Health"))
+            df = pd.concat(db.infections_by_person([1], start_time=20))
+            self.assertEqual(df["SimTime"].tolist(), [20, 20, 30, 30, 40])
+
+    def test_incidence_by_age_and_time(self):
+        with SqlReportMalaria.read(self.output_dir) as db:
+            df = db.incidence_by_age_and_time(age_bins_years=[0, 5, 125], time_bin_days=30)
+        df = df.set_index(["time_bin", df["age_bin"].astype(str)])
+        self.assertEqual(df.loc[(0, "[0, 5)"), "infections"], 2)
+        self.assertEqual(df.loc[(0, "[0, 5)"), "population"], 1.0)
+        self.assertEqual(df.loc[(30, "[5, 125)"), "infections"], 1)
+        self.assertEqual(df.loc[(30, "[0, 5)"), "incidence"], 0.0)
+
+    def test_complexity_of_infection(self):
+        with SqlReportMalaria.read(self.output_dir) as db:
+            coi = db.complexity_of_infection()
+            mean = db.mean_complexity_of_infection(start_time=20, end_time=40)
+        self.assertEqual(coi.set_index(["SimTime", "HumanID"]).loc[(20, 1), "COI"], 2)
+        self.assertEqual(mean["mean_COI"].tolist(), [2.0, 2.0, 1.0])
+
+        write_database(os.path.join(self.output_dir, "SqlReportMalariaGenetics.db"), genomes=True)
+        with SqlReportMalariaGenetics.read(self.output_dir) as db:
+            coi = db.complexity_of_infection()
+        self.assertEqual(coi.set_index(["SimTime", "HumanID"]).loc[(20, 1), "COI"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()